@@ -0,0 +1,199 @@
+import glob
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Columnar store for step outputs: every intermediate load profile and results table is also written as Parquet
+# into one Hive-partitioned dataset per base directory:
+#     {base_dir}/artifacts/scenario=.../housing_type=.../county=.../step=.../part-0.parquet
+# Each partition holds the latest output of a step (no timestamped file names to parse), timestamps are stored as
+# int64 seconds since the epoch, and statewide queries only open the partitions that match their filters.
+
+ARTIFACTS_FOLDER_NAME = "artifacts"
+PARTITION_COLUMNS = ["scenario", "housing_type", "county", "step"]
+TIMESTAMP_COLUMN = "timestamp"
+RESULTS_INDEX_COLUMN = "row" # index of the results tables, e.g. "baseline" or "baseline.solarstorage"
+COMPRESSION = "zstd"
+
+ARTIFACT_STORE = {
+    "enabled": True,
+}
+
+def get_artifacts_dir(base_dir):
+    return os.path.join(base_dir, ARTIFACTS_FOLDER_NAME)
+
+def get_partition_dir(base_dir, step, scenario, housing_type, county):
+    return os.path.join(
+        get_artifacts_dir(base_dir),
+        f"scenario={scenario}",
+        f"housing_type={housing_type}",
+        f"county={county}",
+        f"step={step}",
+    )
+
+def to_artifact_timestamps(timestamps):
+    """
+    Shared int64 timestamp representation: seconds since 1970-01-01 (naive local time, as in ResStock and SAM files).
+    """
+    return pd.to_datetime(timestamps).astype("datetime64[s]").astype("int64")
+
+def from_artifact_timestamps(seconds):
+    return pd.to_datetime(seconds, unit="s")
+
+def write_artifact(df, base_dir, step, scenario, housing_type, county, index_label=None):
+    """
+    Replaces a step's output partition with df. With index_label, the index is stored as that column.
+    Does nothing when the artifact store is disabled.
+    """
+    if not ARTIFACT_STORE["enabled"]:
+        return None
+
+    table = df.reset_index(names=index_label) if index_label else df.reset_index(drop=True)
+    if TIMESTAMP_COLUMN in table.columns:
+        table[TIMESTAMP_COLUMN] = to_artifact_timestamps(table[TIMESTAMP_COLUMN])
+
+    partition_dir = get_partition_dir(base_dir, step, scenario, housing_type, county)
+    os.makedirs(partition_dir, exist_ok=True)
+
+    # Write next to the partition and swap it in, so readers never see a half-written file
+    output_file = os.path.join(partition_dir, "part-0.parquet")
+    temporary_file = f"{output_file}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pandas(table, preserve_index=False), temporary_file, compression=COMPRESSION)
+    os.replace(temporary_file, output_file)
+
+    return output_file
+
+def write_results_artifact(df, base_dir, step, scenario, housing_type, county):
+    """
+    Stores a results table (one row per scenario / scenario.solarstorage, one column per tariff).
+    """
+    return write_artifact(df.rename_axis(None), base_dir, step, scenario, housing_type, county, index_label=RESULTS_INDEX_COLUMN)
+
+def read_results_artifact(base_dir, step, scenario, housing_type, county, newer_than=None):
+    """
+    Reads a results table back with its rows as the index, or None when it is not in the store or is older than the
+    file newer_than (e.g. the latest CSV of the same results, written by a run without the store).
+    """
+    artifact_file = os.path.join(get_partition_dir(base_dir, step, scenario, housing_type, county), "part-0.parquet")
+    if newer_than is not None and os.path.exists(artifact_file) and os.path.getmtime(newer_than) > os.path.getmtime(artifact_file):
+        return None
+
+    df = read_artifact(base_dir, step, scenario, housing_type, county)
+    if df is None:
+        return None
+
+    return df.set_index(RESULTS_INDEX_COLUMN).rename_axis("scenario")
+
+def get_partition_paths(base_dir, step, filters):
+    """
+    Partition pruning: only the files of partitions whose directory values match the filters.
+    """
+    patterns = [os.path.join(get_artifacts_dir(base_dir), "scenario=*", "housing_type=*", "county=*", f"step={step}", "*.parquet")]
+    for column in ["scenario", "housing_type", "county"]:
+        values = filters.get(column)
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else list(values)
+        patterns = [pattern.replace(f"{column}=*", f"{column}={value}", 1) for pattern in patterns for value in values]
+
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+def read_artifacts(base_dir, step, columns=None, filter=None, **partition_filters):
+    """
+    Reads one step's outputs across partitions into a single DataFrame with scenario, housing_type and county columns.
+    Partition filters (scenario=, housing_type=, county=) take a value or a list of values and prune whole partitions;
+    filter is a pyarrow expression pushed down to the Parquet row groups, e.g. ds.field("row") == "baseline".
+    """
+    paths = get_partition_paths(base_dir, step, partition_filters)
+    if not paths:
+        return pd.DataFrame(columns=[*PARTITION_COLUMNS[:-1], *(columns or [])])
+
+    dataset = ds.dataset(
+        paths,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS]), flavor="hive"),
+        partition_base_dir=get_artifacts_dir(base_dir),
+    )
+    if columns is not None:
+        columns = [*PARTITION_COLUMNS[:-1], *[column for column in columns if column not in PARTITION_COLUMNS]]
+
+    df = dataset.to_table(columns=columns, filter=filter).to_pandas()
+    if TIMESTAMP_COLUMN in df.columns:
+        df[TIMESTAMP_COLUMN] = from_artifact_timestamps(df[TIMESTAMP_COLUMN])
+
+    return df
+
+def read_artifact(base_dir, step, scenario, housing_type, county, columns=None):
+    """
+    Reads a single step output, or returns None when it was never written to the store.
+    """
+    output_file = os.path.join(get_partition_dir(base_dir, step, scenario, housing_type, county), "part-0.parquet")
+    if not os.path.exists(output_file):
+        return None
+
+    df = pq.read_table(output_file, columns=columns).to_pandas()
+    if TIMESTAMP_COLUMN in df.columns:
+        df[TIMESTAMP_COLUMN] = from_artifact_timestamps(df[TIMESTAMP_COLUMN])
+
+    return df
+
+def get_artifact_location(output_file):
+    """
+    (base_dir, step, scenario, housing_type, county) of an intermediate file in the pipeline's usual
+    {base_dir}/{scenario}/{housing_type}/{county}/{step}_{county}.csv layout, the step being the file name without its
+    county (and scenario) suffix. None for paths too short to follow the layout.
+    """
+    parts = os.path.normpath(output_file).split(os.sep)
+    if len(parts) < 4:
+        return None
+
+    *base_parts, scenario, housing_type, county, file_name = parts
+    step = os.path.splitext(file_name)[0].removesuffix(f"_{county}").removesuffix(f"_{scenario}")
+
+    return os.sep.join(base_parts) or os.curdir, step, scenario, housing_type, county
+
+def get_artifact_file_for_path(output_file):
+    location = get_artifact_location(output_file)
+    if location is None:
+        return None
+
+    return os.path.join(get_partition_dir(*location), "part-0.parquet")
+
+def write_artifact_for_path(df, output_file, index=True, index_label=None):
+    """
+    Stores an intermediate file written to the pipeline's usual layout (see get_artifact_location).
+    Files outside of it are not stored.
+    """
+    location = get_artifact_location(output_file)
+    if location is None:
+        return None
+
+    if index and not index_label:
+        index_label = df.index.name or "Unnamed: 0" # the column name read_csv gives an unnamed index
+
+    return write_artifact(df, *location, index_label=index_label if index else None)
+
+def get_fresh_artifact_file(output_file):
+    """
+    The artifact stored for an intermediate file, when there is one at least as recent as the file itself
+    (a file rewritten without the store, e.g. by hand, takes precedence). None otherwise.
+    """
+    artifact_file = get_artifact_file_for_path(output_file)
+    if artifact_file is None or not os.path.exists(artifact_file):
+        return None
+    if os.path.exists(output_file) and os.path.getmtime(output_file) > os.path.getmtime(artifact_file):
+        return None
+
+    return artifact_file
+
+def get_artifact_columns(artifact_file):
+    return pq.read_schema(artifact_file).names
+
+def read_artifact_file(artifact_file, columns=None):
+    df = pq.read_table(artifact_file, columns=columns).to_pandas()
+    if TIMESTAMP_COLUMN in df.columns:
+        df[TIMESTAMP_COLUMN] = from_artifact_timestamps(df[TIMESTAMP_COLUMN])
+
+    return df
@@ -0,0 +1,139 @@
+import os
+import shutil
+import time
+
+from helpers import log
+from download_helpers import download_objects, is_complete, load_manifest, update_manifest
+
+# Shared local store of building timeseries files. Objects of a ResStock release never change, so each one is
+# downloaded once into a cache laid out like the bucket, {cache dir}/{bucket}/{release prefix}/upgrade=.../{bldg_id}-{upgrade}.parquet,
+# whatever the scenario, housing type, county or output root that needs it. County buildings directories only hold
+# symlinks into the cache, along with their own download manifest, so rerunning with a new output root or housing type
+# only creates links. The cache is kept under a disk quota by evicting the least recently used files; files used
+# within the eviction grace period are never evicted, since counties running in parallel may have just linked them.
+
+BUILDING_CACHE = {
+    "enabled": True,
+    "dir": os.path.join("data", ".cache", "buildings"),
+    "quota_bytes": 50 * 1024 ** 3,
+    "eviction_grace_seconds": 12 * 60 * 60, # longer than a statewide run
+}
+
+def get_cache_dir(bucket_name, s3_key):
+    """
+    Cache directory of an object, mirroring its bucket and key prefix.
+    """
+    return os.path.join(BUILDING_CACHE["dir"], bucket_name, *os.path.dirname(s3_key).split("/"))
+
+def link_file(target, link_path):
+    """
+    Points link_path at target, replacing whatever was there. Falls back to a hard link, then a copy,
+    where symlinks are not available.
+    """
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+
+    try:
+        os.symlink(os.path.abspath(target), link_path)
+    except OSError:
+        try:
+            os.link(target, link_path)
+        except OSError:
+            shutil.copy2(target, link_path)
+
+def list_cached_files(cache_dir=None):
+    """
+    (last used, size, path) of every cached Parquet file, least recently used first.
+    """
+    cached_files = []
+    for directory, _, file_names in os.walk(cache_dir or BUILDING_CACHE["dir"]):
+        for file_name in file_names:
+            if file_name.endswith(".parquet"):
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue # evicted by another county's process
+                cached_files.append((stat.st_mtime, stat.st_size, path))
+
+    return sorted(cached_files)
+
+def evict_building_cache(quota_bytes=None, keep=(), grace_seconds=None):
+    """
+    Deletes the least recently used cached files until the cache fits in quota_bytes, never deleting the files in keep
+    nor the ones used within the last grace_seconds (the cache may then stay over its quota for a while).
+    County links to evicted files dangle and are fetched again the next time their county is pulled.
+    Returns the deleted paths.
+    """
+    quota_bytes = BUILDING_CACHE["quota_bytes"] if quota_bytes is None else quota_bytes
+    grace_seconds = BUILDING_CACHE["eviction_grace_seconds"] if grace_seconds is None else grace_seconds
+    keep = {os.path.abspath(path) for path in keep}
+    used_since = time.time() - grace_seconds
+
+    cached_files = list_cached_files()
+    cache_size = sum(size for _, size, _ in cached_files)
+
+    deleted = []
+    for last_used, size, path in cached_files:
+        if cache_size <= quota_bytes or last_used >= used_since:
+            break # least recently used first, so every remaining file was used within the grace period
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue # evicted by another county's process
+        cache_size -= size
+        deleted.append(path)
+
+    if deleted:
+        log(at="evict_building_cache", deleted=len(deleted), cache_bytes=cache_size, quota_bytes=quota_bytes)
+
+    return deleted
+
+def fetch_buildings(s3, bucket_name, s3_keys, output_dir, columns=None, store=None):
+    """
+    Makes every object available in output_dir, downloading only what neither output_dir nor the cache holds yet.
+    Returns the download summary of the objects that were not already in output_dir.
+    """
+    if not BUILDING_CACHE["enabled"]:
+        return download_objects(s3, bucket_name, s3_keys, output_dir, columns=columns, store=store)
+
+    os.makedirs(output_dir, exist_ok=True)
+    county_manifest = load_manifest(output_dir)
+    missing_keys = [
+        s3_key for s3_key in s3_keys
+        if not is_complete(os.path.join(output_dir, os.path.basename(s3_key)), county_manifest.get(os.path.basename(s3_key)), columns)
+    ]
+
+    keys_by_cache_dir = {}
+    for s3_key in missing_keys:
+        keys_by_cache_dir.setdefault(get_cache_dir(bucket_name, s3_key), []).append(s3_key)
+
+    summary = {"downloaded": [], "skipped": [], "failed": {}}
+    linked_entries, referenced = {}, []
+
+    for cache_dir, keys in keys_by_cache_dir.items():
+        cache_summary = download_objects(s3, bucket_name, keys, cache_dir, columns=columns, store=store)
+        summary["downloaded"] += cache_summary["downloaded"]
+        summary["skipped"] += cache_summary["skipped"]
+        summary["failed"].update(cache_summary["failed"])
+
+        cache_manifest = load_manifest(cache_dir)
+        for s3_key in keys:
+            file_name = os.path.basename(s3_key)
+            cached_file = os.path.join(cache_dir, file_name)
+            if not is_complete(cached_file, cache_manifest.get(file_name), columns):
+                continue
+
+            link_file(cached_file, os.path.join(output_dir, file_name))
+            os.utime(cached_file) # last used, for eviction
+            linked_entries[file_name] = cache_manifest[file_name]
+            referenced.append(cached_file)
+
+    update_manifest(output_dir, linked_entries)
+    evict_building_cache(keep=referenced)
+
+    log(at="fetch_buildings", output_dir=output_dir, linked=len(linked_entries), downloaded=len(summary["downloaded"]), failed=len(summary["failed"]))
+
+    return summary
@@ -0,0 +1,116 @@
+import numpy as np
+from functools import lru_cache
+
+# One precomputed hourly calendar for the analysis year, shared by electricity and gas billing.
+# Every tariff lookup becomes a vectorized mask over these arrays.
+
+ANALYSIS_YEAR = 2018 # Consistent with NREL inputs (ResStock AMY2018) and the SAM weather year
+HOURS_PER_YEAR = 8760 # ResStock and SAM profiles are always 8760 hours, even in leap years
+HOURS_PER_DAY = 24
+
+# Electricity summer season per utility, all other months are winter
+# https://www.pge.com/tariffs/assets/pdf/tariffbook/ELEC_SCHEDS_E-TOU-C.pdf: June 1 - September 30
+# https://www.sce.com/residential/rates/Time-Of-Use-Residential-Rate-Plans: June 1 - September 30
+# https://www.sdge.com/whenmatters: June 1 - October 31
+ELECTRICITY_SUMMER_MONTHS = {
+    "PG&E": [6, 7, 8, 9],
+    "SCE": [6, 7, 8, 9],
+    "SDG&E": [6, 7, 8, 9, 10],
+}
+
+# Gas baseline seasons by month, matches step10's categorize_season
+GAS_SEASONS_BY_MONTH = {
+    1: "winter_onpeak",
+    2: "winter_offpeak",
+    3: "winter_offpeak",
+    4: "summer",
+    5: "summer",
+    6: "summer",
+    7: "summer",
+    8: "summer",
+    9: "summer",
+    10: "summer",
+    11: "winter_offpeak",
+    12: "winter_onpeak",
+}
+
+def get_nerc_holidays(year):
+    """
+    NERC off-peak holidays: New Year's Day, Memorial Day, Independence Day, Labor Day, Thanksgiving and Christmas.
+    Holidays falling on a Sunday are observed the following Monday. Returns datetime64[D] dates.
+    """
+    fixed_date_holidays = np.array([f"{year}-01-01", f"{year}-07-04", f"{year}-12-25"], dtype="datetime64[D]")
+    # Observed the following Monday when on a Sunday
+    is_sunday = np.is_busday(fixed_date_holidays, weekmask="Sun")
+    fixed_date_holidays = fixed_date_holidays + is_sunday.astype(int)
+
+    memorial_day = np.busday_offset(f"{year}-06-01", -1, roll="forward", weekmask="Mon") # last Monday in May
+    labor_day = np.busday_offset(f"{year}-09-01", 0, roll="forward", weekmask="Mon") # first Monday in September
+    thanksgiving = np.busday_offset(f"{year}-11-01", 3, roll="forward", weekmask="Thu") # fourth Thursday in November
+
+    return np.sort(np.concatenate([fixed_date_holidays, [memorial_day, labor_day, thanksgiving]]))
+
+def get_gas_seasons(months):
+    """
+    Vectorized gas season lookup for an array of month numbers (1-12).
+    """
+    months = np.asarray(months)
+    if months.size and ((months < 1) | (months > 12)).any():
+        raise ValueError(f"Unexpected month provided: {months[(months < 1) | (months > 12)][0]}")
+
+    gas_seasons = np.array([None] + [GAS_SEASONS_BY_MONTH[month] for month in range(1, 13)])
+    return gas_seasons[months]
+
+@lru_cache(maxsize=None)
+def get_calendar_index(year=ANALYSIS_YEAR):
+    """
+    Builds the hourly calendar for the analysis year as a dict of read-only NumPy arrays (one entry per hour):
+        timestamp, month, day_of_year, hour, day_of_week (0=Monday), is_weekend, is_holiday,
+        is_offpeak_day (weekend or holiday, billed at weekend TOU prices), electricity_season (per utility),
+        gas_season, billing_cycle (0-11, calendar-month billing cycles)
+    """
+    timestamps = np.datetime64(f"{year}-01-01T00", "h") + np.arange(HOURS_PER_YEAR).astype("timedelta64[h]")
+    days = timestamps.astype("datetime64[D]")
+
+    month = timestamps.astype("datetime64[M]").astype(int) % 12 + 1
+    day_of_year = (days - np.datetime64(f"{year}-01-01", "D")).astype(int)
+    hour = np.arange(HOURS_PER_YEAR) % HOURS_PER_DAY
+    day_of_week = (days.astype(int) + 3) % 7 # 1970-01-01 was a Thursday
+    is_weekend = day_of_week >= 5
+    is_holiday = np.isin(days, get_nerc_holidays(year))
+
+    calendar_index = {
+        "timestamp": timestamps,
+        "month": month,
+        "day_of_year": day_of_year,
+        "hour": hour,
+        "day_of_week": day_of_week,
+        "is_weekend": is_weekend,
+        "is_holiday": is_holiday,
+        "is_offpeak_day": is_weekend | is_holiday,
+        "electricity_season": {
+            utility: np.where(np.isin(month, summer_months), "summer", "winter")
+            for utility, summer_months in ELECTRICITY_SUMMER_MONTHS.items()
+        },
+        "gas_season": get_gas_seasons(month),
+        "billing_cycle": month - 1,
+    }
+
+    for value in [*calendar_index.values(), *calendar_index["electricity_season"].values()]:
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+    return calendar_index
+
+@lru_cache(maxsize=None)
+def get_billing_cycle_matrix(year=ANALYSIS_YEAR):
+    """
+    Read-only (8760 x billing cycles) indicator matrix, so that hourly values can be summed per cycle with a matrix product.
+    """
+    billing_cycle = get_calendar_index(year)["billing_cycle"]
+
+    cycle_matrix = np.zeros((HOURS_PER_YEAR, billing_cycle.max() + 1))
+    cycle_matrix[np.arange(HOURS_PER_YEAR), billing_cycle] = 1.0
+    cycle_matrix.flags.writeable = False
+
+    return cycle_matrix
@@ -32,6 +32,132 @@ LIFETIMES = {
     "water_heater": 15, # https://www.oliverheatcool.com/about/blog/news-for-homeowners/the-average-lifespan-of-water-heaters/
 }
 
+CAPITAL_COSTS = {
+    "solar": {
+        # Back-calculated from PG&E's cost estimator website: https://pge.wattplan.com/PV/Wizard/?sector=residential&
+        # https://www.energysage.com/local-data/solar-panel-cost/ca/
+        "dollars_per_watt": 2.8,          # $/W for panels https://www.tesla.com/learn/solar-panel-cost-breakdown
+        "installation_labor": 0,         # 7% extra cost for labor
+        "design_eng_overhead_percent": 0 # 28% extra cost for design/engineering
+    },
+    "storage": {
+        # Other papers suggest: 1200–$1600 per kilowatt-hour which would = $16320 - $21600 https://www.mdpi.com/2071-1050/16/23/10320#:~:text=residential%20solar%20and%20BESS%2C%20the,6%2FWh%20in%20Texas%20%28Figure%203d
+        # https://energylibrary.tesla.com/docs/Public/EnergyStorage/Powerwall/3/Datasheet/en-us/Powerwall-3-Datasheet.pdf
+        # https://www.solarreviews.com/blog/is-the-tesla-powerwall-the-best-solar-battery-available?utm_source=chatgpt.com
+        # https://www.selfgenca.com/home/program_metrics/
+        "powerwall_13.5kwh": 16853          # $16853 Cost for one Tesla Powerwall 3 before incentives. https://www.tesla.com/powerwall/design/overview
+    },
+    "heat_pump": {
+        # Rewiring america: $19,000 https://www.rewiringamerica.org/research/home-electrification-cost-estimates
+        # "average": 19000, # https://www.nrel.gov/docs/fy24osti/84775.pdf#:~:text=dwelling%20units,9%2C000%2C%20%2420%2C000%2C%20and%20%2424%2C000%20for
+        # https://incentives.switchison.org/residents/incentives?state=CA&field_zipcode=90001&_gl=1*1ck7fcj*_gcl_au*OTAxNTQyNjA3LjE3NDQ1NjYxNzg.*_ga*MTEwMTk5ODQ0LjE3NDQ1NjYxNzg.*_ga_8NM1W0PLNN*MTc0NDU2NjE3OC4xLjEuMTc0NDU2NjIwNC4zNC4wLjA.
+        # E3 cites single family residential heat pump cost to be $19,000 https://www.ethree.com/wp-content/uploads/2023/12/E3_Benefit-Cost-Analysis-of-Targeted-Electrification-and-Gas-Decommissioning-in-California.pdf#:~:text=%2419k%20%2415k%20%24154k%20The%20significant,commercial%20customers%20and%20therefore%20see
+        "average": 19000,
+    },
+    "induction_stove": {
+        # PG&E appliance guide also says $2000 https://guide.pge.com/browse/induction
+        "average": 2000 # https://www.sce.com/factsheet/InductionCookingFactSheet
+    },
+    "water_heater": { # 55 gal
+        "average": 2637,
+    },
+    "ev_charging": {
+        "tesla_wall_connector": 1150,
+        "universal_wall_connector": 1350,
+    }
+}
+
+# Solar + storage costs of step 12's system payback table: Tesla's cost breakdown with its labor and design overhead,
+# and a Powerwall priced after incentives, so no further incentives apply
+SYSTEM_PAYBACK_COSTS = {
+    "solar": {
+        "dollars_per_watt": 2.83, # https://www.tesla.com/learn/solar-panel-cost-breakdown
+        "installation_labor": 0.07, # Installation labor makes up around 7% of your total expenses
+        "design_eng_overhead_percent": 0.28, # The design, engineering, project management, processing of approvals, and other overhead account for the remaining 28% of costs.
+    },
+    "storage": {
+        "powerwall_13.5kwh": 10748, # Dollars for one powerwall, discount for 2 or more. After $6106 of incentives https://www.tesla.com/powerwall/design/overview
+    },
+}
+
+INCENTIVES = {
+    "federal_tax_credit_2023_2032": 0.3, # 30% credit https://www.irs.gov/credits-deductions/residential-clean-energy-credit
+    # Federal tax incentives will decline in later years
+    "federal_tax_credit_2033": 0.26,
+    "federal_tax_credit_2034": 0.22,
+    "federal_tax_credit_2035": 0,
+    "PGE_SCE_SDGE_General_SGIP_Rebate": 2025, #  General Market SGIP rebate of
+        # approximately $150/kilowatt-hour https://www.cpuc.ca.gov/-/media/cpuc-website/files/uploadedfiles/cpucwebsite/content/news_room/newsupdates/2020/sgip-residential-web-120420.pdf
+    "storage": {
+        # "PG&E": {
+            # "storage_rebate": 7500, # Only for homes in wildfire-prone areas, as deemed by PG&E https://www.tesla.com/support/incentives#california-local-incentives
+        # },
+        # "SCE": {
+
+        # },
+        # "SDG&E": {
+        #     # https://www.sdge.com/solar/considering-solar
+        # }
+    },
+    "heat_pump": {
+        "other_rebates": 0, # 9500, # 9500, # 15200, # 10000, # needed to make it worthwhile
+        "max_federal_annual_tax_rebate": 2000, # 2000,
+        "california_TECH_incentive": 1500, #1500, # https://incentives.switchison.org/rebate-profile/tech-clean-california-single-family-hvac
+    },
+    "induction_stove": {
+        "max_federal_annual_tax_rebate": 420, # 420, # 1000, # 420, # https://www.geappliances.com/inflation-reduction-act
+    },
+    "water_heater": {
+        "max_federal_annual_tax_rebate": 2000,
+        "45-55gal": 700, # $700 rebate
+        # "55-75gal": 900 # $900 rebate https://incentives.switchison.org/residents/incentives?state=CA&field_zipcode=90001&_gl=1*1ck7fcj*_gcl_au*OTAxNTQyNjA3LjE3NDQ1NjYxNzg.*_ga*MTEwMTk5ODQ0LjE3NDQ1NjYxNzg.*_ga_8NM1W0PLNN*MTc0NDU2NjE3OC4xLjEuMTc0NDU2NjIwNC4zNC4wLjA.
+    },
+}
+
+def calculate_solar_storage_cost(solar_kw, dollars_per_watt, labour_pct, design_pct, storage_cost):
+    panel_cost = solar_kw * 1000 * dollars_per_watt
+    solar_total_cost = panel_cost * (1 + labour_pct + design_pct)
+    total_cost = solar_total_cost + storage_cost
+    return total_cost, solar_total_cost
+
+def apply_solar_storage_incentives(cost, utility):
+    cost *= (1 - INCENTIVES["federal_tax_credit_2023_2032"])
+    cost -= INCENTIVES["PGE_SCE_SDGE_General_SGIP_Rebate"]
+
+    if utility in INCENTIVES["storage"]:
+        cost -= INCENTIVES["storage"][utility]["storage_rebate"]
+    return cost
+
+def calculate_net_system_costs(solar_kw, battery_counts, utility):
+    """
+    Installed cost of solar + battery_counts Powerwalls after incentives ($), for one system or arrays of them.
+    The cost basis of the payback maps and of step 8's sizing.
+    """
+    total_cost, _ = calculate_solar_storage_cost(
+        np.asarray(solar_kw, dtype=float),
+        CAPITAL_COSTS["solar"]["dollars_per_watt"],
+        CAPITAL_COSTS["solar"]["installation_labor"],
+        CAPITAL_COSTS["solar"]["design_eng_overhead_percent"],
+        np.asarray(battery_counts) * CAPITAL_COSTS["storage"]["powerwall_13.5kwh"],
+    )
+
+    return apply_solar_storage_incentives(total_cost.copy(), utility)
+
+def calculate_system_payback_costs(solar_kw, battery_counts):
+    """
+    Installed cost of solar + battery_counts Powerwalls ($) on step 12's cost basis (SYSTEM_PAYBACK_COSTS),
+    whose Powerwall price already includes its incentives.
+    """
+    total_cost, _ = calculate_solar_storage_cost(
+        np.asarray(solar_kw, dtype=float),
+        SYSTEM_PAYBACK_COSTS["solar"]["dollars_per_watt"],
+        SYSTEM_PAYBACK_COSTS["solar"]["installation_labor"],
+        SYSTEM_PAYBACK_COSTS["solar"]["design_eng_overhead_percent"],
+        np.asarray(battery_counts) * SYSTEM_PAYBACK_COSTS["storage"]["powerwall_13.5kwh"],
+    )
+
+    return total_cost
+
 FIXED_BINS = {
     "Payback Period": [-500, -100, -80, -60, -40, -20, 0, 20, 40, 60, 80, 100, 500],
     "Annual Savings": [-600, -450, -300, -150, 0, 0.1, 250, 500, 750, 1000, 1250, 1500, 1750, 2000, 2500, 3000, 3500],
@@ -15,8 +15,42 @@ import step14_build_maps as BuildMaps
 import step15_build_difference_maps as BuildDifferenceMaps
 import step17_build_payback_period_maps as MapPaybackVisualization
 
+import os
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
 from typing import ClassVar, Final, Dict, Set
 
+import capital_costs_helper
+import electricity_rate_helpers
+import gas_rate_helpers
+import sizing_helpers
+import tariff_helpers
+import net_billing_helpers
+import calendar_helpers
+from helpers import get_timestamp, log, slugify_county_name
+from handoff_helpers import clear_frames, disable_in_memory_handoff, enable_in_memory_handoff
+from pipeline_helpers import PIPELINE_STAMPS_FOLDER_NAME, get_module_parameters, run_pipeline
+
+COUNTY_LOGS_FOLDER_NAME = "logs"
+
+def run_county(cost_service, county):
+    """
+    Runs one county's chain of steps in a worker process. Everything the steps print goes to the county's own log file,
+    and a failing county is reported back instead of stopping the other counties.
+    """
+    log_file_path = cost_service.get_county_log_path(county)
+    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+
+    with open(log_file_path, "w") as log_file, redirect_stdout(log_file), redirect_stderr(log_file):
+        try:
+            results = cost_service.run_county_steps([county], write_summary=False)
+            return {"county": county, "status": "processed", "log": log_file_path, **results}
+        except Exception:
+            traceback.print_exc()
+            return {"county": county, "status": "failed", "log": log_file_path}
+
 class CostService:
     SCENARIOS = {
         # "baseline": {"gas": {"heating", "hot_water", "cooking"}, "electric": {"appliances", "misc"}}, # Almost everything is gas, except normal electrical appliances
@@ -27,58 +61,221 @@ class CostService:
         "heat_pump_and_induction_stove_and_water_heating": {"gas": {}, "electric": {"hot_water", "cooking", "heating", "appliances", "misc"}}
     }
 
-    def __init__(self, scenario, housing_type, counties, rate_plans, input_dir, output_dir):
+    def __init__(self, scenario, housing_type, counties, rate_plans, input_dir, output_dir, workers=1, force_recompute=False, in_memory=False, persist_intermediates=True):
         self.scenario = scenario
         self.housing_type = housing_type
-        self.counties = counties
+        self.counties = list(dict.fromkeys(counties)) # A county listed twice would run (and be written) twice
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.desired_rate_plans = rate_plans
+        self.workers = workers # Counties run in parallel worker processes when > 1
+        self.force_recompute = force_recompute # Reruns every step, even if its outputs are up to date
+        self.in_memory = in_memory # Hands load profiles from step to step in memory, running every step
+        self.persist_intermediates = persist_intermediates # With in_memory, still write the intermediate CSVs in the background
 
-    def log_step(self, step):
-        print("-" * 15, f" Step {step} ", "-" * 15)
+    def get_county_log_path(self, county):
+        return os.path.join(self.output_dir, self.scenario, self.housing_type, COUNTY_LOGS_FOLDER_NAME, f"{slugify_county_name(county)}.log")
 
-    def run(self):
-        self.log_step(1)
-        IdentifySuitableBuildings.process(scenario, self.housing_type, output_base_dir="data", target_counties=self.counties, force_recompute=False)
+    def get_stamps_dir(self, county=None):
+        return os.path.join(self.output_dir, PIPELINE_STAMPS_FOLDER_NAME, self.scenario, self.housing_type, slugify_county_name(county) if county else "statewide")
 
-        self.log_step(2)
-        PullBuildings.process(scenario, self.housing_type, self.counties, output_base_dir="data", download_new_files=False) # output directory should just be 'data', not 'loadprofiles'
-    
-        self.log_step(3)
-        BuildElectricityLoadProfiles.process(scenario, self.SCENARIOS[scenario], self.housing_type, self.counties, "data", "data/loadprofiles", force_recompute=False)
+    def get_statewide_pipeline(self):
+        """
+        Step 1 reads the statewide metadata once for every county, before counties are fanned out.
+        """
+        scenario, housing_type = self.scenario, self.housing_type
 
-        self.log_step(4)
-        BuildGasLoadProfiles.process("data", "data/loadprofiles", scenario, self.SCENARIOS, self.housing_type, self.counties, force_recompute=False)
+        return [
+            {
+                "name": "identify_suitable_buildings",
+                "run": lambda: IdentifySuitableBuildings.process(scenario, housing_type, output_base_dir="data", target_counties=self.counties, force_recompute=True),
+                "inputs": [IdentifySuitableBuildings.get_metadata_path()],
+                "outputs": [os.path.join("data", scenario, housing_type, slugify_county_name(county), PullBuildings.METADATA_FILE_NAME) for county in self.counties],
+                "params": {"counties": self.counties, **get_module_parameters(IdentifySuitableBuildings)},
+            },
+        ]
 
-        self.log_step(5)
-        ConvertGasToElectric.process("data/loadprofiles", "data/loadprofiles", self.counties, list(self.SCENARIOS.keys()), [self.housing_type] )
+    def get_county_pipeline(self, county):
+        """
+        Steps 2 to 13 for one county, each with the steps it reads from, the files it writes and the constants it depends on.
+        """
+        scenario, housing_type, scenarios = self.scenario, self.housing_type, list(self.SCENARIOS.keys())
+        county_slug = slugify_county_name(county)
 
-        self.log_step(6)
-        CombineRealAndSimulatedProfiles.process("data/loadprofiles", "data/loadprofiles", list(self.SCENARIOS.keys()), [self.housing_type], self.counties)
-    
-        self.log_step(7)
-        WeatherFiles.process("data/loadprofiles", "data/loadprofiles", list(self.SCENARIOS.keys()), [self.housing_type], 2018, self.counties)
+        buildings_dir = os.path.join("data", scenario, housing_type, county_slug)
+        def load_profiles_dir(scenario_name):
+            return os.path.join("data/loadprofiles", scenario_name, housing_type, county_slug)
+
+        def run_solar_storage():
+            return RunSamModelForSolarStorage.process("data/loadprofiles", "data/loadprofiles", scenario, housing_type, [county], write_summary=False)
+
+        def run_electricity_rates():
+            cost_table = EvaluateElectricityRates.process_batch("data/loadprofiles", "data/loadprofiles", [scenario], housing_type, [county], write_summary=False)
+            return cost_table.to_dict(orient="records")
+
+        return [
+            {
+                "name": "pull_buildings",
+                "run": lambda: PullBuildings.process(scenario, housing_type, [county], output_base_dir="data", download_new_files=False), # output directory should just be 'data', not 'loadprofiles'
+                "inputs": [os.path.join(buildings_dir, PullBuildings.METADATA_FILE_NAME)],
+                "outputs": [os.path.join(buildings_dir, BuildElectricityLoadProfiles.INPUT_FOLDER_NAME, "*.parquet")],
+                "params": get_module_parameters(PullBuildings),
+            },
+            {
+                # One read of every building file builds both the electricity and the gas load profiles
+                "name": "build_load_profiles",
+                "run": lambda: BuildElectricityLoadProfiles.process_electricity_and_gas(scenario, self.SCENARIOS[scenario], housing_type, [county], "data", "data/loadprofiles", force_recompute=True),
+                "depends_on": ["pull_buildings"],
+                "outputs": [
+                    os.path.join(load_profiles_dir(scenario), f"{BuildElectricityLoadProfiles.OUTPUT_FILE_PREFIX}_{county_slug}.csv"),
+                    os.path.join(load_profiles_dir(scenario), f"{BuildGasLoadProfiles.OUTPUT_FILE_PREFIX}_{county_slug}.csv"),
+                ],
+                "params": {"end_uses": self.SCENARIOS[scenario], **get_module_parameters(BuildElectricityLoadProfiles, BuildGasLoadProfiles)},
+            },
+            {
+                "name": "convert_gas_appliances",
+                "run": lambda: ConvertGasToElectric.process("data/loadprofiles", "data/loadprofiles", [county], scenarios, [housing_type]),
+                "depends_on": ["build_load_profiles"],
+                "outputs": [os.path.join(load_profiles_dir(name), f"{ConvertGasToElectric.OUTPUT_FILE_PREFIX}_{county_slug}.csv") for name in scenarios],
+                "params": {"scenarios": self.SCENARIOS, **get_module_parameters(ConvertGasToElectric)},
+            },
+            {
+                "name": "combine_profiles",
+                "run": lambda: CombineRealAndSimulatedProfiles.process("data/loadprofiles", "data/loadprofiles", scenarios, [housing_type], [county]),
+                "depends_on": ["build_load_profiles", "convert_gas_appliances"],
+                "outputs": [os.path.join(load_profiles_dir(name), f"{CombineRealAndSimulatedProfiles.OUTPUT_FILE_PREFIX}_{name}_{county_slug}.csv") for name in scenarios],
+                "params": get_module_parameters(CombineRealAndSimulatedProfiles),
+            },
+            {
+                "name": "weather_files",
+                "run": lambda: WeatherFiles.process("data/loadprofiles", "data/loadprofiles", scenarios, [housing_type], calendar_helpers.ANALYSIS_YEAR, [county]),
+                "outputs": [os.path.join(load_profiles_dir(name), f"{WeatherFiles.FILE_PREFIX}_{county_slug}*.csv") for name in scenarios],
+                "params": {"year": calendar_helpers.ANALYSIS_YEAR},
+            },
+            {
+                "name": "solar_storage",
+                "run": run_solar_storage,
+                "depends_on": ["combine_profiles", "weather_files"],
+                # Sizing prices and bills every candidate system: capital costs, tariffs, eligibility and export rates
+                "inputs": [os.path.join(net_billing_helpers.AVOIDED_COSTS_DIR, "*.csv")],
+                "outputs": [os.path.join(load_profiles_dir(scenario), f"{RunSamModelForSolarStorage.OUTPUT_LOADPROFILE_FILE_PREFIX}_{county_slug}.csv")],
+                "params": get_module_parameters(RunSamModelForSolarStorage, capital_costs_helper, sizing_helpers, electricity_rate_helpers, tariff_helpers, net_billing_helpers, calendar_helpers),
+            },
+            {
+                "name": "loads_for_rates",
+                "run": lambda: GetLoadsForRates.process("data/loadprofiles", "data/loadprofiles", scenarios, [housing_type], [county]),
+                "depends_on": ["combine_profiles", "solar_storage"],
+                "outputs": [os.path.join(load_profiles_dir(name), f"{GetLoadsForRates.OUTPUT_FILE_NAME}_{county_slug}.csv") for name in scenarios],
+                "params": get_module_parameters(GetLoadsForRates),
+            },
+            # The rate steps bill one county per process_batch call, so that stamps, in-memory handoffs and logs stay per
+            # county. Their statewide single-matrix batching is for library callers passing many counties; here compiled
+            # tariffs are still memoized per worker process (tariff_helpers.compile_rate_plan, step10.compile_gas_rate_plan), not per county.
+            {
+                "name": "gas_rates",
+                "run": lambda: EvaluateGasRates.process_batch("data/loadprofiles", "data/loadprofiles", [scenario], [housing_type], [county]),
+                "depends_on": ["loads_for_rates"],
+                "outputs": [os.path.join(load_profiles_dir(scenario), "results", "gas", "*.csv")],
+                "params": get_module_parameters(EvaluateGasRates, gas_rate_helpers, calendar_helpers),
+            },
+            {
+                "name": "electricity_rates",
+                "run": run_electricity_rates,
+                "depends_on": ["loads_for_rates"],
+                "inputs": [os.path.join(net_billing_helpers.AVOIDED_COSTS_DIR, "*.csv")],
+                "outputs": [os.path.join(load_profiles_dir(scenario), "results", "electricity", "*.csv")],
+                "params": get_module_parameters(EvaluateElectricityRates, electricity_rate_helpers, tariff_helpers, net_billing_helpers, calendar_helpers),
+            },
+            {
+                "name": "total_annual_costs",
+                "run": lambda: CombineTotalAnnualCosts.process("data/loadprofiles", "data/loadprofiles", scenario, [housing_type], [county]),
+                "depends_on": ["gas_rates", "electricity_rates"],
+                "outputs": [os.path.join(load_profiles_dir(scenario), "results", subfolder, "*.csv") for subfolder in ["totals", "solarstorage"]],
+                "params": get_module_parameters(CombineTotalAnnualCosts),
+            },
+        ]
+
+    def save_statewide_summaries(self, system_capacities, cost_table):
+        """
+        Writes the tables that cover every county: solar + storage capacities (step 8) and best rate plans (step 11).
+        """
+        RunSamModelForSolarStorage.save_system_capacities("data/loadprofiles", self.scenario, self.housing_type, system_capacities)
+
+        if not cost_table.empty:
+            best_rate_plans = EvaluateElectricityRates.find_best_rate_plans(cost_table)
+            EvaluateElectricityRates.save_best_rate_plans(best_rate_plans, "data/loadprofiles", self.housing_type, get_timestamp())
+
+    def run_county_steps(self, counties, write_summary=True):
+        """
+        Runs steps 2 to 13 for the given counties, one county pipeline at a time. Steps whose parameters and upstream
+        outputs are unchanged since they last ran are skipped, unless load profiles are handed off in memory.
+        The statewide summary tables (solar + storage capacities, best rate plans) are only written when write_summary is set.
+        """
+        system_capacities, cost_tables = {}, []
 
-        self.log_step(8)
-        RunSamModelForSolarStorage.process("data/loadprofiles", "data/loadprofiles", scenario, self.housing_type, self.counties)
+        if self.in_memory:
+            enable_in_memory_handoff(persist=self.persist_intermediates)
 
-        self.log_step(9)
-        GetLoadsForRates.process("data/loadprofiles", "data/loadprofiles", list(self.SCENARIOS.keys()), [self.housing_type], self.counties)
+        try:
+            for county in counties:
+                # Stamps describe files on disk, so in-memory runs recompute every step
+                stamps_dir = None if self.in_memory else self.get_stamps_dir(county)
+                results = run_pipeline(self.get_county_pipeline(county), stamps_dir, force_recompute=self.force_recompute)
+                system_capacities.update(results["solar_storage"] or {})
+                cost_tables.append(pd.DataFrame(results["electricity_rates"] or []))
+                clear_frames() # A county's profiles are never read by the next county
+        finally:
+            if self.in_memory:
+                disable_in_memory_handoff()
 
-        self.log_step(10)
-        EvaluateGasRates.process("data/loadprofiles", "data/loadprofiles", scenario, [self.housing_type], self.counties)
+        cost_table = pd.concat(cost_tables, ignore_index=True) if cost_tables else pd.DataFrame()
 
-        self.log_step(11)
-        EvaluateElectricityRates.process("data/loadprofiles", "data/loadprofiles", scenario, self.housing_type, self.counties)
+        if write_summary:
+            self.save_statewide_summaries(system_capacities, cost_table)
+
+        return {"system_capacities": system_capacities, "cost_table": cost_table}
+
+    def run_counties_in_parallel(self):
+        """
+        Fans every county's chain of steps out to a process pool and joins the statewide summary tables
+        (solar + storage capacities, best rate plans) once all counties are done.
+        """
+        county_results = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(run_county, self, county) for county in self.counties]
+            for future in as_completed(futures):
+                county_results.append(future.result())
+
+        processed = [result for result in county_results if result["status"] == "processed"]
+        failed = [result for result in county_results if result["status"] == "failed"]
+
+        system_capacities = {county: capacities for result in processed for county, capacities in result["system_capacities"].items()}
+        cost_tables = [result["cost_table"] for result in processed if not result["cost_table"].empty]
+        self.save_statewide_summaries(system_capacities, pd.concat(cost_tables, ignore_index=True) if cost_tables else pd.DataFrame())
+
+        log(
+            at="cost_service#run_counties_in_parallel",
+            workers=self.workers,
+            processed=len(processed),
+            failed=[result["county"] for result in failed],
+            county_logs=os.path.dirname(self.get_county_log_path(self.counties[0])) if self.counties else None,
+        )
+
+        return county_results
+
+    def run(self):
+        run_pipeline(self.get_statewide_pipeline(), self.get_stamps_dir(), force_recompute=self.force_recompute)
 
-        CombineTotalAnnualCosts.process("data/loadprofiles", "data/loadprofiles", scenario, [self.housing_type], self.counties)
+        if self.workers > 1:
+            self.run_counties_in_parallel()
+        else:
+            self.run_county_steps(self.counties)
 
         # BuildMaps.process("data/loadprofiles", "data/loadprofiles", scenario, self.housing_type, self.counties, self.desired_rate_plans)
         
         # BuildDifferenceMaps.process("data/loadprofiles", "data/loadprofiles", housing_type, counties, "baseline", "baseline", "baseline", "baseline.solarstorage")
     
-        MapPaybackVisualization.process("data/loadprofiles", "data/loadprofiles", scenario, self.housing_type, self.counties, self.desired_rate_plans)
+        MapPaybackVisualization.process("data/loadprofiles", "data/loadprofiles", self.scenario, self.housing_type, self.counties, self.desired_rate_plans)
 
 if __name__ == '__main__':
     scenario = "heat_pump_and_induction_stove_and_water_heating"
@@ -99,7 +296,7 @@ if __name__ == '__main__':
         "Sacramento County", "San Joaquin County", "Stanislaus County", "Sutter County", 
         "Tulare County", "Yolo County",  # Central Valley
         "Monterey County", "San Benito County", "San Luis Obispo County", "Santa Barbara County", 
-        "Santa Cruz County", "Ventura County",  # Central Coast
+        "Santa Cruz County",  # Central Coast
         "Alpine County", "Amador County", "Mono County",  # Eastern Sierra & Inland
     ]
 
@@ -110,17 +307,17 @@ if __name__ == '__main__':
     ]
     rate_plans = {
             "PG&E": {
-                "electricity": "E-TOU-D",
+                "electricity": EvaluateElectricityRates.BEST_RATE_PLAN, # Cheapest eligible plan, E-TOU-D by default
                 "gas": "G-1"
             },
             "SCE": {
-                "electricity": "TOU-D-4-9PM",
+                "electricity": EvaluateElectricityRates.BEST_RATE_PLAN, # Cheapest eligible plan, TOU-D-4-9PM by default
                 "gas": "GR"
             },
             "SDG&E": {
-                "electricity": "TOU-DR1",
+                "electricity": EvaluateElectricityRates.BEST_RATE_PLAN, # Cheapest eligible plan, TOU-DR1 by default
                 "gas": "GR"
             }
         }
-    cost_service = CostService(scenario, housing_type, counties=norcal_counties + central_counties + socal_counties, rate_plans=rate_plans, input_dir=input_dir, output_dir=output_dir)
+    cost_service = CostService(scenario, housing_type, counties=norcal_counties + central_counties + socal_counties, rate_plans=rate_plans, input_dir=input_dir, output_dir=output_dir, workers=os.cpu_count())
     cost_service.run()
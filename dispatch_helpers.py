@@ -0,0 +1,91 @@
+import numpy as np
+
+# Self-consumption battery dispatch in NumPy, a stand-in for an SSC battery run when sweeping many system sizes.
+# Every hour, PV serves the load first, its surplus charges the battery and whatever the battery cannot take is
+# exported; the battery then covers as much of the remaining load as its power and state of charge allow, and the grid
+# the rest. The battery never charges from the grid nor discharges to it.
+# Arrays may carry leading configuration dimensions, e.g. pv_kw of shape (sizes, 8760) with battery_kwh of shape
+# (sizes,): the hourly loop runs once for all of them.
+
+SELF_CONSUMPTION_DISPATCH = {
+    "round_trip_efficiency": 0.90, # SSC lithium-ion runs average ~0.907
+    "minimum_soc": 0.15,
+    "maximum_soc": 0.95,
+    "initial_soc": 0.50,
+}
+DISPATCH_FLOWS = ["system_to_load", "batt_to_load", "grid_to_load", "system_to_batt", "system_to_grid", "grid_to_batt"]
+
+# Annual energy of every flow within 1% of the annual load of the SSC self-consumption dispatch
+# (PySAM.Battery, batt_dispatch_choice=5) it replaces
+VALIDATION_TOLERANCE = 0.01
+
+def dispatch_self_consumption(pv_kw, load_kw, battery_kwh, battery_kw, **parameters):
+    """
+    Hourly flows [kW] of a solar + battery system under self-consumption dispatch, with batt_SOC in [%].
+    parameters override SELF_CONSUMPTION_DISPATCH.
+    """
+    parameters = {**SELF_CONSUMPTION_DISPATCH, **parameters}
+    pv_kw, load_kw = np.broadcast_arrays(np.asarray(pv_kw, dtype=float), np.asarray(load_kw, dtype=float))
+    battery_kwh = np.broadcast_to(np.asarray(battery_kwh, dtype=float), pv_kw.shape[:-1])
+    battery_kw = np.broadcast_to(np.asarray(battery_kw, dtype=float), pv_kw.shape[:-1])
+
+    # Losses split evenly between charging and discharging
+    charge_efficiency = discharge_efficiency = np.sqrt(parameters["round_trip_efficiency"])
+    minimum_kwh = parameters["minimum_soc"] * battery_kwh
+    maximum_kwh = parameters["maximum_soc"] * battery_kwh
+
+    system_to_load = np.minimum(pv_kw, load_kw)
+    surplus = pv_kw - system_to_load
+    deficit = load_kw - system_to_load
+
+    system_to_batt = np.zeros_like(pv_kw)
+    batt_to_load = np.zeros_like(pv_kw)
+    stored_kwh = np.zeros_like(pv_kw)
+    energy = parameters["initial_soc"] * battery_kwh
+
+    for hour in range(pv_kw.shape[-1]):
+        charge = np.minimum(surplus[..., hour], np.minimum(battery_kw, np.maximum(maximum_kwh - energy, 0) / charge_efficiency))
+        energy = energy + charge * charge_efficiency
+
+        discharge = np.minimum(deficit[..., hour], np.minimum(battery_kw, np.maximum(energy - minimum_kwh, 0) * discharge_efficiency))
+        energy = energy - discharge / discharge_efficiency
+
+        system_to_batt[..., hour] = charge
+        batt_to_load[..., hour] = discharge
+        stored_kwh[..., hour] = energy
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        batt_soc = np.where(battery_kwh[..., None] > 0, stored_kwh / battery_kwh[..., None] * 100, 0.0)
+
+    return {
+        "system_to_load": system_to_load,
+        "batt_to_load": batt_to_load,
+        "grid_to_load": deficit - batt_to_load,
+        "system_to_batt": system_to_batt,
+        "system_to_grid": surplus - system_to_batt,
+        "grid_to_batt": np.zeros_like(pv_kw),
+        "batt_SOC": batt_soc,
+    }
+
+def get_dispatch_errors(reference, surrogate, load_kw):
+    """
+    Difference in annual energy of every flow between a reference (SSC) dispatch and the surrogate, as a share of the annual load.
+    """
+    annual_load = np.sum(load_kw)
+
+    return {
+        flow: float(abs(np.sum(reference[flow]) - np.sum(surrogate[flow])) / annual_load)
+        for flow in DISPATCH_FLOWS
+        if flow in reference
+    }
+
+def validate_dispatch(reference, surrogate, load_kw, tolerance=VALIDATION_TOLERANCE):
+    """
+    Raises when a flow of the surrogate is off by more than tolerance (share of annual load). Returns the errors.
+    """
+    errors = get_dispatch_errors(reference, surrogate, load_kw)
+    failing = {flow: error for flow, error in errors.items() if error > tolerance}
+    if failing:
+        raise ValueError(f"Dispatch surrogate is off by more than {tolerance:.1%} of annual load: {failing}")
+
+    return errors
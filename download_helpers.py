@@ -0,0 +1,395 @@
+import fcntl
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import BotoCoreError, ClientError
+
+from helpers import log
+
+# Concurrent S3 downloads for the building timeseries: a bounded thread pool, retries with exponential backoff,
+# an optional bandwidth cap shared by every worker, and a manifest of the size and ETag of every completed file,
+# so an interrupted run resumes where it stopped and truncated files are downloaded again.
+# Objects are streamed to a temporary file next to the destination and renamed into place once complete.
+#
+# Parquet objects can also be fetched projected to a set of columns: the footer and only the byte ranges of the
+# requested column chunks are read with range requests, and a slim Parquet file with just those columns is written.
+
+MAX_WORKERS = 16
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 0.5 # doubled on every retry, with jitter
+MAX_BACKOFF_SECONDS = 30
+BANDWIDTH_LIMIT_BYTES_PER_SECOND = None # e.g. 50 * 1024 * 1024, None for no limit
+CHUNK_SIZE = 1024 * 1024
+PROGRESS_EVERY = 100 # files between progress logs and manifest saves
+MANIFEST_FILE_NAME = ".download_manifest.json"
+PARTIAL_FILE_SUFFIX = ".part"
+PROJECTED_COMPRESSION = "zstd"
+
+# Errors that will not go away by asking again
+NON_RETRYABLE_ERROR_CODES = {"NoSuchKey", "NoSuchBucket", "404", "NotFound", "403", "AccessDenied"}
+
+class BandwidthLimiter:
+    """
+    Caps the average download rate of all threads sharing it by sleeping once they get ahead of the budget.
+    """
+    def __init__(self, bytes_per_second, clock=time.monotonic, sleep=time.sleep):
+        self.bytes_per_second = bytes_per_second
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.consumed = 0
+
+    def consume(self, num_bytes):
+        if not self.bytes_per_second:
+            return
+
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = self.clock()
+            self.consumed += num_bytes
+            wait = self.started_at + self.consumed / self.bytes_per_second - self.clock()
+
+        if wait > 0:
+            self.sleep(wait)
+
+def is_retryable(error):
+    if isinstance(error, ClientError): # throttling and server errors
+        return error.response.get("Error", {}).get("Code") not in NON_RETRYABLE_ERROR_CODES
+    return isinstance(error, (BotoCoreError, OSError)) # connection problems and truncated downloads, not bugs
+
+def call_with_retries(function, retries=MAX_RETRIES, backoff_seconds=None, sleep=None):
+    # Looked up on every call rather than bound as defaults, so they can be patched (e.g. in tests)
+    backoff_seconds = BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+    sleep = sleep or time.sleep
+
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except Exception as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            sleep(min(MAX_BACKOFF_SECONDS, backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+class S3ObjectStore:
+    """
+    Object store client used for projected fetches: object sizes and byte ranges.
+    Anything with the same head and get_range methods can stand in for it, e.g. LocalObjectStore in tests.
+    """
+    def __init__(self, s3, bucket_name):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+
+    def head(self, key):
+        response = self.s3.head_object(Bucket=self.bucket_name, Key=key)
+        return {"size": response["ContentLength"], "etag": response.get("ETag", "").strip('"')}
+
+    def get_range(self, key, start, end):
+        """
+        Bytes start to end of the object, both inclusive like the HTTP Range header.
+        """
+        response = self.s3.get_object(Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{end}")
+        return response["Body"].read()
+
+class LocalObjectStore:
+    """
+    Object store backed by a local directory, keys being paths relative to it.
+    """
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def head(self, key):
+        return {"size": os.path.getsize(os.path.join(self.root_dir, key)), "etag": ""}
+
+    def get_range(self, key, start, end):
+        with open(os.path.join(self.root_dir, key), "rb") as file:
+            file.seek(start)
+            return file.read(end - start + 1)
+
+class ObjectRangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file over an object in a store where every read is a range request,
+    so pyarrow only transfers the footer and the column chunks it decodes.
+    """
+    def __init__(self, store, key, limiter=None, retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS):
+        self.store = store
+        self.key = key
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.size = call_with_retries(lambda: store.head(key), retries, backoff_seconds)["size"]
+        self.position = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        match whence:
+            case io.SEEK_SET:
+                self.position = offset
+            case io.SEEK_CUR:
+                self.position += offset
+            case io.SEEK_END:
+                self.position = self.size + offset
+            case _:
+                raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if end <= self.position:
+            return b""
+
+        data = call_with_retries(lambda: self.store.get_range(self.key, self.position, end - 1), self.retries, self.backoff_seconds)
+        if len(data) != end - self.position:
+            raise IOError(f"Short range read of {self.key}: expected {end - self.position} bytes, got {len(data)}")
+
+        if self.limiter is not None:
+            self.limiter.consume(len(data))
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        self.position = end
+
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def fetch_projected_object(store, s3_key, output_file, columns, limiter=None, retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS):
+    """
+    Writes a Parquet file with only the requested columns of a remote Parquet object; columns it lacks are skipped.
+    Returns the manifest entry of the file, with the bytes transferred to build it.
+    """
+    reader = ObjectRangeReader(store, s3_key, limiter, retries, backoff_seconds)
+    parquet_file = pq.ParquetFile(reader, pre_buffer=True) # coalesces adjacent column chunks into fewer requests
+    available_columns = set(parquet_file.schema_arrow.names)
+    table = parquet_file.read(columns=[column for column in columns if column in available_columns])
+
+    temporary_file = get_temporary_path(output_file)
+    try:
+        pq.write_table(table, temporary_file, compression=PROJECTED_COMPRESSION)
+        os.replace(temporary_file, output_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+    return {
+        "key": s3_key,
+        "size": os.path.getsize(output_file),
+        "columns": sorted(columns),
+        "source_size": reader.size,
+        "fetched_bytes": reader.bytes_fetched,
+    }
+
+def get_manifest_path(output_dir):
+    return os.path.join(output_dir, MANIFEST_FILE_NAME)
+
+def load_manifest(output_dir):
+    """
+    {file name: {"key", "size", "etag"}} of the files downloaded into output_dir.
+    """
+    manifest_path = get_manifest_path(output_dir)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except ValueError:
+        return {} # interrupted while saving, every file gets verified again
+
+def get_temporary_path(path):
+    """
+    Per process and thread, so concurrent writers of the same file never share a temporary file.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}{PARTIAL_FILE_SUFFIX}"
+
+def save_manifest(output_dir, manifest):
+    manifest_path = get_manifest_path(output_dir)
+    temporary_path = get_temporary_path(manifest_path)
+
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+def update_manifest(output_dir, entries, removed=()):
+    """
+    Merges entries into the manifest on disk and drops the removed file names, holding a lock on the directory's
+    manifest so that processes downloading into the same directory (e.g. a shared cache) do not lose each other's entries.
+    """
+    with open(f"{get_manifest_path(output_dir)}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = load_manifest(output_dir)
+            manifest.update(entries)
+            for file_name in removed:
+                manifest.pop(file_name, None)
+            save_manifest(output_dir, manifest)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return manifest
+
+def is_complete(output_file, entry, columns=None):
+    """
+    Whether output_file is intact and, for a projected fetch of columns, holds all of them.
+    Full downloads (entries without columns) hold every column.
+    """
+    if entry is None or not os.path.isfile(output_file) or os.path.getsize(output_file) != entry["size"]:
+        return False
+
+    return "columns" not in entry or (columns is not None and set(columns) <= set(entry["columns"]))
+
+def download_object(s3, bucket_name, s3_key, output_file, limiter=None):
+    """
+    Streams one object to output_file, checking its length and, for single part uploads, its MD5 against the ETag.
+    Returns the manifest entry of the file.
+    """
+    response = s3.get_object(Bucket=bucket_name, Key=s3_key)
+    expected_size = response["ContentLength"]
+    etag = response.get("ETag", "").strip('"')
+
+    temporary_file = get_temporary_path(output_file)
+    digest = hashlib.md5()
+    size = 0
+
+    try:
+        with open(temporary_file, "wb") as file:
+            for chunk in response["Body"].iter_chunks(CHUNK_SIZE):
+                if limiter is not None:
+                    limiter.consume(len(chunk))
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+
+        if size != expected_size:
+            raise IOError(f"Truncated download of {s3_key}: expected {expected_size} bytes, got {size}")
+        if etag and "-" not in etag and digest.hexdigest() != etag: # multipart ETags are not a plain MD5
+            raise IOError(f"Corrupt download of {s3_key}: MD5 does not match ETag {etag}")
+
+        os.replace(temporary_file, output_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+    return {"key": s3_key, "size": size, "etag": etag}
+
+def get_existing_entry(store, s3_key, output_file):
+    """
+    Manifest entry for a file downloaded in full before the manifest existed, when it matches the object's size.
+    """
+    if not os.path.isfile(output_file):
+        return None
+
+    head = store.head(s3_key)
+    if head["size"] != os.path.getsize(output_file):
+        return None
+
+    return {"key": s3_key, **head}
+
+def fetch_object(s3, store, s3_key, output_file, entry, columns, limiter, retries, backoff_seconds):
+    """
+    Returns (status, manifest entry) for one object, status being "skipped" or "downloaded".
+    """
+    if is_complete(output_file, entry, columns):
+        return "skipped", entry
+
+    if entry is None:
+        existing_entry = call_with_retries(lambda: get_existing_entry(store, s3_key, output_file), retries, backoff_seconds)
+        if existing_entry is not None:
+            return "skipped", existing_entry
+
+    if columns is not None:
+        return "downloaded", fetch_projected_object(store, s3_key, output_file, columns, limiter, retries, backoff_seconds)
+
+    entry = call_with_retries(lambda: download_object(s3, store.bucket_name, s3_key, output_file, limiter), retries, backoff_seconds)
+
+    return "downloaded", entry
+
+def download_objects(
+    s3,
+    bucket_name,
+    s3_keys,
+    output_dir,
+    max_workers=MAX_WORKERS,
+    retries=MAX_RETRIES,
+    backoff_seconds=BACKOFF_SECONDS,
+    bandwidth_limit=BANDWIDTH_LIMIT_BYTES_PER_SECOND,
+    columns=None,
+    store=None,
+):
+    """
+    Downloads every key into output_dir (named after the key's base name), skipping files the manifest shows complete.
+    With columns, Parquet objects are fetched projected to those columns through store (S3 by default).
+    Returns {"downloaded": [file names], "skipped": [file names], "failed": {file name: error}}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    store = store or S3ObjectStore(s3, bucket_name)
+
+    manifest = load_manifest(output_dir)
+    limiter = BandwidthLimiter(bandwidth_limit)
+    summary = {"downloaded": [], "skipped": [], "failed": {}}
+    entries, removed = {}, set()
+    downloaded_bytes = 0
+    started_at = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for s3_key in s3_keys:
+            file_name = os.path.basename(s3_key)
+            output_file = os.path.join(output_dir, file_name)
+            future = executor.submit(fetch_object, s3, store, s3_key, output_file, manifest.get(file_name), columns, limiter, retries, backoff_seconds)
+            futures[future] = file_name
+
+        for completed, future in enumerate(as_completed(futures), start=1):
+            file_name = futures[future]
+            try:
+                status, entry = future.result()
+            except Exception as error:
+                removed.add(file_name)
+                summary["failed"][file_name] = str(error)
+                log(at="download_objects", file_name=file_name, status="error", error=str(error))
+            else:
+                entries[file_name] = entry
+                summary[status].append(file_name)
+                downloaded_bytes += entry.get("fetched_bytes", entry["size"]) if status == "downloaded" else 0
+
+            if completed % PROGRESS_EVERY == 0 or completed == len(futures):
+                update_manifest(output_dir, entries, removed)
+                entries, removed = {}, set()
+                elapsed = max(time.monotonic() - started_at, 1e-9)
+                log(
+                    at="download_objects",
+                    output_dir=output_dir,
+                    progress=f"{completed}/{len(futures)}",
+                    downloaded=len(summary["downloaded"]),
+                    skipped=len(summary["skipped"]),
+                    failed=len(summary["failed"]),
+                    megabytes_per_second=round(downloaded_bytes / elapsed / 1e6, 2),
+                )
+
+    return summary
+
+def verify_downloads(output_dir, file_names, columns=None):
+    """
+    Whether every file is present with the size recorded in the manifest, catching truncated and missing files.
+    """
+    manifest = load_manifest(output_dir)
+
+    return all(is_complete(os.path.join(output_dir, file_name), manifest.get(file_name), columns) for file_name in file_names)
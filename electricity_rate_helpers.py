@@ -84,6 +84,75 @@ BASELINE_ALLOWANCES = {
     # },
 }
 
+# Electric baseline territory for each county, used to look up BASELINE_ALLOWANCES
+# Like the gas territory mapping, each county is attributed to the territory covering most of its area
+# https://www.pge.com/tariffs/assets/pdf/tariffbook/ELEC_MAPS_Service%20Area%20Map.pdf
+PGE_BASELINE_TERRITORY_COUNTY_MAPPING = {
+    "P": [slugify_county_name(county) for county in ["Placer", "El Dorado", "Amador", "Calaveras", "Lake"]],
+    "Q": [slugify_county_name(county) for county in ["Santa Cruz", "Monterey"]],
+    "R": [slugify_county_name(county) for county in ["Merced", "Fresno", "Madera", "Mariposa", "Tehama"]],
+    "S": [slugify_county_name(county) for county in [
+        "Glenn", "Colusa", "Yolo", "Sutter", "Butte", "Yuba", "Sacramento", "Stanislaus", "San Joaquin"
+    ]],
+    "T": [slugify_county_name(county) for county in ["Marin", "San Francisco", "San Mateo"]],
+    "W": [slugify_county_name(county) for county in ["Kings", "Siskiyou"]],
+    "X": [slugify_county_name(county) for county in [
+        "San Benito", "Santa Clara", "Alameda", "Contra Costa", "Napa", "Sonoma",
+        "Mendocino", "Santa Barbara", "Solano", "Del Norte"
+    ]],
+    "Y": [slugify_county_name(county) for county in [
+        "Nevada", "Plumas", "Humboldt", "Trinity", "Lassen", "Shasta", "Sierra", "Alpine", "Tuolumne"
+    ]],
+}
+
+# https://www.sce.com/sites/default/files/inline-files/Baseline_Region_Map.pdf
+SCE_BASELINE_REGION_COUNTY_MAPPING = {
+    "5": [slugify_county_name(county) for county in ["Santa Barbara", "San Luis Obispo"]],
+    "6": [slugify_county_name(county) for county in ["Ventura"]],
+    "8": [slugify_county_name(county) for county in ["Los Angeles"]],
+    "9": [slugify_county_name(county) for county in ["Orange"]],
+    "10": [slugify_county_name(county) for county in ["Riverside"]],
+    "13": [slugify_county_name(county) for county in ["Tulare"]],
+    "14": [slugify_county_name(county) for county in ["San Bernardino"]],
+    "15": [slugify_county_name(county) for county in ["Imperial"]],
+    "16": [slugify_county_name(county) for county in ["Mono", "Inyo", "Kern"]],
+}
+
+# Plans only open to households with qualifying technologies. Plans not listed are open to every household.
+# https://www.pge.com/tariffs/assets/pdf/tariffbook/ELEC_SCHEDS_E-ELEC.pdf: heat pump space or water heating, battery storage or an EV
+# https://www.pge.com/tariffs/assets/pdf/tariffbook/ELEC_SCHEDS_EV2%20(Sch).pdf: battery storage or an EV
+# https://www.sce.com/residential/rates/Time-Of-Use-Residential-Rate-Plans: TOU-D-PRIME requires a heat pump, battery storage or an EV
+# https://www.sdge.com/whenmatters: TOU-ELEC requires a heat pump, battery storage or an EV
+RATE_PLAN_ELIGIBILITY = {
+    "E-ELEC": {"heat_pump", "battery", "ev"},
+    "EV2-A": {"battery", "ev"},
+    "TOU-D-PRIME": {"heat_pump", "battery", "ev"},
+    "TOU-ELEC": {"heat_pump", "battery", "ev"},
+}
+
+def get_household_technologies(scenario, load_type):
+    """
+    Technologies that qualify a household for restricted rate plans, see RATE_PLAN_ELIGIBILITY.
+    Heat pumps come from the electrification scenario and batteries from the solar + storage load type.
+    """
+    technologies = set()
+    if "heat_pump" in scenario or "water_heating" in scenario: # Water heating scenarios use a heat pump water heater
+        technologies.add("heat_pump")
+    if load_type == "solarstorage":
+        technologies.add("battery")
+    return technologies
+
+def is_eligible(rate_plan, technologies):
+    required = RATE_PLAN_ELIGIBILITY.get(rate_plan)
+    return not required or bool(required & technologies)
+
+# Each utility's standard residential plan, the reference best rate plan savings are measured against
+DEFAULT_RATE_PLANS = {
+    "PG&E": "E-TOU-D",
+    "SCE": "TOU-D-4-9PM",
+    "SDG&E": "TOU-DR1",
+}
+
 PGE_RATE_PLANS ={
         "E-TOU-C": { # https://www.pge.com/tariffs/assets/pdf/tariffbook/ELEC_SCHEDS_E-TOU-C.pdf
             "summer": {
@@ -0,0 +1,129 @@
+import os
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from artifact_helpers import get_artifact_columns, get_fresh_artifact_file, read_artifact_file, write_artifact_for_path
+
+# Hands intermediate load profiles (steps 3 -> 6 -> 8 -> 9 -> 10/11) from one step to the next in memory.
+# Steps keep writing and reading their intermediate CSVs by path through write_intermediate_csv / read_intermediate_csv;
+# with in-memory handoff enabled, written frames are kept in this process and read back without parsing the file again.
+# Writing the files themselves becomes optional and happens on a background thread.
+# Every written CSV is also stored in the Parquet artifact store (artifact_helpers), which readers use instead of parsing
+# the CSV whenever it is up to date.
+# Final results tables are always written to disk directly.
+
+HANDOFF = {
+    "in_memory": False,
+    "persist": True,
+}
+
+frames = {} # absolute path -> frame as read_csv would return it
+pending_writes = []
+writer = ThreadPoolExecutor(max_workers=1)
+
+def enable_in_memory_handoff(persist=True):
+    """
+    Keeps intermediate frames in memory. With persist, their CSVs are still written, asynchronously.
+    """
+    HANDOFF["in_memory"] = True
+    HANDOFF["persist"] = persist
+
+def disable_in_memory_handoff():
+    flush()
+    frames.clear()
+    HANDOFF["in_memory"] = False
+    HANDOFF["persist"] = True
+
+def flush():
+    """
+    Waits for every pending background write, raising the first write error.
+    """
+    while pending_writes:
+        pending_writes.pop(0).result()
+
+def clear_frames():
+    flush()
+    frames.clear()
+
+def get_handoff_key(path):
+    return os.path.abspath(path)
+
+def to_csv_frame(df, index, index_label):
+    """
+    The frame read_csv would return for df.to_csv(index=index, index_label=index_label).
+    """
+    if not index:
+        return df.copy()
+
+    index_name = index_label or df.index.name or "Unnamed: 0"
+    frame = df.copy()
+    frame.index.name = index_name
+    return frame.reset_index()
+
+def persist_intermediate_csv(df, path, index, index_label):
+    # The CSV first, so the artifact is never older than it (see artifact_helpers.get_fresh_artifact_file)
+    df.to_csv(path, index=index, index_label=index_label)
+    write_artifact_for_path(df, path, index=index, index_label=index_label)
+
+def write_intermediate_csv(df, path, index=True, index_label=None):
+    """
+    Writes an intermediate CSV and its Parquet artifact, or hands the frame off in memory and writes both in the
+    background (or not at all without persist).
+    """
+    if not HANDOFF["in_memory"]:
+        persist_intermediate_csv(df, path, index, index_label)
+        return
+
+    frames[get_handoff_key(path)] = to_csv_frame(df, index, index_label)
+
+    if HANDOFF["persist"]:
+        pending_writes.append(writer.submit(persist_intermediate_csv, df.copy(), path, index, index_label))
+
+def select_columns(columns, usecols):
+    """
+    The columns read_csv keeps for usecols (list or callable), in the file's order.
+    """
+    if callable(usecols):
+        return [column for column in columns if usecols(column)]
+    if usecols is None:
+        return list(columns)
+
+    missing = [column for column in usecols if column not in columns]
+    if missing:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+
+    return [column for column in columns if column in usecols]
+
+def match_csv_dates(df, parse_dates):
+    """
+    Matches the CSV round trip: dates come back as text unless they are parsed.
+    """
+    parse_dates = parse_dates or []
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].astype(str)
+        if column in parse_dates:
+            df[column] = pd.to_datetime(df[column]) # parsed from text, with read_csv's resolution
+
+    return df
+
+def read_intermediate_csv(path, usecols=None, parse_dates=None):
+    """
+    Reads a CSV written with write_intermediate_csv: straight from memory when it was handed off in this process, else
+    from its Parquet artifact when that is up to date, else from the CSV itself.
+    Supports the read_csv options the pipeline uses: usecols (list or callable) and parse_dates.
+    """
+    frame = frames.get(get_handoff_key(path))
+    if frame is not None:
+        return match_csv_dates(frame[select_columns(frame.columns, usecols)].copy(), parse_dates)
+
+    artifact_file = get_fresh_artifact_file(path)
+    if artifact_file is not None:
+        columns = select_columns(get_artifact_columns(artifact_file), usecols)
+        return match_csv_dates(read_artifact_file(artifact_file, columns=columns), parse_dates)
+
+    kwargs = {key: value for key, value in {"usecols": usecols, "parse_dates": parse_dates}.items() if value is not None}
+    return pd.read_csv(path, **kwargs)
+
+def intermediate_exists(path):
+    return get_handoff_key(path) in frames or os.path.exists(path)
@@ -19,7 +19,7 @@ central_counties = [
     "Sacramento County", "San Joaquin County", "Stanislaus County", "Sutter County", 
     "Tulare County", "Yolo County",  # Central Valley
     "Monterey County", "San Benito County", "San Luis Obispo County", "Santa Barbara County", 
-    "Santa Cruz County", "Ventura County",  # Central Coast
+    "Santa Cruz County",  # Central Coast
     "Alpine County", "Amador County", "Mono County",  # Eastern Sierra & Inland
 ]
 
@@ -2,11 +2,12 @@ import os
 import requests
 import geopandas as gpd
 from zipfile import ZipFile
-from datetime import datetime
 import pandas as pd
 import folium
 from typing import List, Optional
 
+from results_index_helpers import extract_timestamp_from_filename, get_latest_csv_file
+
 def initialize_map():
     url = "https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_county_20m.zip"
     zip_name = "cb_2018_us_county_20m.zip"
@@ -29,18 +30,6 @@ def initialize_map():
 
     return gdf
 
-def extract_timestamp_from_filename(filename):
-    parts = filename.rstrip(".csv").split("_")
-    ts = parts[-2] + "_" + parts[-1]
-    return datetime.strptime(ts, "%Y%m%d_%H")
-
-def get_latest_csv_file(directory, prefix):
-    files = [f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".csv")]
-    if not files:
-        raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
-    latest_file = max(files, key=lambda f: extract_timestamp_from_filename(f))
-    return os.path.join(directory, latest_file)
-
 def get_difference_color(diff, min_val, max_val):
     # If the difference is zero or missing, return white.
     if diff is None or pd.isnull(diff) or diff == 0:
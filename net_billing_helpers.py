@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+
+from helpers import log
+from calendar_helpers import ANALYSIS_YEAR, HOURS_PER_YEAR, get_billing_cycle_matrix
+from tariff_helpers import compile_rate_plan, compile_baseline_allowances, get_baseline_usage
+
+# Net billing (NEM 3.0): imports are billed at the retail rate plan, while solar + storage exports earn
+# an hourly export credit taken from the CPUC Avoided Cost Calculator. Export credits offset energy charges
+# within each billing cycle, and leftover credits carry forward to the next cycle until the annual true-up.
+# Fixed charges are non-bypassable and cannot be offset by export credits.
+# https://www.cpuc.ca.gov/industries-and-topics/electrical-energy/demand-side-management/customer-generation/net-billing-tariff
+
+# Export rates live in {AVOIDED_COSTS_DIR}/export_rates_{utility}_{year}.csv (e.g. export_rates_pge_2018.csv): the hourly
+# export compensation of the utility in the analysis year from the CPUC Avoided Cost Calculator, one row per hour of the
+# year (8760, Jan 1 00:00 first) in an export_rate column, in $/kWh. The files are not generated by the pipeline nor
+# shipped with it (export them from the Avoided Cost Calculator): without them exports earn no credit.
+AVOIDED_COSTS_DIR = os.path.join("data", "avoided_costs")
+EXPORT_RATE_COLUMN = "export_rate" # $/kWh, one row per hour of the year
+
+NET_BILLING = {
+    # Missing export rate files bill exports with no credit (and log a warning). Unset to make them raise, e.g. to
+    # make sure a production run uses the avoided cost files
+    "allow_missing_export_rates": True,
+}
+
+# Avoided cost export rates are published per utility
+UTILITY_FILE_NAMES = {
+    "PG&E": "pge",
+    "SCE": "sce",
+    "SDG&E": "sdge",
+}
+
+def get_export_rates_file_path(utility, year, avoided_costs_dir=AVOIDED_COSTS_DIR):
+    return os.path.join(avoided_costs_dir, f"export_rates_{UTILITY_FILE_NAMES[utility]}_{year}.csv")
+
+@lru_cache(maxsize=None)
+def read_export_rates(utility, year=ANALYSIS_YEAR, avoided_costs_dir=AVOIDED_COSTS_DIR):
+    """
+    The utility's read-only 8760-hour export rate vector ($/kWh) for the given year, or None when the avoided cost
+    file is missing. Memoized per file; call read_export_rates.cache_clear() after editing one.
+    """
+    file = get_export_rates_file_path(utility, year, avoided_costs_dir)
+    if not os.path.exists(file):
+        return None
+
+    export_rates = pd.read_csv(file, usecols=[EXPORT_RATE_COLUMN])[EXPORT_RATE_COLUMN].to_numpy(dtype=float)
+    if len(export_rates) != HOURS_PER_YEAR:
+        raise ValueError(f"Expected {HOURS_PER_YEAR} hourly export rates in {file}, found {len(export_rates)}")
+    export_rates.flags.writeable = False
+
+    return export_rates
+
+def load_export_rates(utility, year=ANALYSIS_YEAR, avoided_costs_dir=AVOIDED_COSTS_DIR, allow_missing=None):
+    """
+    Returns the utility's read-only 8760-hour export rate vector ($/kWh) for the given year. When the avoided cost
+    file is missing, exports earn no credit if allow_missing (default NET_BILLING["allow_missing_export_rates"]),
+    else FileNotFoundError is raised.
+    """
+    allow_missing = NET_BILLING["allow_missing_export_rates"] if allow_missing is None else allow_missing
+    export_rates = read_export_rates(utility, year, avoided_costs_dir)
+
+    if export_rates is None:
+        file = get_export_rates_file_path(utility, year, avoided_costs_dir)
+        if not allow_missing:
+            raise FileNotFoundError(f"Export rates not found: {file} (see net_billing_helpers.AVOIDED_COSTS_DIR)")
+
+        log(
+            at="net_billing_helpers#load_export_rates",
+            warning=f"Export rates not found: {file}. Export credits will be zero",
+            utility=utility,
+        )
+        export_rates = np.zeros(HOURS_PER_YEAR)
+        export_rates.flags.writeable = False
+
+    return export_rates
+
+def sum_by_cycle(hourly_matrix, hourly_rates):
+    """
+    Multiplies a (profiles x 8760) matrix by every column of an (8760 x plans) rate matrix and sums per billing cycle.
+    Returns a (profiles x plans x cycles) array.
+    """
+    cycle_matrix = get_billing_cycle_matrix()
+    num_plans, num_cycles = hourly_rates.shape[1], cycle_matrix.shape[1]
+
+    cycle_rates = (hourly_rates[:, :, None] * cycle_matrix[:, None, :]).reshape(HOURS_PER_YEAR, num_plans * num_cycles)
+
+    return (hourly_matrix @ cycle_rates).reshape(len(hourly_matrix), num_plans, num_cycles)
+
+def net_cycle_charges(energy_charges, export_credits):
+    """
+    Nets export credits against energy charges one billing cycle at a time, carrying unused credits forward.
+    Both arrays are (... x cycles); every profile and plan is netted at once. Credits left at the true-up are forfeited.
+    """
+    billed = np.zeros_like(energy_charges)
+    carried_credits = np.zeros(energy_charges.shape[:-1])
+
+    for cycle in range(energy_charges.shape[-1]):
+        balance = energy_charges[..., cycle] - export_credits[..., cycle] - carried_credits
+        billed[..., cycle] = np.clip(balance, 0.0, None)
+        carried_credits = np.clip(-balance, 0.0, None)
+
+    return billed
+
+def bill_net_billing(load_matrix, export_matrix, utility, rate_plan_names, territory=None, hour_mask=None, year=ANALYSIS_YEAR):
+    """
+    Annual net billing cost ($) of every row of a (profiles x 8760) import matrix and matching export matrix (kWh),
+    on each of the utility's rate plans. Returns a (profiles x plans) cost matrix.
+    """
+    load_matrix = np.clip(np.asarray(load_matrix, dtype=float), 0.0, None)
+    export_matrix = np.clip(np.asarray(export_matrix, dtype=float), 0.0, None)
+    if hour_mask is None:
+        hour_mask = np.ones_like(load_matrix)
+
+    compiled = [compile_rate_plan(utility, rate_plan_name) for rate_plan_name in rate_plan_names]
+    prices = np.column_stack([tariff["prices"] for tariff in compiled])
+    fixed_charges = np.column_stack([tariff["fixed_charges"] for tariff in compiled])
+
+    energy_charges = sum_by_cycle(load_matrix, prices)
+
+    if territory is not None:
+        baseline_credits = np.column_stack([tariff["baseline_credits"] for tariff in compiled])
+        baseline_usage = get_baseline_usage(load_matrix, compile_baseline_allowances(utility, territory))
+        energy_charges -= sum_by_cycle(baseline_usage, baseline_credits)
+
+    # The export rate does not depend on the rate plan, so credits are shared across plans
+    export_rates = load_export_rates(utility, year)[:, None]
+    export_credits = sum_by_cycle(export_matrix, export_rates)
+
+    billed_energy = net_cycle_charges(energy_charges, export_credits).sum(axis=-1)
+
+    return billed_energy + hour_mask @ fixed_charges
@@ -0,0 +1,145 @@
+import glob
+import hashlib
+import json
+import os
+from graphlib import TopologicalSorter
+from types import ModuleType
+
+from helpers import log
+
+# Runs the pipeline as a DAG of steps that each declare their upstream steps, parameters and output files.
+# Every step is stamped with a hash of its parameters and of its upstream steps' output content; a step only reruns
+# when that hash changes or its own outputs were changed or deleted since it last ran. Steps whose rerun produces
+# identical outputs leave everything downstream untouched.
+#
+# A step is a dict:
+#     name:       unique step name
+#     run:        function taking no arguments, may return a JSON serializable result
+#     depends_on: names of upstream steps (optional)
+#     inputs:     glob patterns of files read from outside the pipeline (optional)
+#     outputs:    glob patterns of the files the step writes
+#     params:     anything else the outputs depend on, e.g. module constants (optional)
+
+PIPELINE_STAMPS_FOLDER_NAME = ".pipeline"
+
+def get_module_parameters(*modules):
+    """
+    The upper-case module constants (efficiencies, tariffs, capital costs...) a step's outputs depend on.
+    """
+    return {
+        module.__name__: {
+            name: value
+            for name, value in vars(module).items()
+            if name.isupper() and not callable(value) and not isinstance(value, ModuleType)
+        }
+        for module in modules
+    }
+
+def to_canonical_json(value):
+    def default(item):
+        if isinstance(item, (set, frozenset)):
+            return sorted(item, key=repr)
+        return repr(item)
+
+    return json.dumps(value, sort_keys=True, default=default)
+
+def hash_parameters(params):
+    return hashlib.sha256(to_canonical_json(params).encode()).hexdigest()
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_files(patterns, file_hashes=None):
+    """
+    Hashes the content of every file matching the glob patterns.
+    file_hashes maps a path to its last known [size, mtime_ns, sha256], so unchanged files are not read again.
+    Returns (digest, file_hashes of the matched files).
+    """
+    file_hashes = file_hashes or {}
+    matched_file_hashes = {}
+
+    for file_path in sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)}):
+        stat = os.stat(file_path)
+        known = file_hashes.get(file_path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            matched_file_hashes[file_path] = known
+        else:
+            matched_file_hashes[file_path] = [stat.st_size, stat.st_mtime_ns, hash_file(file_path)]
+
+    digest = hash_parameters({path: file_hash[2] for path, file_hash in matched_file_hashes.items()})
+
+    return digest, matched_file_hashes
+
+def get_stamp_path(stamps_dir, step_name):
+    return os.path.join(stamps_dir, f"{step_name}.json")
+
+def load_stamp(stamps_dir, step_name):
+    stamp_path = get_stamp_path(stamps_dir, step_name)
+    if not os.path.exists(stamp_path):
+        return {}
+
+    with open(stamp_path) as file:
+        return json.load(file)
+
+def save_stamp(stamps_dir, step_name, stamp):
+    os.makedirs(stamps_dir, exist_ok=True)
+
+    with open(get_stamp_path(stamps_dir, step_name), "w") as file:
+        json.dump(stamp, file, indent=2, default=repr)
+
+def run_pipeline(steps, stamps_dir, force_recompute=False):
+    """
+    Runs the steps in dependency order, skipping every step whose stamp is still valid.
+    Returns {step name: result}, where skipped steps return the result recorded when they last ran.
+    Without a stamps_dir every step runs and nothing is stamped, e.g. when intermediates are only handed off in memory.
+    """
+    steps_by_name = {step["name"]: step for step in steps}
+    order = TopologicalSorter({step["name"]: step.get("depends_on", []) for step in steps}).static_order()
+
+    output_hashes, results, summary = {}, {}, {"ran": [], "skipped": []}
+
+    for step_name in order:
+        step = steps_by_name[step_name]
+
+        if stamps_dir is None:
+            print("-" * 15, f" {step_name} ", "-" * 15)
+            results[step_name] = step["run"]()
+            summary["ran"].append(step_name)
+            continue
+
+        stamp = load_stamp(stamps_dir, step_name)
+
+        input_hash, input_file_hashes = hash_files(step.get("inputs", []), stamp.get("input_files"))
+        step_hash = hash_parameters({
+            "params": step.get("params", {}),
+            "inputs": input_hash,
+            "upstream": {name: output_hashes[name] for name in step.get("depends_on", [])},
+        })
+        output_hash, output_file_hashes = hash_files(step["outputs"], stamp.get("output_files"))
+
+        if not force_recompute and stamp.get("step_hash") == step_hash and stamp.get("output_hash") == output_hash:
+            summary["skipped"].append(step_name)
+            output_hashes[step_name], results[step_name] = output_hash, stamp.get("result")
+            continue
+
+        print("-" * 15, f" {step_name} ", "-" * 15)
+        result = step["run"]()
+        output_hash, output_file_hashes = hash_files(step["outputs"], output_file_hashes)
+
+        save_stamp(stamps_dir, step_name, {
+            "step_hash": step_hash,
+            "output_hash": output_hash,
+            "input_files": input_file_hashes,
+            "output_files": output_file_hashes,
+            "result": result,
+        })
+        summary["ran"].append(step_name)
+        output_hashes[step_name], results[step_name] = output_hash, result
+
+    log(at="pipeline_helpers#run_pipeline", stamps=stamps_dir, ran=summary["ran"], skipped=summary["skipped"])
+
+    return results
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+from helpers import log
+from pipeline_helpers import hash_file, hash_parameters
+
+# Per-county cache of PVWatts generation normalized to a 1 kW (DC nameplate) system. With the dc/ac ratio, losses and
+# inverter efficiency fixed by the SAM template, PVWatts output scales linearly with SystemDesign.system_capacity, so
+# any system size is the cached profile times its capacity. Profiles are keyed by the content hash of the weather
+# file and of the PVWatts configuration, and stored as {cache dir}/{weather hash}_{configuration hash}.npz.
+
+PV_PROFILE_CACHE = {
+    "enabled": True,
+    "dir": os.path.join("data", ".cache", "pv_profiles"),
+}
+REFERENCE_CAPACITY_KW = 1.0
+PV_PROFILE_OUTPUTS = ["ac", "dc"] # [W] per kW of DC nameplate, the PVWatts outputs Battwatts reads
+PV_PROFILE_CONSTANTS = ["inverter_efficiency"] # [%] at rated power, read by Battwatts too and the same at every size
+
+def get_pv_profile_key(weather_file, configuration):
+    """
+    Cache key of a weather file simulated with a PVWatts configuration (template values and any other model inputs).
+    """
+    return f"{hash_file(weather_file)[:16]}_{hash_parameters(configuration)[:16]}"
+
+def get_pv_profile_path(key):
+    return os.path.join(PV_PROFILE_CACHE["dir"], f"{key}.npz")
+
+def load_pv_profile(key):
+    """
+    The cached normalized profile {output: array}, or None when it was never simulated or the file is unreadable.
+    """
+    path = get_pv_profile_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            return {
+                **{output: data[output] for output in PV_PROFILE_OUTPUTS},
+                **{constant: float(data[constant]) for constant in PV_PROFILE_CONSTANTS},
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_pv_profile(key, profile):
+    os.makedirs(PV_PROFILE_CACHE["dir"], exist_ok=True)
+    path = get_pv_profile_path(key)
+
+    # Counties run in parallel worker processes, write next to the file and swap it in
+    temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(temporary_path, **{name: np.asarray(profile[name], dtype=float) for name in PV_PROFILE_OUTPUTS + PV_PROFILE_CONSTANTS})
+    os.replace(temporary_path, path)
+
+    return path
+
+def get_normalized_pv_profile(weather_file, configuration, simulate):
+    """
+    Normalized 1 kW profile of a weather file, running simulate() (a 1 kW PVWatts run returning {output: values})
+    only when the cache does not hold it yet.
+    """
+    if not PV_PROFILE_CACHE["enabled"]:
+        return normalize_pv_profile(simulate())
+
+    key = get_pv_profile_key(weather_file, configuration)
+    profile = load_pv_profile(key)
+    if profile is not None:
+        log(at="get_normalized_pv_profile", weather_file=weather_file, cache="hit")
+        return profile
+
+    profile = normalize_pv_profile(simulate())
+    save_pv_profile(key, profile)
+    log(at="get_normalized_pv_profile", weather_file=weather_file, cache="miss")
+
+    return profile
+
+def normalize_pv_profile(outputs, capacity_kw=REFERENCE_CAPACITY_KW):
+    return {
+        **{output: np.asarray(outputs[output], dtype=float) / capacity_kw for output in PV_PROFILE_OUTPUTS},
+        **{constant: float(outputs[constant]) for constant in PV_PROFILE_CONSTANTS},
+    }
+
+def scale_pv_profile(profile, capacity_kw):
+    """
+    PVWatts outputs of a capacity_kw system.
+    """
+    return {
+        **{output: profile[output] * capacity_kw for output in PV_PROFILE_OUTPUTS},
+        **{constant: profile[constant] for constant in PV_PROFILE_CONSTANTS},
+    }
@@ -0,0 +1,257 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# SQLite catalog of the timestamped results tables the pipeline writes to
+#     {base_dir}/{scenario}/{housing_type}/{county}/results/{service}/{name}_{county}_{YYYYmmdd_HH}.csv
+# Every write is recorded in {base_dir}/results_index.sqlite, so finding the latest run of a result is one indexed
+# query instead of listing the directory and parsing the timestamp of every file in it. Every results directory is
+# indexed in full along with its modification time; a directory modified since (e.g. a file added or deleted outside
+# of the pipeline) is scanned again on its next lookup, so unrecorded files are never hidden behind the catalog.
+
+RESULTS_INDEX_FILE_NAME = "results_index.sqlite"
+RESULTS_FOLDER_NAME = "results"
+RUN_ID_FORMAT = "%Y%m%d_%H" # helpers.get_timestamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT PRIMARY KEY, -- relative to the base directory
+    scenario TEXT NOT NULL,
+    housing_type TEXT NOT NULL,
+    county TEXT NOT NULL,
+    service TEXT NOT NULL,
+    name TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    rate_plans TEXT,
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_latest ON results (scenario, housing_type, county, service, name, run_id);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY, -- results directory, relative to the base directory
+    mtime_ns INTEGER NOT NULL -- of the directory when all of its files were indexed
+);
+"""
+
+def extract_timestamp_from_filename(filename):
+    parts = filename.removesuffix(".csv").split("_")
+    ts = parts[-2] + "_" + parts[-1]
+
+    return datetime.strptime(ts, RUN_ID_FORMAT)
+
+def parse_results_path(file_path):
+    """
+    Splits a results file path into its base directory and catalog fields,
+    or returns None when it does not follow the results layout or has no run timestamp.
+    """
+    parts = os.path.abspath(file_path).split(os.sep)
+    if len(parts) < 7:
+        return None
+
+    *base_parts, scenario, housing_type, county, results_folder, service, file_name = parts
+    if results_folder != RESULTS_FOLDER_NAME or not file_name.endswith(".csv"):
+        return None
+
+    try:
+        run_id = extract_timestamp_from_filename(file_name).strftime(RUN_ID_FORMAT)
+    except (IndexError, ValueError):
+        return None
+
+    name = file_name.removesuffix(f"_{run_id}.csv").removesuffix(f"_{county}")
+    base_dir = os.sep.join(base_parts) or os.sep
+
+    return base_dir, {
+        "path": os.path.relpath(os.path.abspath(file_path), base_dir),
+        "scenario": scenario,
+        "housing_type": housing_type,
+        "county": county,
+        "service": service,
+        "name": name,
+        "run_id": run_id,
+    }
+
+def get_results_base_dir(directory):
+    """
+    The base directory of a {base_dir}/{scenario}/{housing_type}/{county}/results/{service} directory, else None.
+    """
+    parts = os.path.abspath(directory).split(os.sep)
+    if len(parts) < 6 or parts[-2] != RESULTS_FOLDER_NAME:
+        return None
+
+    return os.sep.join(parts[:-5]) or os.sep
+
+def connect(base_dir):
+    connection = sqlite3.connect(os.path.join(base_dir, RESULTS_INDEX_FILE_NAME), timeout=30) # counties record in parallel
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+
+    return connection
+
+def record_result(file_path, rate_plans=None):
+    """
+    Records a results file that was just written. rate_plans lists the table's columns, e.g. "electricity.PG&E.E-TOU-C".
+    Files outside the results layout, or that were not written, are not indexed. Returns the recorded entry or None.
+    """
+    parsed = parse_results_path(file_path)
+    if parsed is None or not os.path.exists(file_path):
+        return None
+
+    base_dir, entry = parsed
+    entry = {**entry, "rate_plans": json.dumps(list(rate_plans)) if rate_plans is not None else None, "recorded_at": datetime.now().isoformat()}
+
+    connection = connect(base_dir)
+    try:
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results (path, scenario, housing_type, county, service, name, run_id, rate_plans, recorded_at) "
+                "VALUES (:path, :scenario, :housing_type, :county, :service, :name, :run_id, :rate_plans, :recorded_at)",
+                entry,
+            )
+            index_directory(connection, base_dir, os.path.dirname(os.path.abspath(file_path)))
+    finally:
+        connection.close()
+
+    return entry
+
+def get_directory_key(base_dir, directory):
+    return os.path.relpath(os.path.abspath(directory), base_dir)
+
+def index_directory(connection, base_dir, directory):
+    """
+    Brings the catalog of a results directory up to date: indexes its unrecorded files, forgets deleted ones and stores
+    the directory's modification time.
+    """
+    mtime_ns = os.stat(directory).st_mtime_ns # before listing, so a file added meanwhile is picked up by the next lookup
+    scenario, housing_type, county, _, service = os.path.abspath(directory).split(os.sep)[-5:]
+
+    present = {}
+    for file_name in os.listdir(directory):
+        parsed = parse_results_path(os.path.join(directory, file_name))
+        if parsed is not None:
+            present[parsed[1]["path"]] = parsed[1]
+
+    indexed = {
+        row["path"]
+        for row in connection.execute(
+            "SELECT path FROM results WHERE scenario = ? AND housing_type = ? AND county = ? AND service = ?",
+            (scenario, housing_type, county, service),
+        )
+    }
+
+    recorded_at = datetime.now().isoformat()
+    connection.executemany(
+        "INSERT OR IGNORE INTO results (path, scenario, housing_type, county, service, name, run_id, rate_plans, recorded_at) "
+        "VALUES (:path, :scenario, :housing_type, :county, :service, :name, :run_id, NULL, :recorded_at)",
+        [{**entry, "recorded_at": recorded_at} for path, entry in present.items() if path not in indexed],
+    )
+    connection.executemany("DELETE FROM results WHERE path = ?", [(path,) for path in indexed - present.keys()])
+    connection.execute(
+        "INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)",
+        (get_directory_key(base_dir, directory), mtime_ns),
+    )
+
+def get_latest_result(base_dir, scenario, housing_type, county, service, name):
+    """
+    Path of the latest recorded run of a result, or None when none was recorded or its file is gone.
+    """
+    if not os.path.exists(os.path.join(base_dir, RESULTS_INDEX_FILE_NAME)):
+        return None
+
+    connection = connect(base_dir)
+    try:
+        with connection:
+            row = connection.execute(
+                "SELECT path FROM results WHERE scenario = ? AND housing_type = ? AND county = ? AND service = ? AND name = ? "
+                "ORDER BY run_id DESC LIMIT 1",
+                (scenario, housing_type, county, service, name),
+            ).fetchone()
+            if row is None:
+                return None
+
+            file_path = os.path.join(base_dir, row["path"])
+            if os.path.exists(file_path):
+                return file_path
+
+            # Deleted outside of prune_results, forget every run of this result and let the caller rescan
+            connection.execute(
+                "DELETE FROM results WHERE scenario = ? AND housing_type = ? AND county = ? AND service = ? AND name = ?",
+                (scenario, housing_type, county, service, name),
+            )
+            return None
+    finally:
+        connection.close()
+
+def scan_latest_csv_file(directory, prefix):
+    files = [f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".csv")]
+    if not files:
+        raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
+    latest_file = max(files, key=lambda f: extract_timestamp_from_filename(f))
+
+    return os.path.join(directory, latest_file), files
+
+def get_latest_csv_file(directory, prefix):
+    """
+    Returns the path to the latest CSV file in 'directory' whose filename starts with 'prefix'.
+    Results directories are looked up in the results index (scanning them again only when they changed since they were
+    indexed), anything else is scanned.
+    """
+    base_dir = get_results_base_dir(directory)
+    if base_dir is None:
+        return scan_latest_csv_file(directory, prefix)[0]
+
+    scenario, housing_type, county, _, service = os.path.abspath(directory).split(os.sep)[-5:]
+
+    connection = connect(base_dir)
+    try:
+        with connection:
+            indexed = connection.execute(
+                "SELECT mtime_ns FROM directories WHERE path = ?", (get_directory_key(base_dir, directory),)
+            ).fetchone()
+            if indexed is None or indexed["mtime_ns"] != os.stat(directory).st_mtime_ns:
+                index_directory(connection, base_dir, directory)
+
+            rows = connection.execute(
+                "SELECT path FROM results WHERE scenario = ? AND housing_type = ? AND county = ? AND service = ? ORDER BY run_id DESC",
+                (scenario, housing_type, county, service),
+            ).fetchall()
+    finally:
+        connection.close()
+
+    for row in rows:
+        if os.path.basename(row["path"]).startswith(prefix):
+            return os.path.join(base_dir, row["path"])
+
+    raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
+
+def prune_results(base_dir, keep_runs=1):
+    """
+    Deletes all but the keep_runs latest runs of every recorded result, files and catalog entries alike.
+    Returns the paths of the deleted files.
+    """
+    if not os.path.exists(os.path.join(base_dir, RESULTS_INDEX_FILE_NAME)):
+        return []
+
+    connection = connect(base_dir)
+    try:
+        with connection:
+            rows = connection.execute(
+                "SELECT path FROM ("
+                "    SELECT path, ROW_NUMBER() OVER ("
+                "        PARTITION BY scenario, housing_type, county, service, name ORDER BY run_id DESC"
+                "    ) AS run_rank FROM results"
+                ") WHERE run_rank > ?",
+                (keep_runs,),
+            ).fetchall()
+
+            deleted = []
+            for row in rows:
+                file_path = os.path.join(base_dir, row["path"])
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    deleted.append(file_path)
+                connection.execute("DELETE FROM results WHERE path = ?", (row["path"],))
+    finally:
+        connection.close()
+
+    return deleted
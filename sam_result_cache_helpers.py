@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import json
+import os
+import zipfile
+import zlib
+import numpy as np
+import PySAM
+
+from helpers import log
+from pipeline_helpers import hash_file, hash_parameters
+
+# Persistent cache of step 8's SAM results. A county's hourly outputs and system capacities only depend on its weather
+# file, its load profile, the SAM configuration and the PySAM version, so they are stored under a hash of the four as
+# {cache dir}/{key}.npz (compressed arrays) and a rerun with unchanged inputs skips SAM entirely. The cache is kept
+# under a disk quota by evicting the least recently used results; hits and misses of every process are counted in
+# {cache dir}/statistics.json.
+
+SAM_RESULT_CACHE = {
+    "enabled": True,
+    "dir": os.path.join("data", ".cache", "sam_results"),
+    "quota_bytes": 2 * 1024 ** 3,
+}
+STATISTICS_FILE_NAME = "statistics.json"
+
+def get_sam_result_key(weather_file, load_profile, configuration):
+    """
+    Content hash of a county's SAM inputs: the weather file, the hourly load values (which may only live in memory,
+    see handoff_helpers) and the configuration, plus the PySAM version.
+    """
+    digest = hashlib.sha256()
+    digest.update(hash_file(weather_file).encode())
+    digest.update(hashlib.sha256(np.asarray(load_profile, dtype=float).tobytes()).hexdigest().encode())
+    digest.update(hash_parameters(configuration).encode())
+    digest.update(PySAM.__version__.encode())
+
+    return digest.hexdigest()
+
+def get_sam_result_path(key):
+    return os.path.join(SAM_RESULT_CACHE["dir"], f"{key}.npz")
+
+def get_statistics_path():
+    return os.path.join(SAM_RESULT_CACHE["dir"], STATISTICS_FILE_NAME)
+
+def update_statistics(hits=0, misses=0, evictions=0):
+    """
+    Adds to the cache's hit / miss / eviction counters, under a lock since counties run in parallel processes.
+    """
+    os.makedirs(SAM_RESULT_CACHE["dir"], exist_ok=True)
+    statistics_path = get_statistics_path()
+
+    with open(f"{statistics_path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            statistics = load_statistics()
+            statistics["hits"] += hits
+            statistics["misses"] += misses
+            statistics["evictions"] += evictions
+
+            temporary_path = f"{statistics_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(statistics, file, indent=2)
+            os.replace(temporary_path, statistics_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return statistics
+
+def load_statistics():
+    statistics = {"hits": 0, "misses": 0, "evictions": 0}
+    if os.path.exists(get_statistics_path()):
+        try:
+            with open(get_statistics_path()) as file:
+                statistics.update(json.load(file))
+        except ValueError:
+            pass
+
+    return statistics
+
+def get_cache_statistics():
+    """
+    Hit / miss / eviction counts along with the hit rate and the current number and size of cached results.
+    """
+    statistics = load_statistics()
+    cached_results = list_cached_results()
+    lookups = statistics["hits"] + statistics["misses"]
+
+    return {
+        **statistics,
+        "hit_rate": statistics["hits"] / lookups if lookups else None,
+        "entries": len(cached_results),
+        "bytes": sum(size for _, size, _ in cached_results),
+    }
+
+def load_sam_result(key):
+    """
+    The cached outputs {name: array or float} of key, or None (a miss) when they are not cached or unreadable.
+    Unreadable results are deleted, to be simulated and saved again.
+    """
+    path = get_sam_result_path(key)
+
+    try:
+        with np.load(path) as data:
+            outputs = {name: data[name] if data[name].ndim else float(data[name]) for name in data.files}
+    except FileNotFoundError:
+        update_statistics(misses=1)
+        return None
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error) as e:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass # deleted by another county's process
+        log(at="load_sam_result", deleted=path, error=str(e))
+        update_statistics(misses=1)
+        return None
+
+    os.utime(path) # last used, for eviction
+    update_statistics(hits=1)
+
+    return outputs
+
+def save_sam_result(key, outputs):
+    """
+    Stores outputs {name: hourly values or a number} under key and evicts old results if the cache is over its quota.
+    """
+    os.makedirs(SAM_RESULT_CACHE["dir"], exist_ok=True)
+    path = get_sam_result_path(key)
+
+    temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(temporary_path, **{name: np.asarray(values, dtype=float) for name, values in outputs.items()})
+    os.replace(temporary_path, path)
+
+    evict_sam_results(keep=[path])
+
+    return path
+
+def list_cached_results():
+    """
+    (last used, size, path) of every cached result, least recently used first.
+    """
+    if not os.path.isdir(SAM_RESULT_CACHE["dir"]):
+        return []
+
+    cached_results = []
+    for file_name in os.listdir(SAM_RESULT_CACHE["dir"]):
+        if file_name.endswith(".npz") and ".tmp" not in file_name:
+            path = os.path.join(SAM_RESULT_CACHE["dir"], file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue # evicted by another county's process
+            cached_results.append((stat.st_mtime, stat.st_size, path))
+
+    return sorted(cached_results)
+
+def evict_sam_results(quota_bytes=None, keep=()):
+    """
+    Deletes the least recently used results until the cache fits in quota_bytes, never deleting the files in keep.
+    Returns the deleted paths.
+    """
+    quota_bytes = SAM_RESULT_CACHE["quota_bytes"] if quota_bytes is None else quota_bytes
+    keep = {os.path.abspath(path) for path in keep}
+
+    cached_results = list_cached_results()
+    cache_size = sum(size for _, size, _ in cached_results)
+
+    deleted = []
+    for _, size, path in cached_results:
+        if cache_size <= quota_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue # evicted by another county's process
+        cache_size -= size
+        deleted.append(path)
+
+    if deleted:
+        update_statistics(evictions=len(deleted))
+        log(at="evict_sam_results", deleted=len(deleted), cache_bytes=cache_size, quota_bytes=quota_bytes)
+
+    return deleted
@@ -0,0 +1,80 @@
+import numpy as np
+
+from capital_costs_helper import CAPITAL_COSTS, LIFETIMES
+
+# Economics of candidate solar + storage systems: PV size [kW] x number of Powerwalls. Every function takes arrays with
+# one entry per candidate, so a county's whole search grid is priced and ranked in a few vectorized operations.
+# Costs are the capital costs and incentives of the payback maps (capital_costs_helper.calculate_net_system_costs); savings are the annual
+# electricity bill savings of each candidate over the same home without solar + storage.
+
+SIZING = {
+    "objective": "payback", # "payback" (shortest simple payback) or "npv" (highest net present value)
+    "solar_kw": [float(kw) for kw in np.arange(1.0, 15.5, 0.5)],
+    # No solar-only (0 battery) systems: the solarstorage load type always has a battery, which step 11's rate plan
+    # eligibility (electricity_rate_helpers.get_household_technologies) and the storage costs of the payback maps assume
+    "battery_counts": [1, 2, 3],
+    "discount_rate": 0.05, # for the NPV objective
+}
+
+def get_candidate_sizes(solar_kw=None, battery_counts=None):
+    """
+    Flattened search grid: (solar_kw, battery_counts) arrays with one entry per combination.
+    """
+    solar_kw, battery_counts = np.meshgrid(
+        np.asarray(SIZING["solar_kw"] if solar_kw is None else solar_kw, dtype=float),
+        np.asarray(SIZING["battery_counts"] if battery_counts is None else battery_counts, dtype=int),
+        indexing="ij",
+    )
+
+    return solar_kw.ravel(), battery_counts.ravel()
+
+def calculate_payback_periods(net_costs, annual_savings):
+    """
+    Simple payback in years, infinite for candidates that do not save money.
+    """
+    net_costs, annual_savings = np.asarray(net_costs, dtype=float), np.asarray(annual_savings, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(annual_savings > 0, net_costs / annual_savings, np.inf)
+
+def calculate_npvs(net_costs, annual_savings, battery_counts, discount_rate=None):
+    """
+    Net present value over the solar lifetime: discounted savings, less the installed cost and the Powerwalls
+    replaced every storage lifetime (at their price before incentives).
+    """
+    discount_rate = SIZING["discount_rate"] if discount_rate is None else discount_rate
+    years = np.arange(1, LIFETIMES["solar"] + 1)
+    discount_factors = (1 + discount_rate) ** -years
+
+    replacement_years = np.arange(LIFETIMES["storage"], LIFETIMES["solar"], LIFETIMES["storage"])
+    replacement_costs = np.asarray(battery_counts) * CAPITAL_COSTS["storage"]["powerwall_13.5kwh"] * np.sum((1 + discount_rate) ** -replacement_years)
+
+    return np.asarray(annual_savings, dtype=float) * discount_factors.sum() - np.asarray(net_costs, dtype=float) - replacement_costs
+
+def rank_candidates(battery_counts, net_costs, annual_savings, objective=None):
+    """
+    Candidate indices from best to worst for the objective. Payback ties (e.g. when nothing pays back) go to the higher NPV.
+    Returns (indices, paybacks, npvs).
+    """
+    objective = objective or SIZING["objective"]
+    paybacks = calculate_payback_periods(net_costs, annual_savings)
+    npvs = calculate_npvs(net_costs, annual_savings, battery_counts)
+
+    match objective:
+        case "payback":
+            ranked = np.lexsort((-npvs, paybacks))
+        case "npv":
+            ranked = np.argsort(-npvs, kind="stable")
+        case _:
+            raise ValueError(f"Unknown sizing objective: {objective}")
+
+    return ranked, paybacks, npvs
+
+def select_optimal_size(solar_kw, battery_counts, net_costs, annual_savings, objective=None):
+    """
+    Index of the best candidate for the objective (see rank_candidates).
+    Returns (index, {"payback": years, "npv": $} of that candidate).
+    """
+    ranked, paybacks, npvs = rank_candidates(battery_counts, net_costs, annual_savings, objective)
+    best = int(ranked[0])
+
+    return best, {"payback": float(paybacks[best]), "npv": float(npvs[best])}
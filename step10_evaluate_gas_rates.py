@@ -1,17 +1,25 @@
 # PG&E October 2024 Gas Rate Structure
 import os
+import numpy as np
 import pandas as pd
+from functools import lru_cache
 from typing import Any
 
 from helpers import get_counties, get_scenario_path, slugify_county_name, log, to_number, get_timestamp, norcal_counties, socal_counties, central_counties
+from handoff_helpers import intermediate_exists, read_intermediate_csv
+from artifact_helpers import write_results_artifact
+from results_index_helpers import record_result
 from gas_rate_helpers import BASELINE_ALLOWANCES, GAS_RATE_PLANS, PGE_RATE_TERRITORY_COUNTY_MAPPING, SCE_RATE_TERRITORY_COUNTY_MAPPING, SDGE_RATE_TERRITORY_COUNTY_MAPPING
 from utility_helpers import  get_utility_for_county
+from calendar_helpers import GAS_SEASONS_BY_MONTH, HOURS_PER_DAY, HOURS_PER_YEAR, get_calendar_index, get_gas_seasons
 
 INPUT_FILE_NAME = "loadprofiles_for_rates"
 OUTPUT_FILE_NAME = "RESULTS_gas_annual_costs"
 OUTPUT_COLUMNS = ["county", "scenario", "housing_type", "territory", "annual_cost"]
 
 LOAD_FOR_RATE_GAS_COLUMN_SUFFIX = ".gas.therms"
+LOAD_TYPES = ["default", "solarstorage"]
+SPACE_HEATING_WINTER_MONTHS = [11, 12, 1, 2, 3, 4] # customer_charge_space_heating_winter applies Nov-Apr
 
 def utility_to_rate_plans(utility: str) -> dict[str, Any]:
     match utility:
@@ -38,43 +46,93 @@ def utility_to_county_territory_mapping(utility):
 def categorize_season(month_number):
     # TODO, Ana: Make sure that these season categorizations are the same for each utility
     # ie, each peak / offpeak period corresponds to the right seasons here
-    if month_number in [11, 2, 3]:  # November, February, March
-        return 'winter_offpeak'
-    elif month_number in [12, 1]:   # December, January
-        return 'winter_onpeak'
-    elif month_number in range(4, 11):  # April to October (inclusive)
-        return 'summer'
-    else:
+    # Seasons are defined once in calendar_helpers.GAS_SEASONS_BY_MONTH
+    if month_number not in GAS_SEASONS_BY_MONTH:
         raise ValueError(f"Unexpected month provided: {month_number}")  # Fallback, shouldn't happen if months are correct
+    return GAS_SEASONS_BY_MONTH[month_number]
 
-def sum_therms_by_season(gas_data, load_type):
-    gas_data['season'] = gas_data['month'].apply(categorize_season)
-    
-    therms_by_season = gas_data.groupby('season')[f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}"].sum()
-    total_therms = gas_data[f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}"].sum()
-    
-    return therms_by_season, total_therms
+@lru_cache(maxsize=None)
+def compile_gas_rate_plan(utility, rate_plan, territory, space_heating=True):
+    """
+    Compiles a gas rate plan into daily vectors for the analysis year:
+        baseline_allowance (therms/day), daily_charge ($/day), minimum_bill ($/day),
+    plus the baseline and excess volumetric rates ($/therm).
+    space_heating selects the winter customer charge for homes that heat with gas, where the plan has one.
+    """
+    plan_details = GAS_RATE_PLANS[utility][rate_plan]
+    allowances = BASELINE_ALLOWANCES[utility][rate_plan]["territories"][territory]
 
-# TODO, Ana: this currently only works for PG&E rates. Add SCE and SDGE rates too.
-def calculate_annual_costs_gas(load_profile_df, territory, load_type, utility, rate_plan: str) -> float:
-    seasonal_therms, total_therms = sum_therms_by_season(load_profile_df, load_type)
-    
-    total_cost = 0.0
-    
-    for season, therms_used in seasonal_therms.items():
-        # Retrieve the baseline allowance for the season
+    calendar_index = get_calendar_index()
+    day_months = calendar_index["month"][::HOURS_PER_DAY]
+    day_seasons = calendar_index["gas_season"][::HOURS_PER_DAY]
 
-        baseline = BASELINE_ALLOWANCES[utility][rate_plan]["territories"][territory][season]
-        
-        if therms_used <= baseline:
-            rate = GAS_RATE_PLANS[utility][rate_plan]["baseline"]["total_charge"]
-        else:
-            rate = GAS_RATE_PLANS[utility][rate_plan]["excess"]["total_charge"]
-        
-        seasonal_cost = therms_used * rate
-        total_cost += seasonal_cost
-    
-    return total_cost
+    baseline_allowance = np.array([allowances[season] for season in day_seasons], dtype=float)
+
+    daily_charge = np.full(len(day_months), plan_details.get("customer_charge", 0.0))
+    if space_heating and "customer_charge_space_heating_winter" in plan_details:
+        is_space_heating_winter = np.isin(day_months, SPACE_HEATING_WINTER_MONTHS)
+        daily_charge[is_space_heating_winter] = plan_details["customer_charge_space_heating_winter"]
+
+    minimum_bill = np.full(len(day_months), plan_details.get("minimum_bill_per_day", {}).get("non_care", 0.0))
+
+    compiled = {
+        "baseline_allowance": baseline_allowance,
+        "daily_charge": daily_charge,
+        "minimum_bill": minimum_bill,
+    }
+    for value in compiled.values():
+        value.flags.writeable = False
+
+    compiled["baseline_rate"] = plan_details["baseline"]["total_charge"]
+    compiled["excess_rate"] = plan_details["excess"]["total_charge"]
+
+    return compiled
+
+def to_daily_therms(therms_matrix):
+    """
+    Sums a (profiles x hours) matrix of hourly therms, starting at hour 0 of the analysis year, into (profiles x days).
+    """
+    therms_matrix = np.atleast_2d(np.asarray(therms_matrix, dtype=float))
+    num_profiles, num_hours = therms_matrix.shape
+
+    if num_hours > HOURS_PER_YEAR:
+        raise ValueError(f"Gas load profile has {num_hours} hours, expected at most {HOURS_PER_YEAR}")
+
+    padded = np.zeros((num_profiles, HOURS_PER_YEAR))
+    padded[:, :num_hours] = therms_matrix
+
+    return padded.reshape(num_profiles, -1, HOURS_PER_DAY).sum(axis=2)
+
+def bill_gas_matrix(therms_matrix, utility, rate_plan, territory, space_heating=True, num_hours=HOURS_PER_YEAR):
+    """
+    Annual gas cost ($) of every row of a (profiles x hours) matrix of hourly therms.
+
+    Each day's therms are split into baseline and excess volumes against that day's allowance.
+    Customer charges are added per day, and every billing cycle is billed at least the plan's minimum bill.
+    Only the first num_hours hours (and the days they touch) are billed.
+    """
+    tariff = compile_gas_rate_plan(utility, rate_plan, territory, space_heating)
+    daily_therms = to_daily_therms(therms_matrix)
+
+    num_days = -(-num_hours // HOURS_PER_DAY)
+    billed_days = np.arange(daily_therms.shape[1]) < num_days
+
+    baseline_therms = np.minimum(daily_therms, tariff["baseline_allowance"])
+    excess_therms = daily_therms - baseline_therms
+    daily_costs = baseline_therms * tariff["baseline_rate"] + excess_therms * tariff["excess_rate"] + tariff["daily_charge"]
+
+    # The minimum bill is compared against each billing cycle's total
+    day_cycles = get_calendar_index()["billing_cycle"][::HOURS_PER_DAY]
+    day_cycle_matrix = np.eye(day_cycles.max() + 1)[day_cycles] * billed_days[:, None] # (days x cycles)
+    cycle_costs = daily_costs @ day_cycle_matrix
+    cycle_minimums = tariff["minimum_bill"] @ day_cycle_matrix
+
+    return np.maximum(cycle_costs, cycle_minimums).sum(axis=1)
+
+def calculate_annual_costs_gas(load_profile_df, territory, load_type, utility, rate_plan: str, space_heating=True) -> float:
+    therms = load_profile_df[f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}"].to_numpy(dtype=float)
+
+    return float(bill_gas_matrix(therms, utility, rate_plan, territory, space_heating, num_hours=len(therms))[0])
 
 def get_territory_for_county(county, utility):
     # TODO: Ana, establish key-value pair of mapping for all counties to gas rate territories
@@ -90,21 +148,24 @@ def get_territory_for_county(county, utility):
     else:
         raise ValueError(f"County to gas territory mapping not specified for: {county}, {utility}")
 
-def process_county_scenario(scenario_path, county, load_type, utility, rate_plan: str):
+def uses_gas_space_heating(scenario):
+    # Heat pump scenarios move space heating off gas
+    return "heat_pump" not in scenario
+
+def process_county_scenario(scenario_path, county, load_type, utility, rate_plan: str, space_heating=True):
     file = os.path.join(scenario_path, county, f"{INPUT_FILE_NAME}_{county}.csv")
 
-    if not os.path.exists(file):
+    if not intermediate_exists(file):
         log(
             at="step10_evaluate_gas_rates",
             file_not_found=file,
         )
         return None
 
-    load_profile_df = pd.read_csv(file, parse_dates=["timestamp"])
-    load_profile_df["month"] = load_profile_df["timestamp"].dt.month
+    load_profile_df = read_intermediate_csv(file, usecols=[f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}"])
     territory = get_territory_for_county(county, utility)
     
-    return calculate_annual_costs_gas(load_profile_df, territory, load_type=load_type, utility=utility, rate_plan=rate_plan)
+    return calculate_annual_costs_gas(load_profile_df, territory, load_type=load_type, utility=utility, rate_plan=rate_plan, space_heating=space_heating)
 
 def get_output_file_path(base_output_dir, scenario, housing_type, county, timestamp):
     output_path = os.path.join(
@@ -163,8 +224,9 @@ def process(base_input_dir, base_output_dir, scenario, housing_types, counties):
 
             log_kwargs = {}
             for rate_plan in rate_plans:
-                annual_costs = process_county_scenario(scenario_path, county, load_type="default", utility=utility, rate_plan=rate_plan)
-                annual_costs_solarstorage = process_county_scenario(scenario_path, county, load_type="solarstorage", utility=utility, rate_plan=rate_plan)
+                space_heating = uses_gas_space_heating(scenario)
+                annual_costs = process_county_scenario(scenario_path, county, load_type="default", utility=utility, rate_plan=rate_plan, space_heating=space_heating)
+                annual_costs_solarstorage = process_county_scenario(scenario_path, county, load_type="solarstorage", utility=utility, rate_plan=rate_plan, space_heating=space_heating)
                 annual_costs_results = build_results_df(scenario, annual_costs, annual_costs_solarstorage, utility=utility, rate_plan=rate_plan)
 
                 results_df = update_df_with_results(results_df, annual_costs_results)
@@ -177,6 +239,8 @@ def process(base_input_dir, base_output_dir, scenario, housing_types, counties):
             output_file_path = get_output_file_path(base_output_dir, scenario, housing_type, county, timestamp)
             combined_df = update_csv_with_results(output_file_path, results_df)
             combined_df.to_csv(output_file_path, index_label="scenario")
+            record_result(output_file_path, rate_plans=combined_df.columns)
+            write_results_artifact(combined_df, base_output_dir, OUTPUT_FILE_NAME, scenario, housing_type, county)
 
             log(
                 at="step10_evaluate_gas_rates",
@@ -185,6 +249,91 @@ def process(base_input_dir, base_output_dir, scenario, housing_types, counties):
                 saved_to=output_file_path,
             )
 
+def read_county_gas_profiles(scenario_path, county):
+    """
+    Reads the default and solarstorage hourly therms for a county in a single pass.
+    """
+    file = os.path.join(scenario_path, county, f"{INPUT_FILE_NAME}_{county}.csv")
+
+    if not intermediate_exists(file):
+        raise FileNotFoundError(f"File not found: {file}")
+
+    columns = [f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}" for load_type in LOAD_TYPES]
+    df = read_intermediate_csv(file, usecols=columns)
+
+    return {load_type: df[f"{load_type}{LOAD_FOR_RATE_GAS_COLUMN_SUFFIX}"].to_numpy(dtype=float) for load_type in LOAD_TYPES}
+
+def process_batch(base_input_dir, base_output_dir, scenarios, housing_types, counties):
+    """
+    Bills every county, scenario and load type in one array computation per (utility, territory, rate plan).
+    Writes the same per-county results files as process(). cost_service's county pipeline calls it one county at a time.
+    """
+    timestamp = get_timestamp()
+
+    for housing_type in housing_types:
+        profiles = []
+        for scenario in scenarios:
+            scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
+
+            for county in get_counties(scenario_path, counties):
+                utility = get_utility_for_county(county)
+                assert utility is not None, f"Utility not found for county: {county}"
+
+                try:
+                    territory = get_territory_for_county(county, utility)
+                    county_profiles = read_county_gas_profiles(scenario_path, county)
+                except (FileNotFoundError, ValueError) as e:
+                    log(at="step10_evaluate_gas_rates#process_batch", county=county, scenario=scenario, skipped=str(e))
+                    continue
+
+                for load_type, therms in county_profiles.items():
+                    profiles.append({
+                        "county": county,
+                        "utility": utility,
+                        "territory": territory,
+                        "scenario": scenario,
+                        "load_type": load_type,
+                        "space_heating": uses_gas_space_heating(scenario),
+                        "therms": therms,
+                    })
+
+        if not profiles:
+            continue
+
+        annual_costs = {}
+        groups = {(profile["utility"], profile["territory"], profile["space_heating"]) for profile in profiles}
+        for utility, territory, space_heating in groups:
+            rows = [row for row, profile in enumerate(profiles) if (profile["utility"], profile["territory"], profile["space_heating"]) == (utility, territory, space_heating)]
+            num_hours = max(len(profiles[row]["therms"]) for row in rows)
+            therms_matrix = np.zeros((len(rows), num_hours))
+            for i, row in enumerate(rows):
+                therms_matrix[i, :len(profiles[row]["therms"])] = profiles[row]["therms"]
+
+            for rate_plan in utility_to_rate_plans(utility):
+                costs = bill_gas_matrix(therms_matrix, utility, rate_plan, territory, space_heating, num_hours)
+                for row, cost in zip(rows, costs):
+                    annual_costs[(row, rate_plan)] = cost
+
+        for (scenario, county) in dict.fromkeys((profile["scenario"], profile["county"]) for profile in profiles):
+            rows = {profile["load_type"]: row for row, profile in enumerate(profiles) if (profile["scenario"], profile["county"]) == (scenario, county)}
+            utility = profiles[next(iter(rows.values()))]["utility"]
+
+            results_df = pd.DataFrame(index=[scenario, f"{scenario}.solarstorage"])
+            for rate_plan in utility_to_rate_plans(utility):
+                results_df[f"gas.{utility}.{rate_plan}"] = [annual_costs.get((rows.get(load_type), rate_plan)) for load_type in LOAD_TYPES]
+
+            output_file_path = get_output_file_path(base_output_dir, scenario, housing_type, county, timestamp)
+            combined_df = update_csv_with_results(output_file_path, results_df)
+            combined_df.to_csv(output_file_path, index_label="scenario")
+            record_result(output_file_path, rate_plans=combined_df.columns)
+            write_results_artifact(combined_df, base_output_dir, OUTPUT_FILE_NAME, scenario, housing_type, county)
+
+        log(
+            at="step10_evaluate_gas_rates#process_batch",
+            housing_type=housing_type,
+            profiles_billed=len(profiles),
+        )
+
 if __name__ == '__main__':
     base_input_dir = "data/loadprofiles"
     base_output_dir = "data/loadprofiles"
@@ -10,41 +10,55 @@
 
 from datetime import datetime, timedelta
 import os
+import numpy as np
 import pandas as pd
 from collections import defaultdict
 from datetime import datetime, timedelta
 from helpers import get_counties, get_scenario_path, log, to_number, get_timestamp, norcal_counties, socal_counties, central_counties, slugify_county_name
-from electricity_rate_helpers import PGE_RATE_PLANS, SCE_RATE_PLANS, SDGE_RATE_PLANS
+from handoff_helpers import intermediate_exists, read_intermediate_csv
+from artifact_helpers import write_results_artifact
+from results_index_helpers import record_result
+from electricity_rate_helpers import PGE_RATE_PLANS, SCE_RATE_PLANS, SDGE_RATE_PLANS, RATE_PLAN_ELIGIBILITY, DEFAULT_RATE_PLANS, get_household_technologies
+from tariff_helpers import (
+    RATE_PLANS,
+    bill_load_profile,
+    bill_load_matrix,
+    bill_baseline_credits,
+    stack_load_profiles,
+    get_baseline_territory,
+    get_day_type_section,
+)
+from calendar_helpers import get_calendar_index, get_nerc_holidays
+from net_billing_helpers import bill_net_billing
 from utility_helpers import get_utility_for_county
 
 
-RATE_PLANS = {
-    "PG&E": PGE_RATE_PLANS,
-    "SCE": SCE_RATE_PLANS,
-    "SDG&E": SDGE_RATE_PLANS,
-}
-
 INPUT_FILE_NAME = "loadprofiles_for_rates"
 OUTPUT_FILE_NAME = "RESULTS_electricity_annual_costs"
 
 LOAD_FOR_RATE_ELECTRICITY_COLUMN = ".electricity.kwh"
+EXPORT_FOR_RATE_ELECTRICITY_COLUMN = ".electricity.export.kwh" # Only solarstorage profiles export to the grid
+LOAD_TYPES = ["default", "solarstorage"]
+COST_TABLE_COLUMNS = ["county", "utility", "scenario", "load_type", "rate_plan", "annual_cost"]
+
+BEST_RATE_PLAN = "best" # Results column holding the cheapest eligible plan's cost, e.g. electricity.PG&E.best
+BEST_RATE_PLANS_FILE_NAME = "RESULTS_electricity_best_rate_plans"
 
-def get_season(hour_index):
-    start_date = datetime(year=2018, month=1, day=1)  # Consistent with NREL inputs
-    current_datetime = start_date + timedelta(hours=hour_index)
-    month = current_datetime.month
-    return 'summer' if 6 <= month <= 9 else 'winter'
+def get_season(hour_index, utility="PG&E"):
+    # Summer months differ by utility, see calendar_helpers.ELECTRICITY_SUMMER_MONTHS
+    return str(get_calendar_index()["electricity_season"][utility][hour_index])
 
 
 def is_weekend(dt):
-    return dt.weekday() >= 5
+    # Weekends and NERC holidays are both billed at weekend prices
+    return dt.weekday() >= 5 or np.datetime64(dt.date()) in get_nerc_holidays(dt.year)
 
 def select_rate_section(plan_details, season, dt):
     """
     Given a rate plan's details and a season (e.g., "summer" or "winter"),
     select and return the rate section that applies for the given datetime dt.
     
-    If the season's rates are divided into day types (e.g., "weekdays" and "weekend"),
+    If the season's rates are divided into day types (e.g., "weekdays" and "weekends"),
     this function returns the corresponding sub-dictionary; otherwise, it returns
     the season's flat rate configuration.
     """
@@ -52,8 +66,8 @@ def select_rate_section(plan_details, season, dt):
     if not season_rates:
         return None
 
-    if "weekdays" in season_rates or "weekend" in season_rates:
-        return season_rates.get("weekend") if is_weekend(dt) else season_rates.get("weekdays")
+    if "weekdays" in season_rates:
+        return get_day_type_section(season_rates, "weekends" if is_weekend(dt) else "weekdays")
     return season_rates
 
 def get_hourly_rate(rate_section, hour):
@@ -66,60 +80,38 @@ def get_hourly_rate(rate_section, hour):
     else:
         return rate_section["offPeak"]
 
-# TODO: Implement minimum daily charge, baseline credits
-def calculate_annual_costs_electricity(load_profile, utility, rate_plan_name):
+# TODO: Implement minimum daily charge
+def calculate_annual_costs_electricity(load_profile, utility, rate_plan_name, county=None, export_profile=None):
     annual_costs = defaultdict(float)
-    # Now plan_details has a nested structure: season -> {weekdays, weekends}
-    plan_details = RATE_PLANS[utility][rate_plan_name]
-
-    for hour_index, hourly_load in enumerate(load_profile):
-        season = get_season(hour_index)
-        current_datetime = datetime(year=2023, month=1, day=1) + timedelta(hours=hour_index)
-        hour = current_datetime.hour
-
-        # Determine whether the current day is a weekday (Monday-Friday) or weekend (Saturday-Sunday)
-        dayotw_type = "weekdays" # if current_datetime.weekday() < 5 else "weekends"
-
-        # Retrieve the seasonal rates and then the appropriate day type rates
-        season_rates = plan_details.get(season)
-        if not season_rates:
-            continue
-
-        dayotw_rates = season_rates.get(dayotw_type)
-        if not dayotw_rates:
-            continue
-
-        if hour in dayotw_rates.get("peakHours", []):
-            rate = dayotw_rates.get("peak", 0.0)
-        elif "partPeakHours" in dayotw_rates and hour in dayotw_rates.get("partPeakHours", []):
-            rate = dayotw_rates["partPeak"]
-        elif "superOffPeakHours" in dayotw_rates and hour in dayotw_rates.get("superOffPeakHours", []):
-            rate = dayotw_rates["superOffPeak"]
-        else:
-            rate = dayotw_rates.get("offPeak", 0.0)
-
-        # Calculate the cost for the hour
-        energy_cost = hourly_load * rate
-        annual_costs[rate_plan_name] += energy_cost
-
-        # Include fixed charges if available (spread monthly)
-        fixed_charge = dayotw_rates.get("fixedCharge", 0.0)
-        annual_costs[rate_plan_name] += fixed_charge / 12
+    # Baseline credits use the county's baseline territory, and are skipped when no county is given
+    territory = get_baseline_territory(county, utility) if county else None
+
+    if export_profile is not None and np.any(export_profile):
+        # Exports earn export credits under net billing, as in calculate_cost_table
+        load_matrix, hour_mask = stack_load_profiles([load_profile])
+        export_matrix, _ = stack_load_profiles([export_profile])
+        annual_costs[rate_plan_name] = float(bill_net_billing(load_matrix, export_matrix, utility, [rate_plan_name], territory, hour_mask)[0, 0])
+    else:
+        # The rate plan is compiled once into an hourly price vector, then billed with a dot product
+        annual_costs[rate_plan_name] = bill_load_profile(load_profile, utility, rate_plan_name, territory)
 
     return annual_costs
     
 def process_county_scenario(file_path, county, utility, selected_rate_plan, load_type):
     file = os.path.join(file_path, county, f"{INPUT_FILE_NAME}_{county}.csv")
 
-    if not os.path.exists(file):
+    if not intermediate_exists(file):
         raise FileNotFoundError(f"File not found: {file}")
 
     column_name = f"{load_type}{LOAD_FOR_RATE_ELECTRICITY_COLUMN}"
-    df = pd.read_csv(file, usecols=[column_name])
+    export_column_name = f"{load_type}{EXPORT_FOR_RATE_ELECTRICITY_COLUMN}"
+    # Files written before exports were kept have no export column
+    df = read_intermediate_csv(file, usecols=lambda column: column in [column_name, export_column_name])
 
     load_profile = df[column_name].tolist()
+    export_profile = df[export_column_name].to_numpy() if export_column_name in df else None
 
-    return calculate_annual_costs_electricity(load_profile, utility, selected_rate_plan)
+    return calculate_annual_costs_electricity(load_profile, utility, selected_rate_plan, county, export_profile)
 
 def build_results_df(scenario, utility, annual_costs, annual_costs_solarstorage):
     """
@@ -222,6 +214,8 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties):
         output_file_path = get_output_file_path(base_output_dir, scenario, housing_type, county, timestamp)
         combined_df = update_csv_with_results(output_file_path, results_df)
         combined_df.to_csv(output_file_path, index_label="scenario")
+        record_result(output_file_path, rate_plans=combined_df.columns)
+        write_results_artifact(combined_df, base_output_dir, OUTPUT_FILE_NAME, scenario, housing_type, county)
 
         log(
             at="step11_evaluate_electricity_rates",
@@ -231,6 +225,206 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties):
             saved_to=output_file_path,
         )
 
+def read_county_load_profiles(scenario_path, county):
+    """
+    Reads the default and solarstorage electricity load profiles, and any grid exports, for a county in a single pass.
+    Returns {load_type: {"load_profile": ..., "export_profile": ... or None}}.
+    """
+    file = os.path.join(scenario_path, county, f"{INPUT_FILE_NAME}_{county}.csv")
+
+    if not intermediate_exists(file):
+        raise FileNotFoundError(f"File not found: {file}")
+
+    load_columns = {load_type: f"{load_type}{LOAD_FOR_RATE_ELECTRICITY_COLUMN}" for load_type in LOAD_TYPES}
+    export_columns = {load_type: f"{load_type}{EXPORT_FOR_RATE_ELECTRICITY_COLUMN}" for load_type in LOAD_TYPES}
+    # Files written before exports were kept have no export column
+    df = read_intermediate_csv(file, usecols=lambda column: column in [*load_columns.values(), *export_columns.values()])
+
+    return {
+        load_type: {
+            "load_profile": df[load_columns[load_type]].to_numpy(),
+            "export_profile": df[export_columns[load_type]].to_numpy() if export_columns[load_type] in df else None,
+        }
+        for load_type in LOAD_TYPES
+    }
+
+def calculate_cost_table(load_profiles):
+    """
+    Bills a batch of load profiles against every rate plan in one matrix product, less any baseline credits.
+
+    load_profiles is a list of dicts with keys county, utility, scenario, load_type and load_profile,
+    plus an optional export_profile of kWh sent to the grid. Profiles with exports are billed under net billing.
+    Returns a tidy DataFrame with one row per profile and rate plan offered by the profile's utility.
+    """
+    all_rate_plans = [(utility, rate_plan) for utility, rate_plans in RATE_PLANS.items() for rate_plan in rate_plans]
+    plan_utilities = np.array([utility for utility, _ in all_rate_plans])
+    plan_names = np.array([rate_plan for _, rate_plan in all_rate_plans])
+
+    load_matrix, hour_mask = stack_load_profiles([profile["load_profile"] for profile in load_profiles])
+    costs = bill_load_matrix(load_matrix, all_rate_plans, hour_mask) # (profiles x plans)
+
+    export_matrix, _ = stack_load_profiles([
+        profile["export_profile"] if profile.get("export_profile") is not None else [] for profile in load_profiles
+    ])
+    has_exports = export_matrix.any(axis=1)
+
+    # Baseline credits depend on the territory's allowance, so they are billed per (utility, territory) group
+    territories = [get_baseline_territory(profile["county"], profile["utility"]) for profile in load_profiles]
+    for utility, territory in set(zip([profile["utility"] for profile in load_profiles], territories)):
+        rows = np.array([row for row, profile in enumerate(load_profiles) if profile["utility"] == utility and territories[row] == territory])
+        columns = np.flatnonzero(plan_utilities == utility)
+        costs[np.ix_(rows, columns)] -= bill_baseline_credits(load_matrix[rows], utility, plan_names[columns], territory)
+
+        # Rebill profiles that export under net billing, which nets export credits against each billing cycle
+        net_billing_rows = rows[has_exports[rows]]
+        if len(net_billing_rows):
+            costs[np.ix_(net_billing_rows, columns)] = bill_net_billing(
+                load_matrix[net_billing_rows],
+                export_matrix[net_billing_rows],
+                utility,
+                plan_names[columns],
+                territory,
+                hour_mask[net_billing_rows],
+            )
+
+    num_profiles, num_plans = costs.shape
+    profile_keys = pd.DataFrame([{column: profile[column] for column in COST_TABLE_COLUMNS[:4]} for profile in load_profiles])
+
+    cost_table = profile_keys.loc[profile_keys.index.repeat(num_plans)].reset_index(drop=True)
+    cost_table["rate_plan"] = np.tile(plan_names, num_profiles)
+    cost_table["annual_cost"] = costs.ravel()
+
+    # Each profile can only be billed on its own utility's plans
+    compatible = cost_table["utility"].to_numpy() == np.tile(plan_utilities, num_profiles)
+
+    return cost_table[compatible].reset_index(drop=True)[COST_TABLE_COLUMNS]
+
+def cost_table_to_results_df(county_costs, scenario, utility):
+    """
+    Reshapes one county's rows of the tidy cost table into the per-county results layout written by process().
+    """
+    results_df = county_costs.pivot(index="load_type", columns="rate_plan", values="annual_cost")
+    results_df = results_df.reindex(index=LOAD_TYPES, columns=list(RATE_PLANS[utility]))
+    results_df.index = [scenario, f"{scenario}.solarstorage"]
+    results_df.columns = [f"electricity.{utility}.{rate_plan}" for rate_plan in results_df.columns]
+
+    return results_df
+
+def find_best_rate_plans(cost_table, default_rate_plans=DEFAULT_RATE_PLANS):
+    """
+    Picks the cheapest eligible rate plan for every profile in the tidy cost table in one vectorized pass.
+    Returns one row per profile with the best plan, the runner-up, and the savings versus the utility's default plan.
+    """
+    profile_columns = COST_TABLE_COLUMNS[:4]
+    costs_df = cost_table.pivot_table(index=profile_columns, columns="rate_plan", values="annual_cost", sort=False)
+    profiles = costs_df.index.to_frame(index=False)
+    rate_plans = costs_df.columns.to_numpy()
+    costs = costs_df.to_numpy(dtype=float, copy=True) # NaN where a plan is not offered by the profile's utility
+
+    # Mask out restricted plans for households without a qualifying technology
+    technologies = [get_household_technologies(scenario, load_type) for scenario, load_type in zip(profiles["scenario"], profiles["load_type"])]
+    for column, rate_plan in enumerate(rate_plans):
+        required = RATE_PLAN_ELIGIBILITY.get(rate_plan)
+        if required:
+            ineligible = np.array([not (required & household) for household in technologies])
+            costs[ineligible, column] = np.nan
+
+    ranked = np.argsort(np.where(np.isnan(costs), np.inf, costs), axis=1)
+    rows = np.arange(len(costs))
+    has_runner_up = (~np.isnan(costs)).sum(axis=1) > 1
+
+    best_costs = costs[rows, ranked[:, 0]]
+    default_plans = profiles["utility"].map(default_rate_plans)
+    default_costs = costs[rows, costs_df.columns.get_indexer(default_plans)]
+
+    profiles["best_rate_plan"] = rate_plans[ranked[:, 0]]
+    profiles["best_annual_cost"] = best_costs
+    profiles["runner_up_rate_plan"] = np.where(has_runner_up, rate_plans[ranked[:, 1]], None)
+    profiles["runner_up_annual_cost"] = np.where(has_runner_up, costs[rows, ranked[:, 1]], np.nan)
+    profiles["default_rate_plan"] = default_plans
+    profiles["default_annual_cost"] = default_costs
+    profiles["savings_vs_default"] = default_costs - best_costs
+
+    return profiles
+
+def save_best_rate_plans(best_rate_plans, base_output_dir, housing_type, timestamp):
+    """
+    Saves the best rate plan table of each scenario under {scenario}/{housing_type}/RESULTS.
+    """
+    for scenario, scenario_best_rate_plans in best_rate_plans.groupby("scenario", sort=False):
+        output_file_path = os.path.join(base_output_dir, scenario, housing_type, "RESULTS", f"{BEST_RATE_PLANS_FILE_NAME}_{timestamp}.csv")
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        scenario_best_rate_plans.to_csv(output_file_path, index=False)
+
+        log(
+            at="step11_evaluate_electricity_rates#save_best_rate_plans",
+            scenario=scenario,
+            best_rate_plans=scenario_best_rate_plans["best_rate_plan"].value_counts().to_dict(),
+            saved_to=output_file_path,
+        )
+
+def process_batch(base_input_dir, base_output_dir, scenarios, housing_type, counties, write_summary=True):
+    """
+    Bills every county, scenario and load type against every rate plan in one batched operation
+    (cost_service's county pipeline calls it one county at a time).
+    Writes the same per-county results files as process(), plus an electricity.{utility}.best column
+    with the cheapest eligible plan's cost, and (when write_summary is set) the best rate plan table of each scenario.
+    Returns the tidy cost table.
+    """
+    timestamp = get_timestamp()
+    load_profiles = []
+
+    for scenario in scenarios:
+        scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
+
+        for county in get_counties(scenario_path, counties):
+            utility = get_utility_for_county(county)
+            assert utility is not None, f"Utility not found for county: {county}"
+
+            try:
+                county_load_profiles = read_county_load_profiles(scenario_path, county)
+            except FileNotFoundError as e:
+                log(at="step11_evaluate_electricity_rates#process_batch", county=county, scenario=scenario, skipped=str(e))
+                continue
+
+            for load_type, profile in county_load_profiles.items():
+                load_profiles.append({
+                    "county": county,
+                    "utility": utility,
+                    "scenario": scenario,
+                    "load_type": load_type,
+                    **profile,
+                })
+
+    if not load_profiles:
+        return pd.DataFrame(columns=COST_TABLE_COLUMNS)
+
+    cost_table = calculate_cost_table(load_profiles)
+    best_rate_plans = find_best_rate_plans(cost_table)
+    if write_summary:
+        save_best_rate_plans(best_rate_plans, base_output_dir, housing_type, timestamp)
+
+    for (scenario, county), county_costs in cost_table.groupby(["scenario", "county"], sort=False):
+        utility = county_costs["utility"].iloc[0]
+        results_df = cost_table_to_results_df(county_costs, scenario, utility)
+
+        county_best = best_rate_plans[(best_rate_plans["scenario"] == scenario) & (best_rate_plans["county"] == county)]
+        results_df[f"electricity.{utility}.{BEST_RATE_PLAN}"] = county_best.set_index("load_type")["best_annual_cost"].reindex(LOAD_TYPES).to_numpy()
+
+        output_file_path = get_output_file_path(base_output_dir, scenario, housing_type, county, timestamp)
+        combined_df = update_csv_with_results(output_file_path, results_df)
+        combined_df.to_csv(output_file_path, index_label="scenario")
+        record_result(output_file_path, rate_plans=combined_df.columns)
+        write_results_artifact(combined_df, base_output_dir, OUTPUT_FILE_NAME, scenario, housing_type, county)
+
+    log(
+        at="step11_evaluate_electricity_rates#process_batch",
+        profiles_billed=len(load_profiles),
+        rows=len(cost_table),
+    )
+
+    return cost_table
+
 if __name__ == '__main__':
     base_input_dir = "data/loadprofiles"
     base_output_dir = "data/loadprofiles"
@@ -238,4 +432,4 @@ if __name__ == '__main__':
     scenario = "baseline"
     housing_type = "single-family-detached"
 
-    process(base_input_dir, base_output_dir, scenario, housing_type, norcal_counties+socal_counties+central_counties)
\ No newline at end of file
+    process_batch(base_input_dir, base_output_dir, [scenario], housing_type, norcal_counties+socal_counties+central_counties)
\ No newline at end of file
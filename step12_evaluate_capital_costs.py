@@ -2,48 +2,16 @@
 # one entry per county? or by climate zone?
 # first start for all of california and look at the capital cost differences due to the diff sizes of solar and storage
 
-# https://www.tesla.com/learn/solar-panel-cost-breakdown
-CAPITAL_COSTS = {
-    "solar": {
-        "dollars_per_watt": 2.83, # https://www.tesla.com/learn/solar-panel-cost-breakdown
-        "installation_labor": 0.07, # Installation labor makes up around 7% of your total expenses
-        "design_eng_overhead_percent": 0.28, # The design, engineering, project management, processing of approvals, and other overhead account for the remaining 28% of costs. 2 For example, if your final quote is $20,000, the labor cost will be around $1,400 while design, engineering, and processing cost would land around $5,600 (installation costs vary by provider).  
-    },
-    "storage": {
-        "powerwall_13.5kwh": 10748, # Dollars for one powerwall, discount for 2 or more. After $6106 of incentives https://www.tesla.com/powerwall/design/overview
-    },
-    "ev_charging": {
-        "tesla_wall_connector": 1150,
-        "universal_wall_connector": 1350,
-    }
-}
-
 import os
 import pandas as pd
-from datetime import datetime
 from helpers import get_counties, get_scenario_path, to_decimal_number, norcal_counties, socal_counties, central_counties
 from utility_helpers import get_utility_for_county
+from capital_costs_helper import calculate_system_payback_costs
+from results_index_helpers import get_latest_csv_file
 
 # ---------------------------------------------------------------------------
 # Helper functions for file handling and cost data extraction
 # ---------------------------------------------------------------------------
-def extract_timestamp_from_filename(filename):
-    parts = filename.rstrip(".csv").split("_")
-    ts = parts[-2] + "_" + parts[-1]
-
-    return datetime.strptime(ts, "%Y%m%d_%H")
-
-def get_latest_csv_file(directory, prefix):
-    """
-    Returns the path to the latest CSV file in 'directory' whose filename starts with 'prefix'.
-    """
-    files = [f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".csv")]
-
-    if not files:
-        raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
-    latest_file = max(files, key=lambda f: extract_timestamp_from_filename(f))
-    return os.path.join(directory, latest_file)
-
 def load_cost_data(file_path, subfolder, prefix):
     path = os.path.join(file_path, "results", subfolder)
     county = os.path.basename(file_path)
@@ -60,27 +28,20 @@ def load_cost_data(file_path, subfolder, prefix):
 # ---------------------------------------------------------------------------
 # Cost and payback calculation functions
 # ---------------------------------------------------------------------------
-def calculate_system_payback(solar_capacity_kw, dollars_per_watt, annual_savings,
-                             labour_pct, design_pct, storage_cost):
+def calculate_system_payback(solar_capacity_kw, battery_count, annual_savings):
     """
     Calculate the total installation cost and the payback period for a solar+storage system.
 
     Parameters:
       solar_capacity_kw (float): Solar capacity in kilowatts.
-      dollars_per_watt (float): Base cost for solar panels ($/W).
+      battery_count (int): Number of Powerwalls.
       annual_savings (float): Annual electricity cost savings (difference between baseline and solar+storage).
-      labour_pct (float): Additional labor percentage.
-      design_pct (float): Additional design/engineering overhead percentage.
-      storage_cost (float): Cost for storage (e.g., one Powerwall).
 
     Returns:
-      total_cost (float): Total system cost (solar + storage).
+      total_cost (float): Total system cost (solar + storage), see capital_costs_helper.SYSTEM_PAYBACK_COSTS.
       payback_period (float): Payback period in years.
     """
-    # Convert kW to W and calculate base solar panel cost
-    panel_cost = solar_capacity_kw * 1000 * dollars_per_watt
-    solar_total_cost = panel_cost * (1 + labour_pct + design_pct)
-    total_cost = solar_total_cost + storage_cost
+    total_cost = float(calculate_system_payback_costs(solar_capacity_kw, battery_count))
     payback_period = total_cost / annual_savings if annual_savings != 0 else float('inf')
     
     return total_cost, payback_period
@@ -93,8 +54,11 @@ def load_electrified_assets(scenario_path):
     df = pd.read_csv(assets_path)
     if "County" not in df.columns or "Solar Capacity (kW)" not in df.columns:
         raise ValueError("electrified_assets.csv must contain 'County' and 'Solar Capacity (kW)' columns")
-    
-    assets_mapping = df.set_index("County")["Solar Capacity (kW)"].to_dict()
+    if "Battery Count" not in df.columns:
+        df["Battery Count"] = 1 # written before systems were sized with several batteries
+
+    # County -> (solar capacity [kW], number of Powerwalls)
+    assets_mapping = {county: (solar_kw, int(battery_count)) for county, solar_kw, battery_count in zip(df["County"], df["Solar Capacity (kW)"], df["Battery Count"])}
     return assets_mapping
 
 # ---------------------------------------------------------------------------
@@ -127,7 +91,7 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
     scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
     valid_counties = get_counties(scenario_path, counties)
 
-    # Load electrified assets mapping: a dict mapping county -> solar capacity (kW)
+    # Load electrified assets mapping: a dict mapping county -> (solar capacity (kW), battery count)
     assets_mapping = load_electrified_assets(scenario_path)
 
     results = []
@@ -145,7 +109,7 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
             # Look up the solar capacity (kW) for the current county from assets_mapping
             if county not in assets_mapping:
                 raise ValueError(f"Solar capacity data not found for county '{county}' in electrified_assets.csv")
-            solar_capacity_kw = assets_mapping[county]
+            solar_capacity_kw, battery_count = assets_mapping[county]
 
             # Iterate through the desired rate plans for each utility
             utility = get_utility_for_county(county)
@@ -168,21 +132,11 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
             solarstorage_cost = solarstorage_data[col_name]
             annual_savings = baseline_cost - solarstorage_cost
 
-            # Retrieve the solar cost inputs from CAPITAL_COSTS
-            dollars_per_watt = CAPITAL_COSTS["solar"]["dollars_per_watt"]
-            labour_pct = CAPITAL_COSTS["solar"]["installation_labor"]
-            design_pct = CAPITAL_COSTS["solar"]["design_eng_overhead_percent"]
-            
-            # Storage cost as a fixed cost for one Powerwall
-            storage_cost = CAPITAL_COSTS["storage"]["powerwall_13.5kwh"]
-
+            # Solar and battery_count Powerwalls, see capital_costs_helper.SYSTEM_PAYBACK_COSTS
             total_cost, payback_years = calculate_system_payback(
                 solar_capacity_kw,
-                dollars_per_watt,
-                annual_savings,
-                labour_pct,
-                design_pct,
-                storage_cost
+                battery_count,
+                annual_savings
             )
 
             county_results[f"{utility}.{rate_elec}+{rate_gas}.total_cost"] = to_decimal_number(total_cost)
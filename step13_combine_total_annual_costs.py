@@ -3,39 +3,45 @@ import pandas as pd
 from datetime import datetime
 
 from helpers import get_counties, get_scenario_path, log, norcal_counties, socal_counties, central_counties
+from artifact_helpers import read_results_artifact, write_results_artifact
+from results_index_helpers import get_latest_csv_file, record_result
 
 ELECTRICITY_PREFIX = "RESULTS_electricity_annual_costs"
 GAS_PREFIX = "RESULTS_gas_annual_costs"
 TOTALS_PREFIX = "RESULTS_total_annual_costs"
 
-def get_latest_csv_file(directory, prefix):
-    files = [f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".csv")]
-
-    if not files:
-        raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
-    def extract_timestamp(filename):
-        parts = filename.rstrip(".csv").split("_")
-        ts = parts[-2] + "_" + parts[-1]
-        return datetime.strptime(ts, "%Y%m%d_%H")
-    latest = max(files, key=lambda f: extract_timestamp(f))
+def read_results_from_artifacts(county_dir, step, latest_file=None):
+    """
+    The county's latest results table from the artifact store, or None for runs written before it existed and when
+    latest_file, the latest CSV of the same results, is more recent (written by a run without the store).
+    """
+    *base_parts, scenario, housing_type, county = os.path.normpath(county_dir).split(os.sep)
 
-    return os.path.join(directory, latest)
+    return read_results_artifact(os.sep.join(base_parts) or os.curdir, step, scenario, housing_type, county, newer_than=latest_file)
 
-def get_costs_from_electricity(county_dir):
-    elec_dir = os.path.join(county_dir, "results", "electricity")
+def get_latest_costs(county_dir, subfolder, step):
+    """
+    The county's latest results table of a step, from the artifact store unless a more recent CSV exists.
+    """
     county = os.path.basename(county_dir)
-    prefix = f"{ELECTRICITY_PREFIX}_{county}_"
-    latest_file = get_latest_csv_file(elec_dir, prefix)
+    try:
+        latest_file = get_latest_csv_file(os.path.join(county_dir, "results", subfolder), f"{step}_{county}_")
+    except FileNotFoundError:
+        latest_file = None
+
+    costs = read_results_from_artifacts(county_dir, step, latest_file)
+    if costs is not None:
+        return costs
+    if latest_file is None:
+        raise FileNotFoundError(f"No {step} results found for {county_dir}")
 
     return pd.read_csv(latest_file, index_col="scenario")
 
-def get_costs_from_gas(county_dir):
-    gas_dir = os.path.join(county_dir, "results", "gas")
-    county = os.path.basename(county_dir)
-    prefix = f"{GAS_PREFIX}_{county}_"
-    latest_file = get_latest_csv_file(gas_dir, prefix)
+def get_costs_from_electricity(county_dir):
+    return get_latest_costs(county_dir, "electricity", ELECTRICITY_PREFIX)
 
-    return pd.read_csv(latest_file, index_col="scenario")
+def get_costs_from_gas(county_dir):
+    return get_latest_costs(county_dir, "gas", GAS_PREFIX)
 
 def calculate_total_annual_costs(elec_df, gas_df):
     """
@@ -66,6 +72,7 @@ def save_totals(totals_df, output_county_dir, subfolder):
     output_file = os.path.join(totals_dir, file_name)
 
     totals_df.to_csv(output_file, index_label="scenario")
+    record_result(output_file, rate_plans=totals_df.columns)
 
 def process_each_county(county, scenario_path, base_output_dir, scenario, housing_type):
     input_county_dir = os.path.join(scenario_path, county)
@@ -85,6 +92,7 @@ def process_each_county(county, scenario_path, base_output_dir, scenario, housin
 
     save_totals(totals_df, output_county_dir, "totals")
     save_totals(totals_df, output_county_dir, "solarstorage")
+    write_results_artifact(totals_df, base_output_dir, TOTALS_PREFIX, scenario, housing_type, county)
 
 def process(base_input_dir, base_output_dir, scenario, housing_types, counties):
     for housing_type in housing_types:
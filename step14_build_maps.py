@@ -5,8 +5,8 @@ import geopandas as gpd
 import folium
 import requests
 from zipfile import ZipFile
-from datetime import datetime
 from helpers import get_counties, get_scenario_path, log, to_decimal_number, norcal_counties, central_counties, socal_counties
+from results_index_helpers import get_latest_csv_file
 
 def download_and_extract_shapefile():
     url = "https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_county_20m.zip"
@@ -30,20 +30,6 @@ def initialize_map():
 
     return gdf
 
-def extract_timestamp_from_filename(filename):
-    parts = filename.rstrip(".csv").split("_")
-    ts = parts[-2] + "_" + parts[-1]
-
-    return datetime.strptime(ts, "%Y%m%d_%H")
-
-def get_latest_csv_file(directory, prefix):
-    files = [f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".csv")]
-    if not files:
-        raise FileNotFoundError(f"No file found in {directory} with prefix {prefix}")
-    latest_file = max(files, key=lambda f: extract_timestamp_from_filename(f))
-
-    return os.path.join(directory, latest_file)
-
 def load_cost_data(county_dir, subfolder, prefix):
     path = os.path.join(county_dir, "results", subfolder)
     county = os.path.basename(county_dir)
@@ -4,109 +4,10 @@ import geopandas as gpd
 from helpers import get_counties, get_scenario_path, slugify_county_name, norcal_counties, socal_counties, central_counties, log
 from utility_helpers import get_utility_for_county
 from maps_helpers import initialize_map, get_latest_csv_file
-from capital_costs_helper import LIFETIMES, build_metric_map
-
-
-CAPITAL_COSTS = {
-    "solar": {
-        # Back-calculated from PG&E's cost estimator website: https://pge.wattplan.com/PV/Wizard/?sector=residential&
-        # https://www.energysage.com/local-data/solar-panel-cost/ca/
-        "dollars_per_watt": 2.8,          # $/W for panels https://www.tesla.com/learn/solar-panel-cost-breakdown
-        "installation_labor": 0,         # 7% extra cost for labor
-        "design_eng_overhead_percent": 0 # 28% extra cost for design/engineering
-    },
-    "storage": {
-        # Other papers suggest: 1200–$1600 per kilowatt-hour which would = $16320 - $21600 https://www.mdpi.com/2071-1050/16/23/10320#:~:text=residential%20solar%20and%20BESS%2C%20the,6%2FWh%20in%20Texas%20%28Figure%203d
-        # https://energylibrary.tesla.com/docs/Public/EnergyStorage/Powerwall/3/Datasheet/en-us/Powerwall-3-Datasheet.pdf
-        # https://www.solarreviews.com/blog/is-the-tesla-powerwall-the-best-solar-battery-available?utm_source=chatgpt.com
-        # https://www.selfgenca.com/home/program_metrics/
-        "powerwall_13.5kwh": 16853          # $16853 Cost for one Tesla Powerwall 3 before incentives. https://www.tesla.com/powerwall/design/overview
-    },
-    "heat_pump": {
-        # Rewiring america: $19,000 https://www.rewiringamerica.org/research/home-electrification-cost-estimates
-        # "average": 19000, # https://www.nrel.gov/docs/fy24osti/84775.pdf#:~:text=dwelling%20units,9%2C000%2C%20%2420%2C000%2C%20and%20%2424%2C000%20for
-        # https://incentives.switchison.org/residents/incentives?state=CA&field_zipcode=90001&_gl=1*1ck7fcj*_gcl_au*OTAxNTQyNjA3LjE3NDQ1NjYxNzg.*_ga*MTEwMTk5ODQ0LjE3NDQ1NjYxNzg.*_ga_8NM1W0PLNN*MTc0NDU2NjE3OC4xLjEuMTc0NDU2NjIwNC4zNC4wLjA.
-        # E3 cites single family residential heat pump cost to be $19,000 https://www.ethree.com/wp-content/uploads/2023/12/E3_Benefit-Cost-Analysis-of-Targeted-Electrification-and-Gas-Decommissioning-in-California.pdf#:~:text=%2419k%20%2415k%20%24154k%20The%20significant,commercial%20customers%20and%20therefore%20see
-        "average": 19000,
-    },
-    "induction_stove": {
-        # PG&E appliance guide also says $2000 https://guide.pge.com/browse/induction
-        "average": 2000 # https://www.sce.com/factsheet/InductionCookingFactSheet
-    },
-    "water_heater": { # 55 gal
-        "average": 2637,
-    }
-}
-
-INCENTIVES = {
-    "federal_tax_credit_2023_2032": 0.3, # 30% credit https://www.irs.gov/credits-deductions/residential-clean-energy-credit
-    # Federal tax incentives will decline in later years
-    "federal_tax_credit_2033": 0.26,
-    "federal_tax_credit_2034": 0.22,
-    "federal_tax_credit_2035": 0,
-    "PGE_SCE_SDGE_General_SGIP_Rebate": 2025, #  General Market SGIP rebate of
-        # approximately $150/kilowatt-hour https://www.cpuc.ca.gov/-/media/cpuc-website/files/uploadedfiles/cpucwebsite/content/news_room/newsupdates/2020/sgip-residential-web-120420.pdf
-    "storage": {
-        # "PG&E": {
-            # "storage_rebate": 7500, # Only for homes in wildfire-prone areas, as deemed by PG&E https://www.tesla.com/support/incentives#california-local-incentives
-        # },
-        # "SCE": {
-
-        # },
-        # "SDG&E": {
-        #     # https://www.sdge.com/solar/considering-solar
-        # }
-    },
-    "heat_pump": {
-        "other_rebates": 0, # 9500, # 9500, # 15200, # 10000, # needed to make it worthwhile
-        "max_federal_annual_tax_rebate": 2000, # 2000,
-        "california_TECH_incentive": 1500, #1500, # https://incentives.switchison.org/rebate-profile/tech-clean-california-single-family-hvac
-    },
-    "induction_stove": {
-        "max_federal_annual_tax_rebate": 420, # 420, # 1000, # 420, # https://www.geappliances.com/inflation-reduction-act
-    },
-    "water_heater": {
-        "max_federal_annual_tax_rebate": 2000,
-        "45-55gal": 700, # $700 rebate
-        # "55-75gal": 900 # $900 rebate https://incentives.switchison.org/residents/incentives?state=CA&field_zipcode=90001&_gl=1*1ck7fcj*_gcl_au*OTAxNTQyNjA3LjE3NDQ1NjYxNzg.*_ga*MTEwMTk5ODQ0LjE3NDQ1NjYxNzg.*_ga_8NM1W0PLNN*MTc0NDU2NjE3OC4xLjEuMTc0NDU2NjIwNC4zNC4wLjA.
-    },
-}
-
-# NO INCENTIVES
-# INCENTIVES = {
-#     "federal_tax_credit_2023_2032": 0, # 30% credit https://www.irs.gov/credits-deductions/residential-clean-energy-credit
-#     # Federal tax incentives will decline in later years
-#     "federal_tax_credit_2033": 0,
-#     "federal_tax_credit_2034": 0,
-#     "federal_tax_credit_2035": 0,
-#     "PGE_SCE_SDGE_General_SGIP_Rebate": 0, #  General Market SGIP rebate of
-#         # approximately $150/kilowatt-hour https://www.cpuc.ca.gov/-/media/cpuc-website/files/uploadedfiles/cpucwebsite/content/news_room/newsupdates/2020/sgip-residential-web-120420.pdf
-#     "storage": {
-#         # "PG&E": {
-#             # "storage_rebate": 7500, # Only for homes in wildfire-prone areas, as deemed by PG&E https://www.tesla.com/support/incentives#california-local-incentives
-#         # },
-#         # "SCE": {
-
-#         # },
-#         # "SDG&E": {
-#         #     # https://www.sdge.com/solar/considering-solar
-#         # }
-#     },
-#     "heat_pump": {
-#         "other_rebates": 0, # 9500, # 9500, # 15200, # 10000, # needed to make it worthwhile
-#         "max_federal_annual_tax_rebate": 0, # 2000,
-#         "california_TECH_incentive": 0, #1500, # https://incentives.switchison.org/rebate-profile/tech-clean-california-single-family-hvac
-#     },
-#     "induction_stove": {
-#         "max_federal_annual_tax_rebate": 0, # 420, # 1000, # 420, # https://www.geappliances.com/inflation-reduction-act
-#     },
-#     "water_heater": {
-#         "max_federal_annual_tax_rebate": 0,
-#         "45-55gal": 0, # $700 rebate
-#         # "55-75gal": 900 # $900 rebate https://incentives.switchison.org/residents/incentives?state=CA&field_zipcode=90001&_gl=1*1ck7fcj*_gcl_au*OTAxNTQyNjA3LjE3NDQ1NjYxNzg.*_ga*MTEwMTk5ODQ0LjE3NDQ1NjYxNzg.*_ga_8NM1W0PLNN*MTc0NDU2NjE3OC4xLjEuMTc0NDU2NjIwNC4zNC4wLjA.
-#     },
-#     # "whole_building_electrification": 4250 # must include heat pump space heating, heat pump water heating, induction cooking, electric dryer https://caenergysmarthomes.com/alterations/#whole-building-eligibility
-# }
+from capital_costs_helper import CAPITAL_COSTS, INCENTIVES, LIFETIMES, build_metric_map, calculate_net_system_costs
+from artifact_helpers import RESULTS_INDEX_COLUMN, read_artifacts
+
+TOTALS_PREFIX = "RESULTS_total_annual_costs"
 
 def apply_incentives(total_cost, utility):
     total_cost_after_incentives = total_cost * (1 - INCENTIVES["federal_tax_credit_2023_2032"]) - INCENTIVES["PGE_SCE_SDGE_General_SGIP_Rebate"] # 30% federal incentive, and $250/kwh SGIP rebate
@@ -130,22 +31,11 @@ def load_electrified_assets(scenario_path):
     df = pd.read_csv(assets_path)
     if "County" not in df.columns or "Solar Capacity (kW)" not in df.columns:
         raise ValueError("CSV must contain 'County' and 'Solar Capacity (kW)' columns")
-    
-    return df.set_index("County")["Solar Capacity (kW)"].to_dict()
-
-def calculate_solar_storage_cost(solar_kw, dollars_per_watt, labour_pct, design_pct, storage_cost):
-    panel_cost = solar_kw * 1000 * dollars_per_watt
-    solar_total_cost = panel_cost * (1 + labour_pct + design_pct)
-    total_cost = solar_total_cost + storage_cost
-    return total_cost, solar_total_cost
+    if "Battery Count" not in df.columns:
+        df["Battery Count"] = 1 # written before systems were sized with several batteries
 
-def apply_solar_storage_incentives(cost, utility):
-    cost *= (1 - INCENTIVES["federal_tax_credit_2023_2032"])
-    cost -= INCENTIVES["PGE_SCE_SDGE_General_SGIP_Rebate"]
-
-    if utility in INCENTIVES["storage"]:
-        cost -= INCENTIVES["storage"][utility]["storage_rebate"]
-    return cost
+    # County -> (solar capacity [kW], number of Powerwalls)
+    return {county: (solar_kw, int(battery_count)) for county, solar_kw, battery_count in zip(df["County"], df["Solar Capacity (kW)"], df["Battery Count"])}
 
 def calculate_heat_pump_cost():
     base_cost = CAPITAL_COSTS["heat_pump"]["average"]
@@ -174,7 +64,8 @@ def evaluate_custom_combo(
     water_heater_tank_size: str,
     solar_kw: float,
     annual_savings: float,
-    utility: str
+    utility: str,
+    battery_count: int = 1
 ) -> dict:
     """
     Evaluate total capital cost, annual savings, and payback period for a flexible combination
@@ -189,6 +80,7 @@ def evaluate_custom_combo(
         solar_kw (float): Solar system size (in kW)
         annual_savings (float): Expected annual utility bill savings
         utility (str): Utility provider ("PG&E", "SCE", etc.)
+        battery_count (int): Number of Powerwalls of the solar + storage system
     
     Returns:
         dict: {
@@ -203,14 +95,7 @@ def evaluate_custom_combo(
     lifetimes = []
 
     if include_solar:
-        base_solar_cost, _ = calculate_solar_storage_cost(
-            solar_kw,
-            CAPITAL_COSTS["solar"]["dollars_per_watt"],
-            CAPITAL_COSTS["solar"]["installation_labor"],
-            CAPITAL_COSTS["solar"]["design_eng_overhead_percent"],
-            CAPITAL_COSTS["storage"]["powerwall_13.5kwh"]
-        )
-        solar_cost_after_incentives = apply_solar_storage_incentives(base_solar_cost, utility)
+        solar_cost_after_incentives = float(calculate_net_system_costs(solar_kw, battery_count, utility))
         print("Solar cost: ", solar_cost_after_incentives)
         total_cost += solar_cost_after_incentives
         components["solar_storage"] = solar_cost_after_incentives
@@ -262,6 +147,28 @@ def flags_from_scenario(scenario: str) -> dict[str, bool]:
         "include_water_heater":  "water_heating"   in s,
     }
 
+def load_total_annual_costs(base_input_dir, scenarios, housing_type, counties):
+    """
+    Reads every county's total annual costs in one scan of the artifact store's partitions.
+    Returns {(scenario, county): totals table indexed by scenario row}.
+    """
+    totals = read_artifacts(base_input_dir, TOTALS_PREFIX, scenario=scenarios, housing_type=housing_type, county=counties)
+
+    return {
+        (scenario, county): county_totals.drop(columns=["scenario", "housing_type", "county"]).set_index(RESULTS_INDEX_COLUMN).rename_axis("scenario")
+        for (scenario, county), county_totals in totals.groupby(["scenario", "county"])
+    }
+
+def get_total_annual_costs(statewide_totals, base_input_dir, scenario, housing_type, county, subfolder):
+    """
+    A county's totals table, from the statewide scan or else from its latest results CSV.
+    """
+    if (scenario, county) in statewide_totals:
+        return statewide_totals[(scenario, county)]
+
+    directory = os.path.join(base_input_dir, scenario, housing_type, county, "results", subfolder)
+    return pd.read_csv(get_latest_csv_file(directory, f"{TOTALS_PREFIX}_{county}_"), index_col="scenario")
+
 def process(base_input_dir, base_output_dir, scenario, housing_type, counties, desired_rate_plans):
     """
     Constructs three individual maps (for payback period, total cost, and annual savings) based on the solar+storage system economics.
@@ -285,6 +192,7 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
     scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
     valid_counties = get_counties(scenario_path, counties)
     assets_mapping = load_electrified_assets(scenario_path)
+    statewide_totals = load_total_annual_costs(base_input_dir, ["baseline", scenario], housing_type, [slugify_county_name(county) for county in valid_counties])
     
     records = []
     for county in valid_counties:
@@ -297,21 +205,15 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
         try:
             # === Load annual costs ===
             # 1. Baseline (no heat pump, no solar)
-            baseline_dir = os.path.join(base_input_dir, "baseline", housing_type, county, "results", "totals")
-            baseline_path = get_latest_csv_file(baseline_dir, f"RESULTS_total_annual_costs_{county_slug}_")
-            baseline_df = pd.read_csv(baseline_path, index_col="scenario")
+            baseline_df = get_total_annual_costs(statewide_totals, base_input_dir, "baseline", housing_type, county_slug, "totals")
             baseline_cost = baseline_df.loc["baseline", cost_column]
 
             # 2. Heat pump only
-            hp_dir = os.path.join(base_input_dir, scenario, housing_type, county, "results", "totals")
-            hp_path = get_latest_csv_file(hp_dir, f"RESULTS_total_annual_costs_{county_slug}_")
-            hp_df = pd.read_csv(hp_path, index_col="scenario")
+            hp_df = get_total_annual_costs(statewide_totals, base_input_dir, scenario, housing_type, county_slug, "totals")
             hp_cost = hp_df.loc[scenario, cost_column]
 
             # 3. Heat pump + solar
-            hp_solar_dir = os.path.join(base_input_dir, scenario, housing_type, county, "results", "solarstorage")
-            hp_solar_path = get_latest_csv_file(hp_solar_dir, f"RESULTS_total_annual_costs_{county_slug}_")
-            hp_solar_df = pd.read_csv(hp_solar_path, index_col="scenario")
+            hp_solar_df = get_total_annual_costs(statewide_totals, base_input_dir, scenario, housing_type, county_slug, "solarstorage")
             hp_solar_cost = hp_solar_df.loc[f"{scenario}.solarstorage", cost_column]
 
             # === Annual savings relative to true baseline ===
@@ -334,13 +236,14 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
                 print(f"Missing solar capacity for {county}; skipping solar combo.")
                 continue
 
-            solar_kw = assets_mapping[county]
+            solar_kw, battery_count = assets_mapping[county]
             results_hp_solar = evaluate_custom_combo(
                 include_solar=True,
                 water_heater_tank_size="45-55gal",
                 solar_kw=solar_kw,
                 annual_savings=savings_hp_solar,
                 utility=utility,
+                battery_count=battery_count,
                 **combo_flags
             )
 
@@ -371,6 +274,7 @@ def process(base_input_dir, base_output_dir, scenario, housing_type, counties, d
             "Annual Savings (Electrification Only)": results_hp_only["annual_savings"],
             "Total Cost (Electrification Only)": results_hp_only["capital_cost"],
             "Solar Size (kW)": solar_kw,
+            "Battery Count": battery_count,
             "Payback Period (Electrification + Solar + Storage)": results_hp_solar["payback_period"],
             "Lifetime Limit (Electrification + Solar + Storage)": results_hp_solar["min_lifetime"],
             "Annual Savings (Electrification + Solar + Storage)": results_hp_solar["annual_savings"],
@@ -1,7 +1,11 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
 import os
 import re
 from helpers import LOADPROFILES, slugify_county_name, log, norcal_counties, socal_counties, central_counties
+from pipeline_helpers import hash_file
 
 # Metadata downloaded from:
 # 2024 edition of Resstock_AMY2018_release_2
@@ -40,36 +44,123 @@ HOUSING_NAME_MAP = {
 
 SPECIAL_CASE_COUNTIES = ["Inyo County"]
 
-def get_metadata(scenario):
-    metadata_path = os.path.join(
+# Columns every metadata lookup needs, on top of the columns SCENARIOS filter on
+METADATA_KEY_COLUMNS = ["bldg_id", "upgrade", "in.county", "in.county_name", "in.geometry_building_type_recs"]
+METADATA_CACHE_FOLDER_NAME = ".cache"
+METADATA_CACHE_KEY = b"metadata_cache_key" # Parquet schema metadata entry holding the source file's stamp
+BUILDING_COUNTS_FILE_NAME = "step1_building_counts.csv"
+
+def get_metadata_path():
+    return os.path.join(
         "data",
         f"CA_metadata_and_annual_results.csv"
     )
-    
+
+def get_metadata_columns():
+    scenario_columns = [column for scenario_filters in SCENARIOS.values() for column in scenario_filters]
+    special_case_columns = [
+        column
+        for conditions in SPECIAL_COUNTIES_CONDITIONS_NEEDED_TO_RETURN_AT_LEAST_ONE_BUILDING.values() if isinstance(conditions, dict)
+        for column in conditions
+    ]
+
+    return list(dict.fromkeys(METADATA_KEY_COLUMNS + scenario_columns + special_case_columns))
+
+def get_metadata_cache_path(metadata_path):
+    file_name = os.path.splitext(os.path.basename(metadata_path))[0]
+
+    return os.sep.join([os.path.dirname(metadata_path) or os.curdir, METADATA_CACHE_FOLDER_NAME, f"{file_name}.parquet"])
+
+def get_metadata_cache_key(metadata_path, sha256=None):
+    stat = os.stat(metadata_path)
+
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "columns": get_metadata_columns()}
+
+def load_cached_metadata(metadata_path):
+    """
+    Reads the Parquet copy of the metadata, or returns None when it is missing or stale.
+    The cache is valid while the source file's size and mtime are unchanged, or when its content hash still matches.
+    """
+    if not os.path.exists(metadata_path):
+        return None
+
+    cache_path = get_metadata_cache_path(metadata_path)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        cached_key = json.loads((pq.read_schema(cache_path).metadata or {}).get(METADATA_CACHE_KEY, b"{}"))
+    except (pa.ArrowInvalid, OSError, ValueError):
+        return None # unreadable, rebuild it
+    source_key = get_metadata_cache_key(metadata_path, cached_key.get("sha256"))
+
+    if cached_key.get("columns") != source_key["columns"]:
+        return None
+
+    if [cached_key.get("size"), cached_key.get("mtime_ns")] != [source_key["size"], source_key["mtime_ns"]]:
+        # Touched or copied, only reuse the cache when the content is unchanged
+        if cached_key.get("sha256") != hash_file(metadata_path):
+            return None
+
+    return pd.read_parquet(cache_path)
+
+def save_metadata_cache(metadata, metadata_path):
+    """
+    Keeps the columns step 1 filters on, stores text columns as categoricals and writes them next to the source file.
+    Returns the cached frame.
+    """
+    columns = [column for column in get_metadata_columns() if column in metadata.columns]
+    metadata = metadata[columns].copy()
+
+    for column in metadata.select_dtypes(include=["object", "string"]).columns:
+        values = metadata[column]
+        metadata[column] = values.where(values.isna(), values.astype(str)).astype("category")
+
+    cache_path = get_metadata_cache_path(metadata_path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    table = pa.Table.from_pandas(metadata, preserve_index=False)
+    cache_key = get_metadata_cache_key(metadata_path, hash_file(metadata_path))
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_CACHE_KEY: json.dumps(cache_key).encode()})
+
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    pq.write_table(table, temporary_path)
+    os.replace(temporary_path, cache_path)
+
+    return metadata.reset_index(drop=True)
+
+def get_metadata(scenario):
+    metadata_path = get_metadata_path()
+
+    metadata = load_cached_metadata(metadata_path)
+    if metadata is not None:
+        log(at="step1_identify_suitable_buildings", message="metadata read from cache", rows=len(metadata))
+        return metadata
+
     try:
         metadata = pd.read_csv(metadata_path, low_memory=False)
     except FileNotFoundError:
         raise FileNotFoundError(f"Metadata file not found at {metadata_path}")
-    
+
+    if os.path.exists(metadata_path):
+        metadata = save_metadata_cache(metadata, metadata_path)
+        log(at="step1_identify_suitable_buildings", message="metadata cached", path=get_metadata_cache_path(metadata_path), columns=len(metadata.columns))
+
     return metadata
 
-def filter_metadata(metadata, housing_type, county_code, county_name, scenario):
+def get_scenario_conditions(metadata, scenario):
+    """
+    Boolean mask of the baseline (no upgrade) buildings that match every filter of the scenario.
+    """
     # Only need new metadata filters for baseline
     # Because we are doing an apples-to-apples comparison
     # So we have to be converting existing buildings via thermo / phyiscs properties
-    
-# Initial conditions based on upgrade, county and housing type
-    upgrade = (metadata["upgrade"] == 0) # baseline, no housing upgrades
-    county_condition = metadata["in.county"] == county_code
-    county_name_condition = metadata["in.county_name"] == county_name
-    housing_condition = metadata["in.geometry_building_type_recs"] == HOUSING_NAME_MAP[housing_type]
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Scenario not defined: {scenario}")
 
-    # Combine initial conditions using bitwise AND
-    conditions = upgrade & county_condition & county_name_condition & housing_condition
+    conditions = (metadata["upgrade"] == 0) # baseline, no housing upgrades
 
-    scenario_filters = SCENARIOS[scenario]
-
-    for column, condition in scenario_filters.items():
+    for column, condition in SCENARIOS[scenario].items():
         if condition is None:
             conditions &= metadata[column].isna()
         elif isinstance(condition, list):
@@ -77,11 +168,43 @@ def filter_metadata(metadata, housing_type, county_code, county_name, scenario):
         else:
             conditions &= (metadata[column] == condition)
 
-        filtered_count = metadata[conditions].shape[0]
+    return conditions
+
+def filter_metadata(metadata, housing_type, county_code, county_name, scenario):
+    county_condition = metadata["in.county"] == county_code
+    county_name_condition = metadata["in.county_name"] == county_name
+    housing_condition = metadata["in.geometry_building_type_recs"] == HOUSING_NAME_MAP[housing_type]
+
+    conditions = get_scenario_conditions(metadata, scenario) & county_condition & county_name_condition & housing_condition
+
+    return metadata[conditions]
+
+def group_metadata_by_county(metadata, scenario, housing_types):
+    """
+    Applies the scenario filters once over the whole frame and splits the matching buildings by county and housing type.
+    Returns {(county code, county name, housing type): filtered metadata}, counties without matches are left out.
+    """
+    housing_types_by_name = {HOUSING_NAME_MAP[housing_type]: housing_type for housing_type in housing_types}
+    housing_condition = metadata["in.geometry_building_type_recs"].isin(list(housing_types_by_name))
+    filtered_metadata = metadata[get_scenario_conditions(metadata, scenario) & housing_condition]
+
+    groups = filtered_metadata.groupby(["in.county", "in.county_name", "in.geometry_building_type_recs"], observed=True, sort=False)
+
+    return {
+        (county_code, county_name, housing_types_by_name[building_type]): group
+        for (county_code, county_name, building_type), group in groups
+    }
+
+def save_building_counts(building_counts, output_dir):
+    """
+    Side table of the number of matching buildings per county, e.g. to spot counties without any.
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
-    filtered_metadata = metadata[conditions]
+    output_csv_path = os.path.join(output_dir, BUILDING_COUNTS_FILE_NAME)
+    pd.DataFrame(building_counts, columns=["county", "county_name", "num_buildings"]).to_csv(output_csv_path, index=False)
 
-    return filtered_metadata
+    return output_csv_path
 
 def save_building_ids(filtered_metadata, scenario, county, output_dir):
     os.makedirs(output_dir, exist_ok=True)
@@ -103,20 +226,14 @@ def save_building_ids(filtered_metadata, scenario, county, output_dir):
     
     return output_csv_path
 
-def get_metadata_for_counties_including_special_case_counties(metadata, housing_type, county_code, county_name, scenario):
-    # if county_name in SPECIAL_CASE_COUNTIES:
-    #     print("inside the special case")
-    #     special_conditions = SPECIAL_COUNTIES_CONDITIONS_NEEDED_TO_RETURN_AT_LEAST_ONE_BUILDING[county_name]
-    #     print(special_conditions)
-
-    #     return filter_metadata(metadata, housing_type, county_code, county_name, special_conditions)
-    # else:
-        return filter_metadata(metadata, housing_type, county_code, county_name, scenario)
-
-def process(scenario, housing_type, output_base_dir="data", target_counties=None, force_recompute=True):
+def process_housing_types(scenario, housing_types, output_base_dir="data", target_counties=None, force_recompute=True):
+    """
+    Writes every county's building ids for every housing type from a single pass over the metadata.
+    Returns {housing type: output csv paths}.
+    """
     if scenario != "baseline":
         log(at="step1_identify_suitable_buildings", message="not baseline scenario, no need to download new files", scenario=scenario)
-        return [] # Early return; we only need to filter metadata for baseline -- for all other runs, use baseline metadata and buildings, and convert them using thermo properties
+        return {housing_type: [] for housing_type in housing_types} # Early return; we only need to filter metadata for baseline -- for all other runs, use baseline metadata and buildings, and convert them using thermo properties
 
     metadata = get_metadata(scenario)
     unique_counties = metadata[['in.county', 'in.county_name']].drop_duplicates()
@@ -126,46 +243,56 @@ def process(scenario, housing_type, output_base_dir="data", target_counties=None
     else:
         counties = unique_counties
 
-    output_csv_paths = []
-    processed_count = 0
-    skipped_count = 0
-    total_buildings = 0
-
-    for _, row in counties.iterrows():
-        county_code = row['in.county']
-        county_name = row['in.county_name']
-
-        formatted_county_name = slugify_county_name(county_name)
-        output_dir = os.path.join(output_base_dir, scenario, housing_type, formatted_county_name)
-        output_csv = os.path.join(output_dir, "step1_filtered_building_ids.csv")
-
-         # Step 1: Check if processing is necessary
-        if not force_recompute:
-            output_csv_paths.append(output_csv)
-            skipped_count += 1
-            continue  # Skip processing
-
-        # Step 2: Generate metadata
-        filtered_metadata = get_metadata_for_counties_including_special_case_counties(metadata, housing_type, county_code, county_name, scenario)
-        # filtered_metadata = filter_metadata(metadata, housing_type, county_code, county_name, scenario)
-        num_buildings = filtered_metadata.shape[0]
-        total_buildings += num_buildings
-
-        # Step 3: Save building IDs
-        output_csv = save_building_ids(filtered_metadata, scenario, county_name, output_dir)
-        output_csv_paths.append(output_csv)
-        processed_count += 1
-
-    log(
-        step=1,
-        title="identify suitable buildings",
-        num_counties_processed=len(output_csv_paths),
-        total_csv_files_generated=len(output_csv_paths),
-        counties_processed=processed_count,
-        counties_skipped=skipped_count
-    )
+    groups = group_metadata_by_county(metadata, scenario, housing_types) if force_recompute else {}
+    no_buildings = metadata.iloc[0:0]
+
+    output_csv_paths = {}
+
+    for housing_type in housing_types:
+        output_csv_paths[housing_type] = []
+        building_counts = []
+        processed_count = 0
+        skipped_count = 0
+
+        for county_code, county_name in counties.itertuples(index=False):
+            formatted_county_name = slugify_county_name(county_name)
+            output_dir = os.path.join(output_base_dir, scenario, housing_type, formatted_county_name)
+            output_csv = os.path.join(output_dir, "step1_filtered_building_ids.csv")
+
+            # Step 1: Check if processing is necessary
+            if not force_recompute:
+                output_csv_paths[housing_type].append(output_csv)
+                skipped_count += 1
+                continue  # Skip processing
+
+            # Step 2: Look up the county's filtered metadata
+            filtered_metadata = groups.get((county_code, county_name, housing_type), no_buildings)
+            building_counts.append([formatted_county_name, county_name, filtered_metadata.shape[0]])
+
+            # Step 3: Save building IDs
+            output_csv = save_building_ids(filtered_metadata, scenario, county_name, output_dir)
+            output_csv_paths[housing_type].append(output_csv)
+            processed_count += 1
+
+        if building_counts:
+            save_building_counts(building_counts, os.path.join(output_base_dir, scenario, housing_type))
+
+        log(
+            step=1,
+            title="identify suitable buildings",
+            housing_type=housing_type,
+            num_counties_processed=len(output_csv_paths[housing_type]),
+            total_csv_files_generated=len(output_csv_paths[housing_type]),
+            counties_processed=processed_count,
+            counties_skipped=skipped_count,
+            total_buildings=sum(count for _, _, count in building_counts),
+        )
+
     return output_csv_paths
 
+def process(scenario, housing_type, output_base_dir="data", target_counties=None, force_recompute=True):
+    return process_housing_types(scenario, [housing_type], output_base_dir, target_counties, force_recompute)[housing_type]
+
 # Done: single-family-detached: norcal, socal, central
 # Done: Single-family-attached: norcal, socal, central
 # process("baseline", "single-family-attached", output_base_dir="data", target_counties=central_counties, force_recompute=True)
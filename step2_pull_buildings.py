@@ -4,11 +4,16 @@ import boto3
 from botocore.client import Config
 from botocore import UNSIGNED
 from helpers import get_scenario_path, get_counties, log, norcal_counties, socal_counties, central_counties
+from download_helpers import call_with_retries, download_object, is_complete, load_manifest
+from building_cache_helpers import fetch_buildings
+import step3_build_electricity_load_profiles as BuildElectricityLoadProfiles
+import step4_build_gas_load_profiles as BuildGasLoadProfiles
 
 s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED))
 S3_PREFIX = "nrel-pds-building-stock/end-use-load-profiles-for-us-building-stock/2024/resstock_amy2018_release_2/timeseries_individual_buildings/by_state/upgrade=0/state=CA/"
 S3_BUCKET_NAME = "oedi-data-lake"
 METADATA_FILE_NAME = "step1_filtered_building_ids.csv"
+PROJECT_COLUMNS = True # Only fetch the columns steps 3 and 4 read, instead of the full timeseries files
 
 def ensure_directory_exists(directory):
     if not os.path.exists(directory):
@@ -20,6 +25,9 @@ def ensure_directory_exists(directory):
             details=f"Directory '{directory}' created."
         )
 
+def get_building_file_name(bldg_id):
+    return f"{bldg_id}-0.parquet"
+
 def download_parquet_file(bucket_name, s3_key, output_dir):
     output_file = os.path.join(output_dir, os.path.basename(s3_key))
     
@@ -27,7 +35,8 @@ def download_parquet_file(bucket_name, s3_key, output_dir):
         return
     
     try:
-        s3.download_file(Bucket=bucket_name, Key=s3_key, Filename=output_file)
+        os.makedirs(output_dir, exist_ok=True)
+        call_with_retries(lambda: download_object(s3, bucket_name, s3_key, output_file))
     except Exception as e:
         log(
             at="download_parquet_file",
@@ -39,9 +48,33 @@ def download_parquet_file(bucket_name, s3_key, output_dir):
             details="Error downloading file."
         )
 
+def get_building_columns():
+    """
+    Timeseries columns to fetch for every building, or None to download the full files.
+    """
+    if not PROJECT_COLUMNS:
+        return None
+
+    end_use_columns = [
+        column
+        for end_use_columns in [BuildElectricityLoadProfiles.END_USE_COLUMNS, BuildGasLoadProfiles.END_USE_COLUMNS]
+        for columns in end_use_columns.values()
+        for column in columns
+    ]
+
+    return ["timestamp", *dict.fromkeys(end_use_columns)]
+
+def count_downloads(output_dir, building_ids, columns=None):
+    """
+    Number of buildings whose file is complete according to the download manifest, so truncated files do not count.
+    """
+    manifest = load_manifest(output_dir)
+    file_names = [get_building_file_name(bldg_id) for bldg_id in building_ids]
+
+    return sum(is_complete(os.path.join(output_dir, file_name), manifest.get(file_name), columns) for file_name in file_names)
+
 def check_for_downloads(output_dir, building_ids):
-    downloaded_files = [f for f in os.listdir(output_dir) if os.path.isfile(os.path.join(output_dir, f))]
-    return len(building_ids) == len(downloaded_files)
+    return count_downloads(output_dir, building_ids, get_building_columns()) == len(building_ids)
 
 def process_county(scenario, housing_type, county_path, bucket_name, s3_prefix, output_base_dir):
     county_metadata_path = os.path.join(county_path, METADATA_FILE_NAME)
@@ -80,12 +113,10 @@ def process_county(scenario, housing_type, county_path, bucket_name, s3_prefix,
             "status": "success"
         }
 
-    for bldg_id in building_ids:
-        s3_key = f"{s3_prefix}{bldg_id}-0.parquet"
-        download_parquet_file(bucket_name, s3_key, buildings_directory)
+    s3_keys = [f"{s3_prefix}{get_building_file_name(bldg_id)}" for bldg_id in building_ids]
+    fetch_buildings(s3, bucket_name, s3_keys, buildings_directory, columns=get_building_columns())
 
-    downloaded_files = [f for f in os.listdir(buildings_directory) if os.path.isfile(os.path.join(buildings_directory, f))]
-    retrieved_buildings = len(downloaded_files)
+    retrieved_buildings = count_downloads(buildings_directory, building_ids, get_building_columns())
     missing_buildings = total_buildings - retrieved_buildings
 
     # Log only if the download is incomplete.
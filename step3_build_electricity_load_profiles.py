@@ -1,6 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from helpers import get_counties, get_scenario_path, is_valid_csv, log, to_number, slugify_county_name
+from handoff_helpers import write_intermediate_csv
+import step4_build_gas_load_profiles as BuildGasLoadProfiles
 
 END_USE_COLUMNS = {
     "cooling": [
@@ -45,7 +49,7 @@ def list_parquet_files(input_dir):
 
 def read_parquet_file(file_path, required_cols):
     try:
-        data = pd.read_parquet(file_path)
+        data = pd.read_parquet(file_path, columns=required_cols) # Only decode the columns we need
     except Exception as e:
         return None, f"Error reading {file_path}: {e}" # Returns (data, error) tuple
 
@@ -68,33 +72,66 @@ def read_building_profile(file_path, end_uses):
     data = data.set_index("timestamp")
     return data[end_uses], None
 
-def get_building_profiles(input_dir, end_uses):
+def iter_building_profiles(input_dir, end_uses):
     """
-    Iterates over all Parquet files in the input directory, reading and collecting each building's data.
-    Returns a list of DataFrames.
+    Iterates over all Parquet files in the input directory, yielding each building's data as soon as it is decoded,
+    so that only one building is held in memory at a time.
     """
     all_files = list_parquet_files(input_dir)
-    profiles = []
     for file_name in all_files:
         file_path = os.path.join(input_dir, file_name)
         profile, error = read_building_profile(file_path, end_uses)
         if error:
             print(error)
             continue
-        profiles.append(profile)
-    return profiles
+        yield profile
+
+def new_typical_profile_accumulator():
+    return {"totals": None, "counts": None, "timestamps": None, "end_uses": None, "num_buildings": 0}
+
+def add_building_profile(accumulator, profile):
+    """
+    Folds one building's profile (timestamp index, one column per end use) into the running float64 sum and count.
+    All buildings are aligned to the first building's timesteps (ResStock's 15-minute year).
+    """
+    if accumulator["totals"] is None:
+        accumulator["timestamps"], accumulator["end_uses"] = profile.index, sorted(profile.columns)
+        accumulator["totals"] = np.zeros((len(profile.index), len(profile.columns)))
+        accumulator["counts"] = np.zeros((len(profile.index), len(profile.columns)))
+    elif not profile.index.equals(accumulator["timestamps"]):
+        profile = profile.reindex(accumulator["timestamps"])
+
+    values = profile[accumulator["end_uses"]].to_numpy(dtype=np.float64)
+    is_present = ~np.isnan(values)
+    accumulator["totals"] += np.where(is_present, values, 0.0) # Like mean(), missing values are skipped
+    accumulator["counts"] += is_present
+    accumulator["num_buildings"] += 1
+
+def finalize_typical_profile(accumulator):
+    """
+    Returns (typical DataFrame at the native resolution, number of buildings), columns sorted by end use.
+    """
+    if accumulator["totals"] is None:
+        return pd.DataFrame(), 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        typical = accumulator["totals"] / accumulator["counts"]
+
+    return pd.DataFrame(typical, index=accumulator["timestamps"], columns=accumulator["end_uses"]), accumulator["num_buildings"]
 
 def compute_typical_profile(profiles):
     """
-    Combines individual building profiles side-by-side so that each building's data remains separate,
-    then computes the average (typical) load for each end-use across buildings.
-    Returns a DataFrame at the native resolution (e.g. 15-minute intervals).
+    Computes the average (typical) load for each end-use across buildings at every timestep.
+    Buildings are folded one at a time into a float64 running sum and count, so memory stays at
+    O(end uses x timesteps) no matter how many buildings the county has.
+    Returns (typical DataFrame at the native resolution, number of buildings), columns sorted by end use.
     """
-    # Create a MultiIndex on the columns: level 0 will be the building index.
-    combined = pd.concat(profiles, axis=1, keys=range(len(profiles)))
-    # Group by the end-use column names (level 1) and compute the mean across buildings.
-    typical_15min = combined.groupby(level=1, axis=1).mean()
-    return typical_15min
+    accumulator = new_typical_profile_accumulator()
+
+    for profile in profiles:
+        add_building_profile(accumulator, profile)
+
+    return finalize_typical_profile(accumulator)
 
 def resample_profile_to_hourly(typical_profile, agg_method="sum"):
     """
@@ -122,7 +159,7 @@ def save_profile(profile, output_path):
     """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     profile = profile.reset_index().rename(columns={"index": "timestamp"})
-    profile.to_csv(output_path, index=False)
+    write_intermediate_csv(profile, output_path, index=False)
 
 def format_end_use_name(key):
     prefix = "out.electricity."
@@ -141,7 +178,7 @@ def log_annual_totals(county, annual_totals):
 def process_county_data(county, input_dir, output_path, end_uses):
     """
     Processes all building Parquet files in the county directory:
-      1. Reads each building file and collects the building profiles.
+      1. Streams each building file into running per-timestamp totals.
       2. Computes the typical (average) building load at each timestamp across buildings.
       3. Resamples the resulting profile to hourly resolution.
       4. Computes annual totals for each end use.
@@ -150,13 +187,19 @@ def process_county_data(county, input_dir, output_path, end_uses):
     Returns:
       status (str), num_files (int), annual_totals (dict)
     """
-    profiles = get_building_profiles(input_dir, end_uses)
-    if not profiles:
+    # Compute the average (typical) 15-minute profile across buildings, one building at a time.
+    typical_15min, num_buildings = compute_typical_profile(iter_building_profiles(input_dir, end_uses))
+    if num_buildings == 0:
         return "empty_data", 0
 
-    # Compute the average (typical) 15-minute profile across buildings.
-    typical_15min = compute_typical_profile(profiles)
+    save_typical_profile(county, typical_15min, output_path, end_uses)
+
+    return "processed", num_buildings
 
+def save_typical_profile(county, typical_15min, output_path, end_uses):
+    """
+    Resamples a typical 15-minute profile to hourly, adds the total load, logs annual totals and saves it.
+    """
     # Resample the typical profile to hourly resolution.
     typical_hourly = resample_profile_to_hourly(typical_15min, agg_method="sum")
 
@@ -169,7 +212,64 @@ def process_county_data(county, input_dir, output_path, end_uses):
 
     save_profile(typical_hourly, output_path)
 
-    return "processed", len(profiles)
+def read_building_columns(file_path, columns):
+    """
+    Reads the requested columns that exist in a building's Parquet file with a single pyarrow column projection.
+    Only the file's footer is read to find out which columns it has.
+    """
+    available_columns = set(pq.read_schema(file_path).names)
+    data = pd.read_parquet(file_path, columns=[col for col in columns if col in available_columns])
+
+    if "timestamp" in data.columns:
+        data["timestamp"] = pd.to_datetime(data["timestamp"])
+    return data
+
+def process_county_buildings(county, input_dir, electricity_output_path, gas_output_path, electricity_end_uses, gas_end_uses):
+    """
+    Builds a county's typical electricity profile (step 3) and gas totals (step 4) in one pass over its buildings:
+    each Parquet file is opened once, only the union of electricity and gas columns is decoded,
+    and the building is folded into both county accumulators before the next file is read.
+
+    Returns:
+      status (str), num_electricity_files (int), num_gas_files (int)
+    """
+    electricity_accumulator = new_typical_profile_accumulator()
+    county_gas_totals, gas_building_count = None, 0
+
+    for file_name in list_parquet_files(input_dir):
+        file_path = os.path.join(input_dir, file_name)
+        try:
+            data = read_building_columns(file_path, ["timestamp"] + electricity_end_uses + gas_end_uses)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            continue
+
+        if "timestamp" not in data.columns:
+            print(f"Missing columns in {file_path}: ['timestamp']")
+            continue
+
+        if all(col in data.columns for col in electricity_end_uses):
+            add_building_profile(electricity_accumulator, data.set_index("timestamp")[electricity_end_uses])
+        else:
+            print(f"Missing columns in {file_path}: {[col for col in electricity_end_uses if col not in data.columns]}")
+
+        if all(col in data.columns for col in gas_end_uses):
+            building_gas_totals = BuildGasLoadProfiles.process_building_data(data, gas_end_uses)
+            gas_building_count += 1
+            county_gas_totals = BuildGasLoadProfiles.update_county_totals(county_gas_totals, building_gas_totals)
+
+    typical_15min, electricity_building_count = finalize_typical_profile(electricity_accumulator)
+    if electricity_building_count > 0:
+        save_typical_profile(county, typical_15min, electricity_output_path, electricity_end_uses)
+
+    if gas_building_count > 0:
+        county_gas_totals = BuildGasLoadProfiles.average_county_gas_profiles(county_gas_totals, gas_building_count, gas_end_uses)
+        BuildGasLoadProfiles.save_county_gas_profiles(county_gas_totals, county, gas_output_path)
+
+    if electricity_building_count == 0 and gas_building_count == 0:
+        return "empty_data", 0, 0
+
+    return "processed", electricity_building_count, gas_building_count
 
 def should_skip_processing(output_path, force_recompute):
     if force_recompute:
@@ -243,6 +343,74 @@ def process(scenario_name, end_use_categories, housing_type, counties, base_inpu
 
     return summary
 
+def process_electricity_and_gas(scenario_name, end_use_categories, housing_type, counties, base_input_dir, base_output_dir, force_recompute=True):
+    """
+    Runs step 3 and step 4 together with a single read of every building file, writing both steps' outputs.
+    """
+    summary = {
+        "processed": [],
+        "skipped": [],
+        "errors": []
+    }
+
+    if scenario_name != "baseline":
+        log(at="step3_build_electricity_load_profiles#process_electricity_and_gas", message="no new load profiles needed to be built")
+        return
+
+    scenario_path = get_scenario_path(base_input_dir, scenario_name, housing_type)
+    counties = get_counties(scenario_path, counties)
+
+    electricity_end_uses = get_end_use_columns(end_use_categories)
+    gas_end_uses = [col for category in end_use_categories["gas"] for col in BuildGasLoadProfiles.END_USE_COLUMNS[category]]
+
+    for county in counties:
+        county_info = {
+            "county": county,
+            "scenario": scenario_name,
+            "housing_type": housing_type,
+            "status": None,
+            "num_files": 0
+        }
+
+        input_dir = os.path.join(base_input_dir, scenario_name, housing_type, county, INPUT_FOLDER_NAME)
+        output_dir = os.path.join(base_output_dir, scenario_name, housing_type, county)
+        electricity_output_path = os.path.join(output_dir, f"{OUTPUT_FILE_PREFIX}_{county}.csv")
+        gas_output_path = os.path.join(output_dir, f"{BuildGasLoadProfiles.OUTPUT_FILE_PREFIX}_{county}.csv")
+
+        if should_skip_processing(electricity_output_path, force_recompute) and BuildGasLoadProfiles.should_skip_processing(gas_output_path, force_recompute):
+            county_info["status"] = "skipped_existing"
+            summary["skipped"].append(county_info)
+            continue
+
+        if not os.path.exists(input_dir):
+            county_info["status"] = "directory_not_found"
+            summary["skipped"].append(county_info)
+            continue
+
+        os.makedirs(output_dir, exist_ok=True)
+        status, num_electricity_files, num_gas_files = process_county_buildings(
+            county, input_dir, electricity_output_path, gas_output_path, electricity_end_uses, gas_end_uses
+        )
+
+        county_info["status"] = status
+        county_info["num_files"] = num_electricity_files
+        county_info["num_gas_files"] = num_gas_files
+
+        if status == "processed":
+            summary["processed"].append(county_info)
+        else:
+            summary["skipped"].append(county_info)
+
+    log(
+        step="3+4",
+        title="build electricity and gas load profiles",
+        processed=summary["processed"],
+        skipped=summary["skipped"],
+        errors=summary["errors"]
+    )
+
+    return summary
+
 if __name__ == '__main__':
     BASELINE_SCENARIO = {
         "baseline": {"gas": {"heating", "hot_water", "cooking"}, "electric": {"appliances", "misc"}}
@@ -1,7 +1,9 @@
 import os
+import numpy as np
 import pandas as pd
 
 from helpers import get_scenario_path, get_counties, log, to_number
+from handoff_helpers import write_intermediate_csv
 
 # Conversion factor
 KWH_TO_THERMS = 0.0341296
@@ -18,35 +20,42 @@ END_USE_COLUMNS = {
 OUTPUT_FILE_PREFIX = "gas_loads"
 
 def process_building_data(data, end_uses):
+    """
+    Returns one building's gas load as (timestamps, values), where values holds one row per timestep and
+    one column per end use followed by the building's total, in kWh. Missing values count as zero.
+    """
     if 'timestamp' not in data.columns or not all(col in data.columns for col in end_uses):
         raise ValueError("Missing required columns: 'timestamp' and/or end_uses.")
 
-    data['timestamp'] = pd.to_datetime(data['timestamp'])
-    hourly_data = data[['timestamp'] + end_uses].copy()
-    # Sum it to a total
-    hourly_data['load.gas.total.kwh'] = hourly_data[end_uses].sum(axis=1)
-    # We also want a sum across all buildings by end-use
+    timestamps = pd.DatetimeIndex(pd.to_datetime(data['timestamp']))
+    end_use_values = data[end_uses].to_numpy(dtype=np.float64, copy=True)
+    end_use_values[np.isnan(end_use_values)] = 0.0
+
+    # ResStock files already have one row per timestep, only fall back to a groupby when they don't
+    if not (timestamps.is_monotonic_increasing and timestamps.is_unique):
+        grouped = pd.DataFrame(end_use_values).groupby(timestamps).sum()
+        timestamps, end_use_values = grouped.index, grouped.to_numpy()
 
-    grouped = hourly_data.groupby('timestamp', as_index=False).sum()
+    # Sum it to a total
+    values = np.column_stack([end_use_values, end_use_values.sum(axis=1)])
 
-    return grouped # hourly_data.groupby('timestamp', as_index=False)['total_load_kwh'].sum()
+    return timestamps, values
 
-def update_county_totals(county_gas_totals, building_gas_totals, building_count, end_uses):
-    suffixed_end_uses = [f"{col}.gas.total.kwh" for col in end_uses]
+def update_county_totals(county_gas_totals, building_gas_totals):
+    """
+    Adds one building to the county's running totals. The first building's timesteps become the county's
+    canonical timestep index; later buildings with other timesteps are aligned to it, missing timesteps as zero.
+    """
+    timestamps, values = building_gas_totals
 
     if county_gas_totals is None:
         # Initialize county totals with the first building
-        county_gas_totals = building_gas_totals.rename(columns={col: f"{col}.gas.total.kwh" for col in end_uses}).copy()
-        county_gas_totals['load.gas.total.therms'] = county_gas_totals['load.gas.total.kwh'] * KWH_TO_THERMS
-    else:
-        # Aggregate totals FOR EACH END USE with the suffixed column names
-        for col, suffixed_col in zip(end_uses, suffixed_end_uses):
-            county_gas_totals[suffixed_col] += building_gas_totals[col]
+        return {"timestamps": timestamps, "totals": values.copy()}
 
-        county_gas_totals['load.gas.total.kwh'] += building_gas_totals['load.gas.total.kwh']
-        county_gas_totals['load.gas.total.therms'] = county_gas_totals['load.gas.total.kwh'] * KWH_TO_THERMS
+    if not timestamps.equals(county_gas_totals["timestamps"]):
+        values = pd.DataFrame(values, index=timestamps).reindex(county_gas_totals["timestamps"], fill_value=0.0).to_numpy()
 
-    county_gas_totals['building_count'] = building_count
+    county_gas_totals["totals"] += values
 
     return county_gas_totals
 
@@ -67,30 +76,36 @@ def sum_county_gas_profiles(input_dir, end_uses):
                 building_gas_totals = process_building_data(data, end_uses)
 
                 building_count += 1
-                county_gas_totals = update_county_totals(county_gas_totals, building_gas_totals, building_count, end_uses)
+                county_gas_totals = update_county_totals(county_gas_totals, building_gas_totals)
 
     return county_gas_totals, building_count
 
 def average_county_gas_profiles(county_gas_totals, building_count, end_uses):
+    """
+    Turns the county's running totals into the gas load profile table: totals, therms and per-building
+    averages for the whole load and for each end use. Averages and therms are only computed here, once.
+    """
+    totals = county_gas_totals["totals"]
+    total_kwh = totals[:, -1]
+
+    columns = {"timestamp": county_gas_totals["timestamps"]}
+    for index, col in enumerate(end_uses):
+        columns[f"{col}.gas.total.kwh"] = totals[:, index]
+    columns['load.gas.total.kwh'] = total_kwh
+    columns['load.gas.total.therms'] = total_kwh * KWH_TO_THERMS
+    columns['building_count'] = np.full(len(total_kwh), building_count, dtype=np.int64)
+
     if building_count > 0:
         # Calculate average for total load
-        county_gas_totals['load.gas.building_avg.kwh'] = county_gas_totals['load.gas.total.kwh'].div(building_count)
-        county_gas_totals['load.gas.building_avg.therms'] = county_gas_totals['load.gas.building_avg.kwh'] * KWH_TO_THERMS
+        columns['load.gas.building_avg.kwh'] = total_kwh / building_count
+        columns['load.gas.building_avg.therms'] = columns['load.gas.building_avg.kwh'] * KWH_TO_THERMS
 
         # Calculate averages for each individual end use in kWh and therms
-        for col in end_uses:
-            total_col = f"{col}.gas.total.kwh"
-            avg_kwh_col = f"{col}.gas.building_avg.kwh"
-            avg_therms_col = f"{col}.gas.building_avg.therms"
+        for index, col in enumerate(end_uses):
+            columns[f"{col}.gas.building_avg.kwh"] = totals[:, index] / building_count
+            columns[f"{col}.gas.building_avg.therms"] = columns[f"{col}.gas.building_avg.kwh"] * KWH_TO_THERMS
 
-            if total_col in county_gas_totals.columns:
-                # Average in kWh
-                county_gas_totals[avg_kwh_col] = county_gas_totals[total_col].div(building_count)
-
-                # Average in therms
-                county_gas_totals[avg_therms_col] = county_gas_totals[avg_kwh_col] * KWH_TO_THERMS
-
-    return county_gas_totals
+    return pd.DataFrame(columns)
 
 def save_county_gas_profiles(county_gas_totals, county, output_file):
     log(
@@ -103,7 +118,7 @@ def save_county_gas_profiles(county_gas_totals, county, output_file):
         saved_at=output_file
     )
 
-    county_gas_totals.to_csv(output_file)
+    write_intermediate_csv(county_gas_totals, output_file)
 
 def build_county_gas_profile(scenario, housing_type, county, county_dir, output_file, end_uses):
     county_gas_totals, building_count = sum_county_gas_profiles(county_dir, end_uses)
@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 
 from helpers import get_counties, get_scenario_path, log, to_number
+from handoff_helpers import intermediate_exists, read_intermediate_csv, write_intermediate_csv
 
 # TODO: Make this a Monte Carlo simulation, trying all values in range
 # TODO: Add climate-dependent (county-dependent?) COP values
@@ -49,7 +50,7 @@ def convert_gas_water_heater_to_electric_waterheater(gas_water_heating_kwh):
 
 def save_converted_load_profiles(simulated_electricity_loads, output_file):
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    simulated_electricity_loads.to_csv(output_file, index=False)
+    write_intermediate_csv(simulated_electricity_loads, output_file, index=False)
 
     log(
         at='step5#convert_gas_appliances_to_electrical_appliances',
@@ -65,12 +66,12 @@ def convert_appliances_for_county(county, base_input_dir, base_output_dir, scena
         input_file = os.path.join(base_input_dir, scenario, housing_type, county, f"{INPUT_FILE_PREFIX}_{county}.csv")
         output_file = os.path.join(base_output_dir, scenario, housing_type, county, f"{OUTPUT_FILE_PREFIX}_{county}.csv")
 
-        if not os.path.exists(input_file):
+        if not intermediate_exists(input_file):
             print(f"Gas load profile not found for {county} in scenario {scenario}. Looked in: {input_file}. Skipping...")
             continue
         
         try:
-            gas_loads = pd.read_csv(input_file)
+            gas_loads = read_intermediate_csv(input_file)
             simulated_electricity_loads = pd.DataFrame()
             simulated_electricity_loads['timestamp'] = gas_loads['timestamp'].copy()
 
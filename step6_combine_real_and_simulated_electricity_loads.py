@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 
 from helpers import get_counties, get_scenario_path, log, to_number
+from handoff_helpers import intermediate_exists, read_intermediate_csv, write_intermediate_csv
 
 OUTPUT_FILE_PREFIX = "combined_profiles"
 
@@ -119,12 +120,12 @@ def aggregate_columns(file_path, columns, resample_to_hourly=False):
     """
     Aggregate specified columns in a file, with optional resampling to hourly intervals.
     """
-    if not os.path.exists(file_path):
+    if not intermediate_exists(file_path):
         log(warning=f"File {file_path} not found. Skipping.")
         return None
     
     try:
-        df = pd.read_csv(file_path, usecols=["timestamp"] + columns, parse_dates=["timestamp"])
+        df = read_intermediate_csv(file_path, usecols=["timestamp"] + columns, parse_dates=["timestamp"])
         df = df.set_index("timestamp")
         
         # Sum the columns
@@ -192,7 +193,7 @@ def combine_profiles(input_dir, output_dir, scenario, housing_type, county, scen
     output_path = os.path.join(output_dir, scenario, housing_type, county_slug)
     os.makedirs(output_path, exist_ok=True)
     output_file = os.path.join(output_path, f"{OUTPUT_FILE_PREFIX}_{scenario}_{county_slug}.csv")
-    combined_df.to_csv(output_file, index=False)
+    write_intermediate_csv(combined_df, output_file, index=False)
 
     log(
         at="step6_combine_real_and_simulated_electricity_profiles",
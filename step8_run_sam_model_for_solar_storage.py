@@ -1,12 +1,26 @@
 import os
+import hashlib
+import PySAM
 import PySAM.Pvwattsv8 as pvwatts # https://nrel-pysam.readthedocs.io/en/main/modules/Pvwattsv8.html
 import PySAM.Battwatts as battery_model # https://nrel-pysam.readthedocs.io/en/main/modules/Battery.html
 import PySAM.ResourceTools as tools
 import pandas as pd
 import statistics
 import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from helpers import get_counties, get_scenario_path, log, format_load_profile, to_decimal_number, norcal_counties, central_counties, socal_counties
+from handoff_helpers import HANDOFF, intermediate_exists, read_intermediate_csv, write_intermediate_csv
+from dispatch_helpers import SELF_CONSUMPTION_DISPATCH, dispatch_self_consumption
+from pv_profile_helpers import PV_PROFILE_CACHE, PV_PROFILE_CONSTANTS, PV_PROFILE_OUTPUTS, REFERENCE_CAPACITY_KW, get_normalized_pv_profile, scale_pv_profile
+from net_billing_helpers import NET_BILLING, bill_net_billing, load_export_rates
+from capital_costs_helper import calculate_net_system_costs
+from sizing_helpers import SIZING, get_candidate_sizes, select_optimal_size
+from electricity_rate_helpers import RATE_PLAN_ELIGIBILITY, get_household_technologies, is_eligible
+from tariff_helpers import RATE_PLANS, compile_baseline_allowances, get_baseline_territory
+from utility_helpers import get_utility_for_county
+from sam_result_cache_helpers import SAM_RESULT_CACHE, get_cache_statistics, get_sam_result_key, load_sam_result, save_sam_result
 
 # LOADPROFILE_FILE_PREFIX = "electricity_loads"
 LOADPROFILE_FILE_PREFIX = "combined_profiles"
@@ -14,11 +28,57 @@ TOTAL_LOAD_COLUMN_NAME = "electricity.real_and_simulated.for_typical_county_home
 OUTPUT_LOADPROFILE_FILE_PREFIX = "sam_optimized_load_profiles"
 SOLAR_STORAGE_CAPACITY_PREFIX = "electrified_assets"
 CAPITAL_COSTS_FOLDER_NAME = "CAPITAL_COSTS"
+SAM_CONFIGURATION_DIR = "./SAM_configuration/"
+SOLAR_CONFIGURATION_FILE_NAME = "untitled__1__pvwattsv8"
+BATTERY_CONFIGURATION_FILE_NAME = "untitled__1__battwatts"
+# "battwatts" runs SAM's Battwatts model (its peak shaving dispatch), "numpy" the self-consumption dispatch of
+# dispatch_helpers. They are different dispatch strategies, not an approximation of one another: results differ.
+DISPATCH_ENGINE = "battwatts"
+SIZING_STRATEGY = "optimize" # "optimize" searches sizing_helpers.SIZING for the best payback, "heuristic" sizes PV to the annual load with one battery
+POWERWALL_CAPACITY_KWH = 13.5 # Surrogate battery when the Battwatts template does not size it
+POWERWALL_POWER_KW = 5.0
+SAM_OUTPUT_NAMES = [ # run_models_and_extract_outputs, in order
+    "system_to_load", "batt_to_load", "grid_to_load", "solar_battery_to_load", "total_supply", "difference", "grid_to_batt",
+    "system_to_batt", "system_to_batt_dc", "system_to_grid", "load", "battery_soc", "solar_capacity", "battery_capacity",
+]
+SKIPPED_CONFIGURATION_KEYS = ["number_inputs", "batt_adjust_constant", "batt_adjust_en_timeindex", "batt_adjust_en_periods", "batt_adjust_timeindex", "batt_adjust_periods"]
+
+sam_configurations = {} # file name -> parsed SAM template, loaded once per process
+
+def load_sam_configuration(file_name):
+    """
+    Parsed SAM_configuration template, read from disk the first time this process needs it.
+    """
+    if file_name not in sam_configurations:
+        with open(SAM_CONFIGURATION_DIR + file_name + ".json", 'r') as file:
+            data = json.load(file)
+        sam_configurations[file_name] = {k: v for k, v in data.items() if k not in SKIPPED_CONFIGURATION_KEYS}
+
+    return sam_configurations[file_name]
+
+def apply_sam_configuration(model, file_name):
+    for k, v in load_sam_configuration(file_name).items():
+        model.value(k, v)
 
-def prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_analysis):
+def initialize_worker():
+    """
+    Runs once in every SAM worker process: parses the templates up front so county simulations only set values.
+    A missing template is left for the county runs to report, an initializer error would break the whole pool.
+    """
+    for file_name in [SOLAR_CONFIGURATION_FILE_NAME, BATTERY_CONFIGURATION_FILE_NAME]:
+        try:
+            load_sam_configuration(file_name)
+        except OSError as e:
+            print(f"Could not load SAM configuration {file_name}: {e}")
+
+def prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_analysis, load_profile=None):
+    """
+    load_profile, when the caller already read it from load_file, saves reading it again.
+    """
     solar_resource_data = tools.SAM_CSV_to_solar_data(weather_file)
-    load_data = pd.read_csv(load_file)
-    load_profile = load_data[TOTAL_LOAD_COLUMN_NAME].tolist()
+    if load_profile is None:
+        load_data = read_intermediate_csv(load_file)
+        load_profile = load_data[TOTAL_LOAD_COLUMN_NAME].tolist()
     # TEMP CONSTANT LOAD
     # load_profile = [1.0] * 8760 # [kW] constant load example
     annual_load_kWh = sum(load_profile)
@@ -72,18 +132,7 @@ def prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_a
 def create_solar_model(solar_resource_data, system_capacity, years_of_analysis):
     # Initialize PV system
     solar = pvwatts.new() # Or could use FlatPlatePVResidential
-
-    dir = "./SAM_configuration/"
-    file_names = ["untitled__1__pvwattsv8"]
-    modules = [solar]
-
-    for f, m in zip(file_names, modules):
-        with open(dir + f + ".json", 'r') as file:
-            data = json.load(file)
-            print(file)
-            for k, v in data.items():
-                if k not in ["number_inputs", "batt_adjust_constant", "batt_adjust_en_timeindex", "batt_adjust_en_periods", "batt_adjust_timeindex", "batt_adjust_periods"]:
-                    m.value(k, v)
+    apply_sam_configuration(solar, SOLAR_CONFIGURATION_FILE_NAME)
 
     solar.SolarResource.solar_resource_data = solar_resource_data 
     # TODO, Ana: only allow solar panels of specific sizes that actually exist on the market
@@ -109,17 +158,7 @@ def create_battery_model(solar, load_profile, years_of_analysis):
 
     # ---- Initialize Battery model
     battery = battery_model.from_existing(solar) # StandaloneBatteryResidential
-
-    dir = "./SAM_configuration/"
-    file_names = ["untitled__1__battwatts"]
-
-    for f, m in zip(file_names, [battery]):
-        with open(dir + f + ".json", 'r') as file:
-            data = json.load(file)
-            print(file)
-            for k, v in data.items():
-                if k not in ["number_inputs", "batt_adjust_constant", "batt_adjust_en_timeindex", "batt_adjust_en_periods", "batt_adjust_timeindex", "batt_adjust_periods"]:
-                    m.value(k, v)
+    apply_sam_configuration(battery, BATTERY_CONFIGURATION_FILE_NAME)
 
     # ---- BatteryCell
     # ['LeadAcid_q10_computed', 'LeadAcid_q20_computed', 'LeadAcid_qn_computed', 'LeadAcid_tn', 'batt_C_rate', 'batt_Cp', 'batt_Qexp', 'batt_Qfull', 'batt_Qfull_flow', 'batt_Qnom', 'batt_Vcut', 'batt_Vexp', 'batt_Vfull', 'batt_Vnom', 'batt_Vnom_default', 'batt_calendar_a', 'batt_calendar_b', 'batt_calendar_c', 'batt_calendar_choice', 'batt_calendar_lifetime_matrix', 'batt_calendar_q0', 'batt_chem', 'batt_h_to_ambient', 'batt_initial_SOC', 'batt_life_model', 'batt_lifetime_matrix', 'batt_maximum_SOC', 'batt_minimum_SOC', 'batt_minimum_modetime', 'batt_minimum_outage_SOC', 'batt_resistance', 'batt_room_temperature_celsius', 'batt_voltage_choice', 'batt_voltage_matrix', 'cap_vs_temp']
@@ -164,8 +203,154 @@ def create_battery_model(solar, load_profile, years_of_analysis):
 
     return battery
 
-def run_models_and_extract_outputs(solar, battery, load_profile):
+def get_pv_configuration(years_of_analysis):
+    """
+    Everything besides the weather and the system size that PVWatts output depends on, the PV profile cache key.
+    """
+    return {
+        "template": load_sam_configuration(SOLAR_CONFIGURATION_FILE_NAME),
+        "dc_degradation": [0.5] * years_of_analysis,
+        "pysam_version": PySAM.__version__,
+    }
+
+def simulate_normalized_pv_profile(solar_resource_data, years_of_analysis):
+    solar = create_solar_model(solar_resource_data, REFERENCE_CAPACITY_KW, years_of_analysis)
     solar.execute(0)
+
+    return {name: getattr(solar.Outputs, name) for name in PV_PROFILE_OUTPUTS + PV_PROFILE_CONSTANTS}
+
+def get_pv_profile(weather_file, solar_resource_data, years_of_analysis):
+    """
+    PVWatts output of a 1 kW system at the county's weather, simulated once per weather file and SAM configuration.
+    """
+    return get_normalized_pv_profile(
+        weather_file,
+        get_pv_configuration(years_of_analysis),
+        lambda: simulate_normalized_pv_profile(solar_resource_data, years_of_analysis),
+    )
+
+def create_scaled_solar_storage_models(solar_resource_data, pv_profile, system_capacity, load_profile, years_of_analysis):
+    """
+    Solar + battery models whose PV output is the normalized profile scaled to system_capacity,
+    so only the battery dispatch needs to be simulated.
+    """
+    solar = create_solar_model(solar_resource_data, system_capacity, years_of_analysis)
+    battery = create_battery_model(solar, load_profile, years_of_analysis)
+    battery.Battery.assign({
+        name: values.tolist() if name in PV_PROFILE_OUTPUTS else values
+        for name, values in scale_pv_profile(pv_profile, system_capacity).items()
+    })
+
+    return solar, battery
+
+def sweep_system_capacities(weather_file, load_file, system_capacities, years_of_analysis=1, battery_count=1):
+    """
+    Simulates a county's solar + storage system with battery_count batteries for every candidate PV size [kW],
+    running PVWatts at most once. Returns {system_capacity: outputs of run_models_and_extract_outputs}.
+    """
+    solar_resource_data, load_profile, _ = prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_analysis)
+    pv_profile = get_pv_profile(weather_file, solar_resource_data, years_of_analysis)
+
+    if DISPATCH_ENGINE == "numpy":
+        # All sizes in one vectorized dispatch
+        return dict(zip(system_capacities, run_dispatch_surrogate(pv_profile, list(system_capacities), load_profile, battery_count)))
+
+    results = {}
+    for system_capacity in system_capacities:
+        solar, battery = create_scaled_solar_storage_models(solar_resource_data, pv_profile, system_capacity, load_profile, years_of_analysis)
+        size_battery(battery, battery_count)
+        results[system_capacity] = run_models_and_extract_outputs(solar, battery, load_profile, run_solar=False)
+
+    return results
+
+def get_surrogate_battery():
+    """
+    (capacity [kWh], power [kW]) of the battery the Battwatts template describes.
+    """
+    configuration = load_sam_configuration(BATTERY_CONFIGURATION_FILE_NAME)
+
+    return configuration.get("batt_simple_kwh", POWERWALL_CAPACITY_KWH), configuration.get("batt_simple_kw", POWERWALL_POWER_KW)
+
+def get_battery_count(battery_capacity):
+    """
+    Number of the template's batteries in a system of battery_capacity [kWh].
+    """
+    return max(1, round(battery_capacity / get_surrogate_battery()[0]))
+
+def size_battery(battery, battery_count):
+    """
+    Scales a Battwatts model to battery_count of the template's batteries.
+    """
+    if battery_count != 1:
+        battery_kwh, battery_kw = get_surrogate_battery()
+        battery.Battery.batt_simple_kwh = battery_count * battery_kwh
+        battery.Battery.batt_simple_kw = battery_count * battery_kw
+
+def run_dispatch_surrogate(pv_profile, system_capacities, load_profile, battery_count=1):
+    """
+    The outputs of run_models_and_extract_outputs from the NumPy self-consumption dispatch, for a system capacity [kW]
+    or, vectorized, for a list of them (returning a list of outputs).
+    """
+    battery_kwh, battery_kw = get_surrogate_battery()
+    battery_kwh, battery_kw = battery_count * battery_kwh, battery_count * battery_kw
+    capacities = np.atleast_1d(np.asarray(system_capacities, dtype=float))
+    pv_kw = capacities[:, None] * pv_profile["ac"][None, :] / 1000 # W per kW of nameplate -> kW
+    flows = dispatch_self_consumption(pv_kw, np.asarray(load_profile, dtype=float), battery_kwh, battery_kw)
+
+    results = []
+    for i, system_capacity in enumerate(capacities):
+        system_to_load, batt_to_load, grid_to_load = flows["system_to_load"][i], flows["batt_to_load"][i], flows["grid_to_load"][i]
+        total_supply = system_to_load + batt_to_load + grid_to_load
+        system_to_batt = flows["system_to_batt"][i].tolist()
+
+        results.append((
+            system_to_load.tolist(),
+            batt_to_load.tolist(),
+            grid_to_load.tolist(),
+            (system_to_load + batt_to_load).tolist(),
+            total_supply.tolist(),
+            (np.asarray(load_profile) - total_supply).tolist(),
+            flows["grid_to_batt"][i].tolist(),
+            system_to_batt,
+            system_to_batt, # AC-coupled, no separate DC path
+            flows["system_to_grid"][i].tolist(),
+            list(load_profile),
+            flows["batt_SOC"][i].tolist(),
+            float(system_capacity),
+            battery_kwh,
+        ))
+
+    return results if np.ndim(system_capacities) else results[0]
+
+def simulate_solar_storage(weather_file, solar_resource_data, system_capacity, load_profile, years_of_analysis, battery_count=1):
+    """
+    The outputs of run_models_and_extract_outputs for one system size, from the engine DISPATCH_ENGINE selects.
+    """
+    match DISPATCH_ENGINE:
+        case "battwatts":
+            if PV_PROFILE_CACHE["enabled"]:
+                pv_profile = get_pv_profile(weather_file, solar_resource_data, years_of_analysis)
+                solar, battery = create_scaled_solar_storage_models(solar_resource_data, pv_profile, system_capacity, load_profile, years_of_analysis)
+            else:
+                solar = create_solar_model(solar_resource_data, system_capacity, years_of_analysis)
+                battery = create_battery_model(solar, load_profile, years_of_analysis)
+            size_battery(battery, battery_count)
+            # configure_rate_plan(battery, some_rate_plan)
+
+            return run_models_and_extract_outputs(solar, battery, load_profile, run_solar=not PV_PROFILE_CACHE["enabled"])
+        case "numpy":
+            pv_profile = get_pv_profile(weather_file, solar_resource_data, years_of_analysis)
+            return run_dispatch_surrogate(pv_profile, system_capacity, load_profile, battery_count)
+        case _:
+            raise ValueError(f"Unknown dispatch engine: {DISPATCH_ENGINE}")
+
+def run_models_and_extract_outputs(solar, battery, load_profile, run_solar=True):
+    """
+    Runs the models and returns the hourly flows and the system capacities.
+    run_solar=False when the battery's PV input was already assigned from a scaled PV profile.
+    """
+    if run_solar:
+        solar.execute(0)
     # print(solar.Outputs.export().keys()) 
     # print(solar.Outputs.annual_energy)
     # print(solar.Outputs.ac_monthly)
@@ -230,6 +415,7 @@ def validate_and_save_results(county, load_profile, system_to_load, batt_to_load
         'Difference': difference,
         'System to Battery': system_to_batt,
         'Grid to Battery': grid_to_batt,
+        'System to Grid': system_to_grid, # Exports, credited by net billing in step11
         'Battery SOC': battery_soc,
     }, index=date_range)
 
@@ -252,54 +438,241 @@ def validate_and_save_results(county, load_profile, system_to_load, batt_to_load
         saved_to=output_file,
     )
 
-    df.to_csv(output_file)
+    write_intermediate_csv(df, output_file)
+
+def save_system_capacities(base_input_dir, scenario, housing_type, capacity_dict):
+    """
+    Writes the solar and battery capacity of every county to the scenario's capital costs folder.
+    """
+    capital_costs_folder = f"{base_input_dir}/{scenario}/{housing_type}/{CAPITAL_COSTS_FOLDER_NAME}"
+    os.makedirs(capital_costs_folder, exist_ok=True)
 
-def process(base_input_dir, base_output_dir, scenario, housing_type, counties=None, years_of_analysis=1):
+    capacity_df = pd.DataFrame.from_dict(capacity_dict, orient='index').rename_axis('County')
+    output_csv_path = f"{capital_costs_folder}/{SOLAR_STORAGE_CAPACITY_PREFIX}.csv"
+    capacity_df.to_csv(output_csv_path)
+
+def get_annual_savings(county, scenario, load_profile, flows):
+    """
+    Annual electricity bill savings of every candidate system (rows of the dispatch flows) over the same home without
+    solar + storage, both on their cheapest eligible rate plan (the pipeline's BEST_RATE_PLAN) under net billing.
+    Imports are grid_to_load and exports system_to_grid, the "Grid to Load" and "System to Grid" columns step 9 hands
+    to step 11's published bills.
+    """
+    utility = get_utility_for_county(county)
+    load = np.asarray(load_profile, dtype=float)
+    rate_plans = list(RATE_PLANS[utility])
+
+    load_matrix = np.vstack([load, flows["grid_to_load"]])
+    export_matrix = np.vstack([np.zeros_like(load), flows["system_to_grid"]])
+    bills = bill_net_billing(load_matrix, export_matrix, utility, rate_plans, get_baseline_territory(county, utility))
+
+    # Storage opens up the restricted plans, see step11_evaluate_electricity_rates.find_best_rate_plans
+    for row, load_type in [(slice(0, 1), "default"), (slice(1, None), "solarstorage")]:
+        technologies = get_household_technologies(scenario or "", load_type)
+        bills[row, [not is_eligible(rate_plan, technologies) for rate_plan in rate_plans]] = np.inf
+    best_bills = bills.min(axis=1)
+
+    return best_bills[0] - best_bills[1:]
+
+def get_dispatch_flows(outputs):
+    """
+    Flows billed by get_annual_savings, (candidates x hours), from the outputs of run_models_and_extract_outputs.
+    """
+    return {
+        name: np.asarray([candidate_outputs[SAM_OUTPUT_NAMES.index(name)] for candidate_outputs in outputs], dtype=float)
+        for name in ["grid_to_load", "system_to_grid"]
+    }
+
+def optimize_system_size(county, weather_file, solar_resource_data, load_profile, years_of_analysis, scenario=None):
+    """
+    Searches PV size x battery count for the county's best payback (or NPV, see sizing_helpers.SIZING), billing every
+    candidate in one batch. Candidates are dispatched by DISPATCH_ENGINE, the engine of the county's outputs: all at
+    once by the NumPy dispatch on the cached PV profile, or one Battwatts run each (its peak shaving dispatch ranks
+    systems differently, so the NumPy dispatch cannot screen for it).
+    Returns (PV capacity [kW], battery count).
+    """
+    solar_kw, battery_counts = get_candidate_sizes()
+
+    if DISPATCH_ENGINE == "numpy":
+        pv_profile = get_pv_profile(weather_file, solar_resource_data, years_of_analysis)
+        battery_kwh, battery_kw = get_surrogate_battery()
+        pv_kw = solar_kw[:, None] * pv_profile["ac"][None, :] / 1000 # W per kW of nameplate -> kW
+        flows = dispatch_self_consumption(pv_kw, np.asarray(load_profile, dtype=float), battery_counts * battery_kwh, battery_counts * battery_kw)
+    else:
+        # Only the billed flows are kept, the hourly outputs of every candidate would take hundreds of MB
+        flows = {name: np.empty((len(solar_kw), len(load_profile))) for name in ["grid_to_load", "system_to_grid"]}
+        for i, (system_capacity, battery_count) in enumerate(zip(solar_kw, battery_counts)):
+            candidate_flows = get_dispatch_flows([simulate_solar_storage(weather_file, solar_resource_data, float(system_capacity), load_profile, years_of_analysis, int(battery_count))])
+            for name, values in candidate_flows.items():
+                flows[name][i] = values[0]
+
+    annual_savings = get_annual_savings(county, scenario, load_profile, flows)
+    net_costs = calculate_net_system_costs(solar_kw, battery_counts, get_utility_for_county(county))
+    best, economics = select_optimal_size(solar_kw, battery_counts, net_costs, annual_savings)
+
+    log(
+        at="step8_run_sam_model_for_solar_storage#optimize_system_size",
+        county=county,
+        candidates=len(solar_kw),
+        solar_kw=solar_kw[best],
+        batteries=battery_counts[best],
+        net_cost=to_decimal_number(net_costs[best]),
+        annual_savings=to_decimal_number(annual_savings[best]),
+        payback_years=to_decimal_number(economics["payback"]),
+        npv=to_decimal_number(economics["npv"]),
+    )
+
+    return float(solar_kw[best]), int(battery_counts[best])
+
+def get_sam_configuration(years_of_analysis, county=None, scenario=None):
+    """
+    Everything besides the weather and the load that a county's SAM outputs depend on, part of the SAM result cache key.
+    """
+    configuration = {
+        "solar": load_sam_configuration(SOLAR_CONFIGURATION_FILE_NAME),
+        "battery": load_sam_configuration(BATTERY_CONFIGURATION_FILE_NAME),
+        "dispatch_engine": DISPATCH_ENGINE,
+        "dispatch": SELF_CONSUMPTION_DISPATCH if DISPATCH_ENGINE == "numpy" else None,
+        "pv_profile_cache": PV_PROFILE_CACHE["enabled"], # scaled 1 kW profiles differ from direct PVWatts runs by rounding
+        "years_of_analysis": years_of_analysis,
+        "sizing_strategy": SIZING_STRATEGY,
+    }
+
+    if SIZING_STRATEGY == "optimize":
+        # Optimal sizes also depend on the county's tariff, its net billing and on costs
+        utility = get_utility_for_county(county)
+        territory = get_baseline_territory(county, utility)
+        configuration["sizing"] = {
+            **SIZING,
+            "county": county,
+            "rate_plans": RATE_PLANS[utility],
+            "rate_plan_eligibility": RATE_PLAN_ELIGIBILITY,
+            "technologies": sorted(get_household_technologies(scenario or "", "default")),
+            "baseline_allowances": compile_baseline_allowances(utility, territory).tolist() if territory is not None else None,
+            "net_billing": NET_BILLING,
+            "export_rates": hashlib.sha256(load_export_rates(utility).tobytes()).hexdigest(),
+            "net_costs": calculate_net_system_costs(*get_candidate_sizes(), utility).tolist(),
+        }
+
+    return configuration
+
+def run_sam(weather_file, load_file, years_of_analysis, county=None, load_profile=None, scenario=None):
+    solar_resource_data, load_profile, system_capacity = prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_analysis, load_profile)
+    battery_count = 1
+
+    match SIZING_STRATEGY:
+        case "heuristic":
+            pass
+        case "optimize":
+            system_capacity, battery_count = optimize_system_size(county, weather_file, solar_resource_data, load_profile, years_of_analysis, scenario)
+        case _:
+            raise ValueError(f"Unknown sizing strategy: {SIZING_STRATEGY}")
+
+    return load_profile, simulate_solar_storage(weather_file, solar_resource_data, system_capacity, load_profile, years_of_analysis, battery_count)
+
+def get_sam_outputs(weather_file, load_file, years_of_analysis, county=None, scenario=None):
+    """
+    (load profile, outputs of run_models_and_extract_outputs) of a county. Straight from the SAM result cache when the
+    same weather, load and SAM configuration were already simulated, else SAM runs and its outputs are cached.
+    """
+    if not SAM_RESULT_CACHE["enabled"]:
+        return run_sam(weather_file, load_file, years_of_analysis, county, scenario=scenario)
+
+    load_profile = read_intermediate_csv(load_file, usecols=[TOTAL_LOAD_COLUMN_NAME])[TOTAL_LOAD_COLUMN_NAME].tolist()
+    key = get_sam_result_key(weather_file, load_profile, get_sam_configuration(years_of_analysis, county, scenario))
+
+    cached_outputs = load_sam_result(key)
+    if cached_outputs is not None:
+        log(at="step8_run_sam_model_for_solar_storage#get_sam_outputs", weather_file=weather_file, cache="hit")
+        return load_profile, tuple(
+            cached_outputs[name].tolist() if isinstance(cached_outputs[name], np.ndarray) else cached_outputs[name]
+            for name in SAM_OUTPUT_NAMES
+        )
+
+    load_profile, outputs = run_sam(weather_file, load_file, years_of_analysis, county, load_profile, scenario)
+    save_sam_result(key, dict(zip(SAM_OUTPUT_NAMES, outputs)))
+
+    return load_profile, outputs
+
+def run_county(base_input_dir, base_output_dir, scenario, housing_type, county, years_of_analysis):
+    """
+    Runs the solar + storage model of one county and saves its load profiles.
+    Returns (county, capacities, error); capacities is None when the county was skipped or failed.
+    """
+    try:
+        log(county=county)
+        # log(at="step8", scenario=scenario, scenario_path=scenario_path, county=county)
+
+        scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
+        weather_file = os.path.join(base_input_dir, scenario, housing_type, county, f"weather_TMY_{county}.csv")
+        load_file = os.path.join(scenario_path, county, f"{LOADPROFILE_FILE_PREFIX}_{scenario}_{county}.csv")
+        output_file = os.path.join(base_output_dir, scenario, housing_type, county, f"{OUTPUT_LOADPROFILE_FILE_PREFIX}_{county}.csv")
+
+        if not os.path.exists(weather_file):
+            print(f"Weather file not found: {weather_file}. Skipping...")
+            return county, None, None
+        if not intermediate_exists(load_file):
+            # TODO: Ana, this should raise, all load profiles should exist
+            # Subsequent steps will fail if this fails
+            print(f"Load file not found: {load_file}. Skipping...")
+            return county, None, None
+
+        load_profile, outputs = get_sam_outputs(weather_file, load_file, years_of_analysis, county, scenario)
+        system_to_load, batt_to_load, grid_to_load, solar_battery_to_load, total_supply, difference, grid_to_batt, system_to_batt, system_to_batt_dc, system_to_grid, load, battery_soc, solar_capacity, battery_capacity = outputs
+
+        validate_and_save_results(county, load_profile, system_to_load, batt_to_load, grid_to_load, solar_battery_to_load, total_supply, difference, output_file, grid_to_batt, system_to_batt, system_to_batt_dc, system_to_grid, load, battery_soc)
+
+        return county, {
+            "Solar Capacity (kW)": to_decimal_number(solar_capacity),
+            "Battery Capacity (kWh)": to_decimal_number(battery_capacity),
+            "Battery Count": get_battery_count(battery_capacity), # priced by the capital cost steps
+        }, None
+    except Exception as e:
+        print(f"Error processing {county}: {e}")
+        return county, None, str(e)
+
+def run_counties(base_input_dir, base_output_dir, scenario, housing_type, counties, years_of_analysis, workers):
+    """
+    Runs every county's simulation, in a pool of worker processes when workers > 1, else one after another in this
+    process (easier to debug, and what a single county or an already parallel county run uses).
+    Frames handed off in memory only live in this process, so in-memory handoff also runs serially.
+    """
+    args = [(base_input_dir, base_output_dir, scenario, housing_type, county, years_of_analysis) for county in counties]
+
+    if workers <= 1 or len(counties) <= 1 or HANDOFF["in_memory"]:
+        return [run_county(*county_args) for county_args in args]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(counties)), initializer=initialize_worker) as executor:
+        futures = [executor.submit(run_county, *county_args) for county_args in args]
+        return [future.result() for future in as_completed(futures)]
+
+def process(base_input_dir, base_output_dir, scenario, housing_type, counties=None, years_of_analysis=1, write_summary=True, workers=None):
+    """
+    Runs the solar + storage model for every county and returns {county: capacities}.
+    Counties are simulated in parallel worker processes (workers defaults to the CPU count, workers=1 runs them serially);
+    a county that fails is logged and left out of the results without stopping the others.
+    The statewide capacity table is only written when write_summary is set; county-parallel runs write it once all counties are done.
+    """
     # Define the scenario path to dynamically list counties
     scenario_path = get_scenario_path(base_input_dir, scenario, housing_type)
     counties_to_run = get_counties(scenario_path, counties)
-    capacity_dict = {}
+    workers = workers or os.cpu_count() or 1
 
-    for county in counties_to_run:
-        try:
-            log(county=county)
-            # log(at="step8", scenario=scenario, scenario_path=scenario_path, county=county)
-
-            weather_file = os.path.join(base_input_dir, scenario, housing_type, county, f"weather_TMY_{county}.csv")
-            load_file = os.path.join(scenario_path, county, f"{LOADPROFILE_FILE_PREFIX}_{scenario}_{county}.csv")
-            output_file = os.path.join(base_output_dir, scenario, housing_type, county, f"{OUTPUT_LOADPROFILE_FILE_PREFIX}_{county}.csv")
-
-            if not os.path.exists(weather_file):
-                print(f"Weather file not found: {weather_file}. Skipping...")
-                continue
-            if not os.path.exists(load_file):
-                # TODO: Ana, this should raise, all load profiles should exist
-                # Subsequent steps will fail if this fails
-                print(f"Load file not found: {load_file}. Skipping...")
-                continue
-
-            solar_resource_data, load_profile, system_capacity = prepare_data_and_compute_system_capacity(weather_file, load_file, years_of_analysis)
-            solar = create_solar_model(solar_resource_data, system_capacity, years_of_analysis)
-            battery = create_battery_model(solar, load_profile, years_of_analysis)
-            # configure_rate_plan(battery, some_rate_plan)
+    results = run_counties(base_input_dir, base_output_dir, scenario, housing_type, counties_to_run, years_of_analysis, workers)
+    # Keep the county order of a serial run, whichever worker finished first
+    results = sorted(results, key=lambda result: counties_to_run.index(result[0]))
 
-            system_to_load, batt_to_load, grid_to_load, solar_battery_to_load, total_supply, difference, grid_to_batt, system_to_batt, system_to_batt_dc, system_to_grid, load, battery_soc, solar_capacity, battery_capacity = run_models_and_extract_outputs(solar, battery, load_profile)
+    capacity_dict = {county: capacities for county, capacities, _ in results if capacities is not None}
+    failed = {county: error for county, _, error in results if error is not None}
 
-            capacity_dict[county] = {
-                "Solar Capacity (kW)": to_decimal_number(solar_capacity),
-                "Battery Capacity (kWh)": to_decimal_number(battery_capacity)
-            }
+    log(at="step8_run_sam_model_for_solar_storage#process", workers=workers, processed=len(capacity_dict), failed=list(failed))
+    if SAM_RESULT_CACHE["enabled"]:
+        log(at="step8_run_sam_model_for_solar_storage#sam_result_cache", **get_cache_statistics())
 
-            validate_and_save_results(county, load_profile, system_to_load, batt_to_load, grid_to_load, solar_battery_to_load, total_supply, difference, output_file, grid_to_batt, system_to_batt, system_to_batt_dc, system_to_grid, load, battery_soc)
-        except Exception as e:
-            print(f"Error processing {county}: {e}")
-    
-    capital_costs_folder = f"{base_input_dir}/{scenario}/{housing_type}/{CAPITAL_COSTS_FOLDER_NAME}"
-    os.makedirs(capital_costs_folder, exist_ok=True)
+    if write_summary:
+        save_system_capacities(base_input_dir, scenario, housing_type, capacity_dict)
 
-    capacity_df = pd.DataFrame.from_dict(capacity_dict, orient='index').rename_axis('County')
-    output_csv_path = f"{capital_costs_folder}/{SOLAR_STORAGE_CAPACITY_PREFIX}.csv"
-    capacity_df.to_csv(output_csv_path)
+    return capacity_dict
 
 # # Example usage
 scenario = "heat_pump" # "heat_pump_and_water_heater", 
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 
 from helpers import slugify_county_name, get_counties, get_scenario_path, log
+from handoff_helpers import read_intermediate_csv, write_intermediate_csv
 
 # Which columns should be used to calculate electricity and gas rates based on each scenario
 SCENARIO_DATA_MAP = {
@@ -21,7 +22,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "gas_loads_",
@@ -45,7 +47,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "combined_profiles_heat_pump_",
@@ -67,7 +70,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "combined_profiles_induction_stove_",
@@ -91,7 +95,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "combined_profiles_heat_pump_and_induction_stove_",
@@ -115,7 +120,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "combined_profiles_water_heating_",
@@ -139,7 +145,8 @@ SCENARIO_DATA_MAP = {
         "solar_storage": {
             "electricity": {
                 "file_prefix": "sam_optimized_load_profiles_",
-                "column": "Grid to Load"
+                "column": "Grid to Load",
+                "export_column": "System to Grid"
             },
             "gas": {
                 "file_prefix": "combined_profiles_heat_pump_and_induction_stove_and_water_heating_",
@@ -150,11 +157,11 @@ SCENARIO_DATA_MAP = {
 }
 
 OUTPUT_FILE_NAME = "loadprofiles_for_rates"
-OUTPUT_COLUMNS = ["timestamp", "default.electricity.kwh", "default.gas.therms", "solarstorage.electricity.kwh", "solarstorage.gas.therms"]
+OUTPUT_COLUMNS = ["timestamp", "default.electricity.kwh", "default.gas.therms", "solarstorage.electricity.kwh", "solarstorage.electricity.export.kwh", "solarstorage.gas.therms"]
 
 def aggregate_to_hourly(file_path, column_name):
     try:
-        df = pd.read_csv(file_path, parse_dates=["timestamp"])
+        df = read_intermediate_csv(file_path, parse_dates=["timestamp"])
         if column_name not in df.columns:
             raise ValueError(f"Column '{column_name}' not found in file: {file_path}")
         
@@ -170,7 +177,7 @@ def get_file_path(path, county, file_prefix):
 
 def read_load_profile(file_path, column_name):
     try:
-        df = pd.read_csv(file_path, usecols=[column_name])
+        df = read_intermediate_csv(file_path, usecols=[column_name])
         return df[column_name]
     except Exception as e:
         raise RuntimeError(f"Error reading file {file_path}: {e}")
@@ -190,6 +197,7 @@ def prepare_for_rates_analysis(base_input_dir, base_output_dir, housing_type, sc
     timestamp = read_load_profile(electricity_default_file, "timestamp")
     electricity_default = read_load_profile(electricity_default_file, directory["default"]["electricity"]["column"])
     electricity_solar_storage = read_load_profile(electricity_solar_storage_file, directory["solar_storage"]["electricity"]["column"])
+    electricity_solar_storage_export = read_load_profile(electricity_solar_storage_file, directory["solar_storage"]["electricity"]["export_column"])
     gas_default_hourly = aggregate_to_hourly(gas_default_file, directory["default"]["gas"]["column"])
     gas_solar_storage_hourly = aggregate_to_hourly(gas_solar_storage_file, directory["solar_storage"]["gas"]["column"])
 
@@ -198,12 +206,13 @@ def prepare_for_rates_analysis(base_input_dir, base_output_dir, housing_type, sc
         "default.electricity.kwh": electricity_default,
         "default.gas.therms": gas_default_hourly,
         "solarstorage.electricity.kwh": electricity_solar_storage,
+        "solarstorage.electricity.export.kwh": electricity_solar_storage_export,
         "solarstorage.gas.therms": gas_solar_storage_hourly
     }).dropna()
 
     output_file_path = os.path.join(base_output_dir, scenario, housing_type, county, f"{OUTPUT_FILE_NAME}_{county}.csv")
     os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    combined_df.to_csv(output_file_path, index=False)
+    write_intermediate_csv(combined_df, output_file_path, index=False)
     
     log(
         at="step9_get_loads_for_rates",
@@ -0,0 +1,230 @@
+import numpy as np
+from functools import lru_cache
+
+from electricity_rate_helpers import (
+    BASELINE_ALLOWANCES,
+    PGE_RATE_PLANS,
+    SCE_RATE_PLANS,
+    SDGE_RATE_PLANS,
+    PGE_BASELINE_TERRITORY_COUNTY_MAPPING,
+    SCE_BASELINE_REGION_COUNTY_MAPPING,
+)
+from calendar_helpers import HOURS_PER_YEAR, HOURS_PER_DAY, get_calendar_index
+
+# Compiles the nested rate plan dicts in electricity_rate_helpers into flat hourly price vectors,
+# so that a year of load can be billed with a single dot product instead of walking every hour.
+
+RATE_PLANS = {
+    "PG&E": PGE_RATE_PLANS,
+    "SCE": SCE_RATE_PLANS,
+    "SDG&E": SDGE_RATE_PLANS,
+}
+
+# Baseline allowances are set per territory for the whole utility, not per rate plan
+BASELINE_TERRITORY_COUNTY_MAPPINGS = {
+    "PG&E": PGE_BASELINE_TERRITORY_COUNTY_MAPPING,
+    "SCE": SCE_BASELINE_REGION_COUNTY_MAPPING,
+}
+
+def get_day_type_section(season_rates, day_type):
+    """
+    Returns the weekdays or weekends rate section of a season. Some plans spell the weekend section "weekend",
+    and plans without a weekend section bill weekends at weekday prices.
+    """
+    if day_type == "weekends":
+        return season_rates.get("weekends") or season_rates.get("weekend") or season_rates.get("weekdays")
+    return season_rates.get("weekdays")
+
+def compile_section_prices(rate_section):
+    """
+    Turns one rate section (e.g. summer weekdays) into a 24-entry array of $/kWh by hour of day.
+
+    Periods are resolved in the same order as the hourly billing loop: peak, then partPeak,
+    then superOffPeak, and anything else falls back to offPeak.
+    """
+    hourly_prices = np.full(HOURS_PER_DAY, rate_section.get("offPeak", 0.0), dtype=float)
+
+    # Assign lowest priority first so that higher priority periods overwrite shared hours
+    for period in ["superOffPeak", "partPeak", "peak"]:
+        hours = [h for h in rate_section.get(f"{period}Hours", []) if 0 <= h < HOURS_PER_DAY]
+        if hours:
+            hourly_prices[hours] = rate_section.get(period, 0.0)
+
+    return hourly_prices
+
+@lru_cache(maxsize=None)
+def compile_rate_plan(utility, rate_plan_name):
+    """
+    Compiles a rate plan into an 8760-hour energy price vector ($/kWh) and an 8760-hour fixed charge vector ($).
+    Compiled plans are memoized per (utility, rate plan); call compile_rate_plan.cache_clear() after editing a tariff.
+    """
+    plan_details = RATE_PLANS[utility][rate_plan_name]
+    calendar_index = get_calendar_index()
+
+    hour_of_day = calendar_index["hour"]
+    seasons = calendar_index["electricity_season"][utility]
+    day_types = np.where(calendar_index["is_offpeak_day"], "weekends", "weekdays") # holidays bill at weekend prices
+
+    prices = np.zeros(HOURS_PER_YEAR)
+    fixed_charges = np.zeros(HOURS_PER_YEAR)
+    baseline_credits = np.zeros(HOURS_PER_YEAR)
+
+    for season in ["summer", "winter"]:
+        season_rates = plan_details.get(season)
+        if not season_rates:
+            continue
+
+        for day_type in ["weekdays", "weekends"]:
+            rate_section = get_day_type_section(season_rates, day_type)
+            if not rate_section:
+                continue
+
+            in_period = (seasons == season) & (day_types == day_type)
+            prices[in_period] = compile_section_prices(rate_section)[hour_of_day[in_period]]
+            # Fixed charges are spread monthly across every hour
+            fixed_charges[in_period] = rate_section.get("fixedCharge", 0.0) / 12
+            # PG&E sets the credit ($/kWh) per rate section, SCE once per plan
+            baseline_credits[in_period] = rate_section.get("baseline_credit", plan_details.get("baseline_credit", 0.0))
+
+    prices.flags.writeable = False
+    fixed_charges.flags.writeable = False
+    baseline_credits.flags.writeable = False
+
+    return {"prices": prices, "fixed_charges": fixed_charges, "baseline_credits": baseline_credits}
+
+def get_baseline_territory(county, utility):
+    """
+    Returns the electric baseline territory (PG&E) or region (SCE) of a county slug,
+    or None when the utility or county has no baseline allowances on file.
+    """
+    for territory, counties in BASELINE_TERRITORY_COUNTY_MAPPINGS.get(utility, {}).items():
+        if county in counties:
+            return territory
+    return None
+
+def get_daily_baseline_allowance(utility, territory, season):
+    """
+    Daily baseline allowance (kWh/day) of a territory in the given season.
+    """
+    match utility:
+        case "PG&E":
+            return BASELINE_ALLOWANCES["PGE"]["E-TOU-C"]["territories"][territory][season]
+        case "SCE":
+            return BASELINE_ALLOWANCES["SCE"]["TOU-D-4-9PM"]["territories"][territory]["daily_kwh_allocation"][season]
+        case _:
+            raise ValueError(f"Baseline allowances not specified for utility: {utility}")
+
+@lru_cache(maxsize=None)
+def compile_baseline_allowances(utility, territory):
+    """
+    Baseline allowance (kWh) of every billing cycle: the daily allowance times the number of days in the cycle.
+    """
+    calendar_index = get_calendar_index()
+    seasons = calendar_index["electricity_season"][utility]
+
+    hourly_allowances = np.zeros(HOURS_PER_YEAR)
+    for season in ["summer", "winter"]:
+        hourly_allowances[seasons == season] = get_daily_baseline_allowance(utility, territory, season) / HOURS_PER_DAY
+
+    cycle_allowances = np.bincount(calendar_index["billing_cycle"], weights=hourly_allowances)
+    cycle_allowances.flags.writeable = False
+
+    return cycle_allowances
+
+def get_baseline_usage(load_matrix, cycle_allowances):
+    """
+    Splits a (profiles x 8760) load matrix into the kWh of each hour that falls within its billing cycle's
+    baseline allowance, using a running total of usage that restarts at the beginning of every cycle.
+    """
+    billing_cycle = get_calendar_index()["billing_cycle"]
+    cycle_starts = np.flatnonzero(np.diff(billing_cycle, prepend=-1))
+
+    usage = np.clip(load_matrix, 0.0, None) # exported energy never counts against the allowance
+    usage_before_hour = np.cumsum(usage, axis=1) - usage
+    usage_before_hour -= usage_before_hour[:, cycle_starts][:, billing_cycle]
+
+    remaining_allowance = np.clip(cycle_allowances[billing_cycle] - usage_before_hour, 0.0, None)
+
+    return np.minimum(usage, remaining_allowance)
+
+def bill_baseline_credits(load_matrix, utility, rate_plan_names, territory):
+    """
+    Baseline credits ($) earned by every row of a (profiles x 8760) load matrix on each of the utility's rate plans.
+    Returns a (profiles x plans) matrix of credits, all zero when the territory is unknown.
+    """
+    load_matrix = np.asarray(load_matrix, dtype=float)
+    if territory is None:
+        return np.zeros((len(load_matrix), len(rate_plan_names)))
+
+    baseline_credits = np.column_stack([compile_rate_plan(utility, name)["baseline_credits"] for name in rate_plan_names])
+    if not baseline_credits.any():
+        return np.zeros((len(load_matrix), len(rate_plan_names)))
+
+    baseline_usage = get_baseline_usage(load_matrix, compile_baseline_allowances(utility, territory))
+
+    return baseline_usage @ baseline_credits
+
+def bill_load_profile(load_profile, utility, rate_plan_name, territory=None):
+    """
+    Annual cost ($) of an hourly load profile (kWh) starting at hour 0 of the analysis year.
+    Baseline credits are only applied when the customer's baseline territory is given.
+    """
+    load = np.asarray(load_profile, dtype=float)
+    num_hours = len(load)
+
+    if num_hours > HOURS_PER_YEAR:
+        raise ValueError(f"Load profile has {num_hours} hours, expected at most {HOURS_PER_YEAR}")
+
+    tariff = compile_rate_plan(utility, rate_plan_name)
+    annual_cost = load @ tariff["prices"][:num_hours] + tariff["fixed_charges"][:num_hours].sum()
+
+    if territory is not None:
+        load_matrix, _ = stack_load_profiles([load])
+        annual_cost -= bill_baseline_credits(load_matrix, utility, [rate_plan_name], territory)[0, 0]
+
+    return float(annual_cost)
+
+@lru_cache(maxsize=None)
+def build_tariff_matrices(rate_plans):
+    """
+    Stacks compiled rate plans into (8760 x plans) price and fixed charge matrices.
+    rate_plans is a tuple of (utility, rate plan name) pairs, one per column.
+    """
+    compiled = [compile_rate_plan(utility, rate_plan_name) for utility, rate_plan_name in rate_plans]
+
+    prices = np.column_stack([tariff["prices"] for tariff in compiled])
+    fixed_charges = np.column_stack([tariff["fixed_charges"] for tariff in compiled])
+    prices.flags.writeable = False
+    fixed_charges.flags.writeable = False
+
+    return prices, fixed_charges
+
+def stack_load_profiles(load_profiles):
+    """
+    Stacks load profiles of up to 8760 hours into a zero-padded (profiles x 8760) load matrix,
+    along with a matching mask of which hours are present in each profile.
+    """
+    load_matrix = np.zeros((len(load_profiles), HOURS_PER_YEAR))
+    hour_mask = np.zeros((len(load_profiles), HOURS_PER_YEAR))
+
+    for row, load_profile in enumerate(load_profiles):
+        load = np.asarray(load_profile, dtype=float)
+        if len(load) > HOURS_PER_YEAR:
+            raise ValueError(f"Load profile has {len(load)} hours, expected at most {HOURS_PER_YEAR}")
+        load_matrix[row, :len(load)] = load
+        hour_mask[row, :len(load)] = 1.0
+
+    return load_matrix, hour_mask
+
+def bill_load_matrix(load_matrix, rate_plans, hour_mask=None):
+    """
+    Bills every row of a (profiles x 8760) load matrix against every (utility, rate plan) in rate_plans.
+    Energy and fixed charges are combined into one matrix product. Returns a (profiles x plans) cost matrix.
+    """
+    load_matrix = np.asarray(load_matrix, dtype=float)
+    if hour_mask is None:
+        hour_mask = np.ones_like(load_matrix)
+
+    prices, fixed_charges = build_tariff_matrices(tuple(rate_plans))
+
+    return np.hstack([load_matrix, hour_mask]) @ np.vstack([prices, fixed_charges])
@@ -0,0 +1,109 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from artifact_helpers import (
+    get_partition_dir,
+    get_partition_paths,
+    read_artifact,
+    read_artifacts,
+    read_results_artifact,
+    write_artifact,
+    write_artifact_for_path,
+    write_results_artifact,
+)
+
+@pytest.fixture
+def profile():
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2018-01-01", periods=24, freq="h"),
+        "default.electricity.kwh": np.linspace(0.5, 2.8, 24),
+    })
+
+def test_write_and_read_artifact_round_trip(tmp_path, profile):
+    output_file = write_artifact(profile, str(tmp_path), "loadprofiles_for_rates", "baseline", "single-family-detached", "alameda")
+
+    assert output_file == os.path.join(get_partition_dir(str(tmp_path), "loadprofiles_for_rates", "baseline", "single-family-detached", "alameda"), "part-0.parquet")
+    # Timestamps are stored in the shared int64 representation, compressed
+    parquet_file = pq.ParquetFile(output_file)
+    assert parquet_file.schema_arrow.field("timestamp").type == pa.int64()
+    assert parquet_file.metadata.row_group(0).column(0).compression == "ZSTD"
+
+    df = read_artifact(str(tmp_path), "loadprofiles_for_rates", "baseline", "single-family-detached", "alameda")
+    pd.testing.assert_frame_equal(df, profile, check_freq=False, check_dtype=False)
+    assert read_artifact(str(tmp_path), "loadprofiles_for_rates", "baseline", "single-family-detached", "kern") is None
+
+def test_read_artifacts_prunes_partitions_and_pushes_down_filters(tmp_path, profile):
+    for scenario in ["baseline", "heat_pump"]:
+        for county in ["alameda", "kern", "marin"]:
+            write_artifact(profile, str(tmp_path), "loadprofiles_for_rates", scenario, "single-family-detached", county)
+
+    paths = get_partition_paths(str(tmp_path), "loadprofiles_for_rates", {"scenario": "heat_pump", "county": ["alameda", "kern"]})
+    assert len(paths) == 2
+
+    df = read_artifacts(
+        str(tmp_path), "loadprofiles_for_rates",
+        columns=["timestamp", "default.electricity.kwh"],
+        filter=ds.field("default.electricity.kwh") > 2.0,
+        scenario="heat_pump", county=["alameda", "kern"],
+    )
+
+    assert sorted(df["county"].unique()) == ["alameda", "kern"]
+    assert (df["scenario"] == "heat_pump").all()
+    assert len(df) == 2 * (profile["default.electricity.kwh"] > 2.0).sum()
+    assert df["timestamp"].min() >= pd.Timestamp("2018-01-01")
+
+def test_read_artifacts_without_matching_partitions(tmp_path):
+    df = read_artifacts(str(tmp_path), "loadprofiles_for_rates", scenario="baseline")
+    assert df.empty
+
+def test_write_artifact_for_path_uses_the_pipeline_layout(tmp_path, profile):
+    output_file = tmp_path / "loadprofiles" / "baseline" / "single-family-detached" / "alameda" / "combined_profiles_baseline_alameda.csv"
+
+    write_artifact_for_path(profile, str(output_file), index=False)
+
+    df = read_artifact(str(tmp_path / "loadprofiles"), "combined_profiles", "baseline", "single-family-detached", "alameda")
+    assert list(df.columns) == list(profile.columns)
+
+def test_results_artifact_round_trip(tmp_path):
+    results = pd.DataFrame(
+        {"electricity.PG&E.E-TOU-C": [1500.25, 900.5], "electricity.PG&E.E-ELEC": [1400.0, 850.75]},
+        index=pd.Index(["baseline", "baseline.solarstorage"], name="scenario"),
+    )
+
+    write_results_artifact(results, str(tmp_path), "RESULTS_electricity_annual_costs", "baseline", "single-family-detached", "alameda")
+    df = read_results_artifact(str(tmp_path), "RESULTS_electricity_annual_costs", "baseline", "single-family-detached", "alameda")
+
+    pd.testing.assert_frame_equal(df, results, check_index_type=False)
+
+def test_combine_total_annual_costs_reads_results_from_artifacts(tmp_path):
+    from step13_combine_total_annual_costs import ELECTRICITY_PREFIX, get_costs_from_electricity
+
+    results = pd.DataFrame({"electricity.SCE.TOU-D-4-9PM": [1200.0, 600.0]}, index=pd.Index(["baseline", "baseline.solarstorage"], name="scenario"))
+    write_results_artifact(results, str(tmp_path), ELECTRICITY_PREFIX, "baseline", "single-family-detached", "kern")
+
+    # No results CSVs exist, the artifact store is enough
+    df = get_costs_from_electricity(str(tmp_path / "baseline" / "single-family-detached" / "kern"))
+    pd.testing.assert_frame_equal(df, results, check_index_type=False)
+
+def test_combine_total_annual_costs_prefers_newer_results_csvs(tmp_path):
+    from step13_combine_total_annual_costs import ELECTRICITY_PREFIX, get_costs_from_electricity
+
+    county_dir = tmp_path / "baseline" / "single-family-detached" / "kern"
+    results = pd.DataFrame({"electricity.SCE.TOU-D-4-9PM": [1200.0, 600.0]}, index=pd.Index(["baseline", "baseline.solarstorage"], name="scenario"))
+    artifact_file = write_results_artifact(results, str(tmp_path), ELECTRICITY_PREFIX, "baseline", "single-family-detached", "kern")
+    os.utime(artifact_file, (1000, 1000))
+
+    # A later run that only wrote its CSV
+    (county_dir / "results" / "electricity").mkdir(parents=True)
+    (results + 100).to_csv(county_dir / "results" / "electricity" / f"{ELECTRICITY_PREFIX}_kern_20250101_12.csv", index_label="scenario")
+
+    df = get_costs_from_electricity(str(county_dir))
+    pd.testing.assert_frame_equal(df, results + 100, check_index_type=False)
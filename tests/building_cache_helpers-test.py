@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import building_cache_helpers
+from building_cache_helpers import evict_building_cache, fetch_buildings, get_cache_dir, link_file
+from download_helpers import LocalObjectStore, verify_downloads
+
+@pytest.fixture
+def cache_dir(mocker, tmp_path):
+    cache_dir = tmp_path / "cache"
+    mocker.patch.dict("building_cache_helpers.BUILDING_CACHE", {"enabled": True, "dir": str(cache_dir), "quota_bytes": 10 ** 9})
+    return cache_dir
+
+def write_cached_file(directory, file_name, size, last_used):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, file_name)
+    with open(path, "wb") as file:
+        file.write(b"x" * size)
+    os.utime(path, (last_used, last_used))
+
+    return path
+
+def test_get_cache_dir_mirrors_the_bucket(cache_dir):
+    s3_key = "nrel/resstock_amy2018_release_2/timeseries_individual_buildings/by_state/upgrade=0/state=CA/101-0.parquet"
+
+    assert get_cache_dir("oedi-data-lake", s3_key) == os.path.join(
+        str(cache_dir), "oedi-data-lake", "nrel", "resstock_amy2018_release_2", "timeseries_individual_buildings", "by_state", "upgrade=0", "state=CA"
+    )
+
+def test_link_file_replaces_existing_files(tmp_path):
+    target = tmp_path / "target.parquet"
+    target.write_bytes(b"cached")
+    link_path = tmp_path / "link.parquet"
+    link_path.write_bytes(b"stale")
+
+    link_file(str(target), str(link_path))
+
+    assert link_path.read_bytes() == b"cached"
+
+def test_evict_building_cache_removes_least_recently_used_files(cache_dir):
+    shard = cache_dir / "bucket" / "release"
+    oldest = write_cached_file(shard, "1-0.parquet", 100, last_used=1_000)
+    kept = write_cached_file(shard, "2-0.parquet", 100, last_used=2_000)
+    newest = write_cached_file(shard, "3-0.parquet", 100, last_used=3_000)
+    write_cached_file(shard, ".download_manifest.json", 10_000, last_used=0)
+
+    deleted = evict_building_cache(quota_bytes=150, keep=[oldest])
+
+    assert deleted == [kept, newest]
+    assert os.path.exists(oldest)
+
+def test_evict_building_cache_keeps_recently_used_files(cache_dir):
+    shard = cache_dir / "bucket" / "release"
+    stale = write_cached_file(shard, "1-0.parquet", 100, last_used=1_000)
+    linked_by_another_county = write_cached_file(shard, "2-0.parquet", 100, last_used=time.time())
+
+    deleted = evict_building_cache(quota_bytes=0, grace_seconds=60)
+
+    assert deleted == [stale]
+    assert os.path.exists(linked_by_another_county)
+
+def test_fetch_buildings_downloads_once_for_every_output_dir(mocker, cache_dir, tmp_path):
+    download_objects = mocker.spy(building_cache_helpers, "download_objects")
+    source_dir = tmp_path / "lake"
+    (source_dir / "release").mkdir(parents=True)
+    pd.DataFrame({"timestamp": [0, 1], "out.heating": [1.0, 2.0], "out.unused": [3.0, 4.0]}).to_parquet(source_dir / "release" / "1-0.parquet")
+    store = LocalObjectStore(str(source_dir))
+    columns = ["timestamp", "out.heating"]
+
+    for output_root in ["first", "second"]:
+        output_dir = str(tmp_path / output_root / "buildings")
+        summary = fetch_buildings(None, "bucket", ["release/1-0.parquet"], output_dir, columns=columns, store=store)
+        assert verify_downloads(output_dir, ["1-0.parquet"], columns)
+        assert os.path.islink(os.path.join(output_dir, "1-0.parquet"))
+        assert list(pd.read_parquet(os.path.join(output_dir, "1-0.parquet")).columns) == columns
+
+    assert summary == {"downloaded": [], "skipped": ["1-0.parquet"], "failed": {}} # served from the cache
+
+    # Complete output dirs do not touch the cache at all
+    fetch_buildings(None, "bucket", ["release/1-0.parquet"], str(tmp_path / "first" / "buildings"), columns=columns, store=store)
+    assert download_objects.call_count == 2
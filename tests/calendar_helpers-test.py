@@ -0,0 +1,45 @@
+import pytest
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from calendar_helpers import get_nerc_holidays, get_gas_seasons, get_calendar_index, HOURS_PER_YEAR
+
+def test_nerc_holidays_2018():
+    expected = ["2018-01-01", "2018-05-28", "2018-07-04", "2018-09-03", "2018-11-22", "2018-12-25"]
+    assert [str(day) for day in get_nerc_holidays(2018)] == expected
+
+def test_sunday_holidays_observed_on_monday():
+    assert np.datetime64("2023-01-02") in get_nerc_holidays(2023)
+    assert np.datetime64("2022-12-26") in get_nerc_holidays(2022)
+
+def test_calendar_index_shape_and_day_types():
+    calendar_index = get_calendar_index()
+
+    assert len(calendar_index["timestamp"]) == HOURS_PER_YEAR
+    # January 1st 2018 was a Monday and a holiday
+    assert calendar_index["day_of_week"][0] == 0
+    assert calendar_index["is_holiday"][0]
+    assert calendar_index["is_offpeak_day"][0]
+    # January 6th 2018 was a Saturday
+    assert calendar_index["is_weekend"][5 * 24]
+    # 104 weekend days + 6 weekday holidays
+    assert calendar_index["is_offpeak_day"].sum() == 110 * 24
+
+def test_calendar_index_seasons_by_utility():
+    calendar_index = get_calendar_index()
+    october = calendar_index["month"] == 10
+
+    assert (calendar_index["electricity_season"]["PG&E"][october] == "winter").all()
+    assert (calendar_index["electricity_season"]["SDG&E"][october] == "summer").all()
+    assert (calendar_index["gas_season"][october] == "summer").all()
+    assert calendar_index["billing_cycle"][-1] == 11
+
+def test_calendar_index_is_read_only():
+    with pytest.raises(ValueError):
+        get_calendar_index()["month"][0] = 5
+
+def test_get_gas_seasons_rejects_invalid_months():
+    with pytest.raises(ValueError):
+        get_gas_seasons([1, 13])
@@ -0,0 +1,74 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import cost_service
+from cost_service import CostService, COUNTY_LOGS_FOLDER_NAME
+
+def fake_run_county_steps(self, counties, write_summary=True):
+    county = counties[0]
+    print(f"running {county}")
+    if county == "Kern County":
+        raise ValueError("no buildings")
+
+    return {
+        "system_capacities": {county: {"Solar Capacity (kW)": 5.0, "Battery Capacity (kWh)": 13.5}},
+        "cost_table": pd.DataFrame({"county": [county], "annual_cost": [1000.0]}),
+    }
+
+def test_run_counties_in_parallel_joins_statewide_tables_once(mocker, tmp_path):
+    mocker.patch.object(CostService, "run_county_steps", fake_run_county_steps)
+    mock_save_capacities = mocker.patch("step8_run_sam_model_for_solar_storage.save_system_capacities")
+    mock_find_best = mocker.patch("step11_evaluate_electricity_rates.find_best_rate_plans", return_value=pd.DataFrame())
+    mock_save_best = mocker.patch("step11_evaluate_electricity_rates.save_best_rate_plans")
+
+    counties = ["Alameda County", "Kern County", "Marin County"]
+    service = CostService("baseline", "single-family-detached", counties, {}, "data", str(tmp_path), workers=2)
+
+    results = service.run_counties_in_parallel()
+
+    assert sorted(result["county"] for result in results) == counties
+    assert [result["county"] for result in results if result["status"] == "failed"] == ["Kern County"]
+
+    # The capacity and best rate plan tables are written once, with every successful county
+    mock_save_capacities.assert_called_once()
+    assert sorted(mock_save_capacities.call_args[0][3]) == ["Alameda County", "Marin County"]
+    assert sorted(mock_find_best.call_args[0][0]["county"]) == ["Alameda County", "Marin County"]
+    mock_save_best.assert_called_once()
+
+    # Each county logs to its own file, including the failure's traceback
+    logs_dir = tmp_path / "baseline" / "single-family-detached" / COUNTY_LOGS_FOLDER_NAME
+    assert (logs_dir / "alameda.log").read_text() == "running Alameda County\n"
+    assert "ValueError: no buildings" in (logs_dir / "kern.log").read_text()
+
+def test_county_pipeline_is_a_complete_dag():
+    from graphlib import TopologicalSorter
+
+    scenario = list(CostService.SCENARIOS.keys())[0]
+    service = CostService(scenario, "single-family-detached", ["Santa Clara County"], {}, "data", "data/loadprofiles")
+    steps = service.get_county_pipeline("Santa Clara County")
+    names = [step["name"] for step in steps]
+
+    assert len(names) == len(set(names))
+    assert all(dependency in names for step in steps for dependency in step.get("depends_on", []))
+    order = list(TopologicalSorter({step["name"]: step.get("depends_on", []) for step in steps}).static_order())
+    assert order.index("pull_buildings") < order.index("build_load_profiles") < order.index("solar_storage") < order.index("total_annual_costs")
+    assert all("santa-clara" in pattern for step in steps for pattern in step["outputs"])
+
+def test_counties_listed_twice_run_once():
+    service = CostService("baseline", "single-family-detached", ["Ventura County", "Kern County", "Ventura County"], {}, "data", "data/loadprofiles")
+
+    assert service.counties == ["Ventura County", "Kern County"]
+
+def test_solar_storage_step_depends_on_costs_and_export_rates():
+    scenario = list(CostService.SCENARIOS.keys())[0]
+    service = CostService(scenario, "single-family-detached", ["Kern County"], {}, "data", "data/loadprofiles")
+    solar_storage = next(step for step in service.get_county_pipeline("Kern County") if step["name"] == "solar_storage")
+
+    assert solar_storage["params"]["capital_costs_helper"]["CAPITAL_COSTS"] == cost_service.capital_costs_helper.CAPITAL_COSTS
+    assert "NET_BILLING" in solar_storage["params"]["net_billing_helpers"]
+    assert "RATE_PLAN_ELIGIBILITY" in solar_storage["params"]["electricity_rate_helpers"]
+    assert solar_storage["inputs"] == [os.path.join(cost_service.net_billing_helpers.AVOIDED_COSTS_DIR, "*.csv")]
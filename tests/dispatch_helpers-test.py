@@ -0,0 +1,87 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from dispatch_helpers import dispatch_self_consumption, get_dispatch_errors, validate_dispatch
+
+def synthetic_year(seed=0):
+    """
+    (PV [kW], load [kW]) of a ~5 kW system and an evening-peaking home.
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(8760) % 24
+    pv_kw = 3.0 * np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None) * rng.uniform(0.3, 1.0, 8760)
+    load_kw = 1 + 0.6 * np.sin((hours - 12) / 24 * 2 * np.pi) + rng.uniform(0, 0.3, 8760)
+
+    return pv_kw, load_kw
+
+def test_flows_balance_and_respect_limits():
+    pv_kw = np.array([4.0, 4.0, 0.0, 0.0, 0.0])
+    load_kw = np.array([1.0, 1.0, 3.0, 3.0, 3.0])
+
+    flows = dispatch_self_consumption(pv_kw, load_kw, battery_kwh=10.0, battery_kw=2.0, round_trip_efficiency=1.0, initial_soc=0.5, minimum_soc=0.1, maximum_soc=0.9)
+
+    np.testing.assert_allclose(flows["system_to_load"] + flows["batt_to_load"] + flows["grid_to_load"], load_kw)
+    np.testing.assert_allclose(flows["system_to_load"] + flows["system_to_batt"] + flows["system_to_grid"], pv_kw)
+    np.testing.assert_allclose(flows["system_to_batt"], [2.0, 2.0, 0, 0, 0]) # 9 kWh max SOC, 5 + 2 + 2
+    np.testing.assert_allclose(flows["batt_to_load"], [0, 0, 2.0, 2.0, 2.0]) # 1 kWh min SOC, 9 - 2 - 2 - 2 = 3 left
+    np.testing.assert_allclose(flows["batt_SOC"], [70, 90, 70, 50, 30])
+    assert not flows["grid_to_batt"].any()
+
+def test_configurations_are_dispatched_together():
+    pv_kw, load_kw = synthetic_year()
+    battery_kwh = np.array([0.0, 6.75, 13.5, 27.0])
+
+    flows = dispatch_self_consumption(pv_kw[None, :] * np.array([1, 1, 2, 2])[:, None], load_kw, battery_kwh, 5.0)
+
+    for i, size in enumerate([1, 1, 2, 2]):
+        single = dispatch_self_consumption(pv_kw * size, load_kw, battery_kwh[i], 5.0)
+        np.testing.assert_allclose(flows["grid_to_load"][i], single["grid_to_load"])
+    assert not flows["batt_to_load"][0].any()
+
+def test_matches_ssc_self_consumption_dispatch():
+    battery = pytest.importorskip("PySAM.Battery")
+    pv_kw, load_kw = synthetic_year()
+
+    model = battery.default("StandaloneBatteryResidential")
+    model.BatterySystem.en_standalone_batt = 0
+    model.BatterySystem.batt_meter_position = 0 # behind the meter
+    model.BatterySystem.batt_replacement_option = 0
+    model.Lifetime.analysis_period = 1
+    model.Lifetime.system_use_lifetime_output = 0
+    model.SystemOutput.gen = pv_kw.tolist()
+    model.Load.load = load_kw.tolist()
+    model.BatteryDispatch.batt_dispatch_choice = 5 # self consumption
+    model.BatteryDispatch.batt_dispatch_auto_can_gridcharge = 0
+    model.BatteryDispatch.batt_dispatch_auto_btm_can_discharge_to_grid = 0
+    for option in ["batt_dispatch_auto_can_charge", "batt_dispatch_auto_can_clipcharge", "batt_dispatch_charge_only_system_exceeds_load", "batt_dispatch_discharge_only_load_exceeds_system"]:
+        setattr(model.BatteryDispatch, option, 1)
+    model.execute(0)
+
+    reference = {flow: np.array(getattr(model.Outputs, flow)) for flow in ["system_to_load", "batt_to_load", "grid_to_load", "system_to_batt", "system_to_grid", "grid_to_batt"]}
+    surrogate = dispatch_self_consumption(
+        pv_kw,
+        load_kw,
+        model.Outputs.batt_bank_installed_capacity,
+        model.BatterySystem.batt_power_discharge_max_kwac,
+        minimum_soc=model.BatteryCell.batt_minimum_SOC / 100,
+        maximum_soc=model.BatteryCell.batt_maximum_SOC / 100,
+        initial_soc=model.BatteryCell.batt_initial_SOC / 100,
+    )
+
+    errors = validate_dispatch(reference, surrogate, load_kw)
+
+    assert max(errors.values()) < 0.01
+    assert np.abs(reference["grid_to_load"] - surrogate["grid_to_load"]).mean() < 0.01 # kW, hour by hour
+
+def test_validate_dispatch_rejects_a_drifting_surrogate():
+    pv_kw, load_kw = synthetic_year()
+    reference = dispatch_self_consumption(pv_kw, load_kw, 13.5, 5.0)
+    surrogate = dispatch_self_consumption(pv_kw, load_kw, 13.5, 5.0, round_trip_efficiency=0.5)
+
+    assert get_dispatch_errors(reference, reference, load_kw)["grid_to_load"] == 0
+    with pytest.raises(ValueError, match="grid_to_load"):
+        validate_dispatch(reference, surrogate, load_kw)
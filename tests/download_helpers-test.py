@@ -0,0 +1,172 @@
+import os
+import sys
+import boto3
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from download_helpers import (
+    MANIFEST_FILE_NAME,
+    BandwidthLimiter,
+    LocalObjectStore,
+    call_with_retries,
+    download_objects,
+    fetch_projected_object,
+    load_manifest,
+    verify_downloads,
+)
+
+BUCKET_NAME = "test-bucket"
+PREFIX = "timeseries/upgrade=0/state=CA/"
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET_NAME)
+        for bldg_id in range(1, 6):
+            client.put_object(Bucket=BUCKET_NAME, Key=f"{PREFIX}{bldg_id}-0.parquet", Body=bytes([bldg_id]) * (1000 * bldg_id))
+        yield client
+
+def get_keys():
+    return [f"{PREFIX}{bldg_id}-0.parquet" for bldg_id in range(1, 6)]
+
+def test_download_objects_downloads_every_key(s3, tmp_path):
+    summary = download_objects(s3, BUCKET_NAME, get_keys(), str(tmp_path), max_workers=3)
+
+    assert sorted(summary["downloaded"]) == [f"{bldg_id}-0.parquet" for bldg_id in range(1, 6)]
+    assert summary["failed"] == {}
+    assert (tmp_path / "3-0.parquet").read_bytes() == bytes([3]) * 3000
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+    manifest = load_manifest(str(tmp_path))
+    assert manifest["5-0.parquet"]["size"] == 5000
+    assert manifest["5-0.parquet"]["key"] == f"{PREFIX}5-0.parquet"
+    assert verify_downloads(str(tmp_path), list(manifest))
+
+def test_download_objects_resumes_and_replaces_truncated_files(s3, tmp_path, mocker):
+    download_objects(s3, BUCKET_NAME, get_keys(), str(tmp_path))
+
+    with open(tmp_path / "4-0.parquet", "r+b") as file:
+        file.truncate(10)
+    assert not verify_downloads(str(tmp_path), ["4-0.parquet"])
+
+    get_object = mocker.spy(s3, "get_object")
+    summary = download_objects(s3, BUCKET_NAME, get_keys(), str(tmp_path))
+
+    assert summary["downloaded"] == ["4-0.parquet"]
+    assert len(summary["skipped"]) == 4
+    assert get_object.call_count == 1
+    assert (tmp_path / "4-0.parquet").stat().st_size == 4000
+
+def test_download_objects_adopts_files_downloaded_without_a_manifest(s3, tmp_path, mocker):
+    (tmp_path / "1-0.parquet").write_bytes(bytes([1]) * 1000)
+
+    get_object = mocker.spy(s3, "get_object")
+    summary = download_objects(s3, BUCKET_NAME, get_keys()[:1], str(tmp_path))
+
+    assert summary["skipped"] == ["1-0.parquet"]
+    get_object.assert_not_called()
+    assert os.path.exists(tmp_path / MANIFEST_FILE_NAME)
+
+def test_download_objects_retries_transient_errors(s3, tmp_path, mocker):
+    response = s3.get_object(Bucket=BUCKET_NAME, Key=get_keys()[0])
+    throttled = ClientError({"Error": {"Code": "SlowDown", "Message": "Reduce your request rate"}}, "GetObject")
+    mocker.patch.object(s3, "get_object", side_effect=[throttled, throttled, response])
+
+    summary = download_objects(s3, BUCKET_NAME, get_keys()[:1], str(tmp_path), backoff_seconds=0)
+
+    assert summary["downloaded"] == ["1-0.parquet"]
+    assert s3.get_object.call_count == 3
+
+def test_download_objects_reports_missing_keys_without_retrying(s3, tmp_path, mocker):
+    get_object = mocker.spy(s3, "get_object")
+
+    summary = download_objects(s3, BUCKET_NAME, [f"{PREFIX}404-0.parquet"], str(tmp_path), backoff_seconds=0)
+
+    assert list(summary["failed"]) == ["404-0.parquet"]
+    assert get_object.call_count == 1
+    assert not os.path.exists(tmp_path / "404-0.parquet")
+
+def test_call_with_retries_gives_up_after_the_last_retry():
+    attempts = []
+    sleeps = []
+
+    def fail():
+        attempts.append(1)
+        raise IOError("connection reset")
+
+    with pytest.raises(IOError):
+        call_with_retries(fail, retries=3, backoff_seconds=1, sleep=sleeps.append)
+
+    assert len(attempts) == 4
+    assert len(sleeps) == 3
+    assert all(low <= sleep <= high for sleep, (low, high) in zip(sleeps, [(0.5, 1), (1, 2), (2, 4)]))
+
+def test_bandwidth_limiter_holds_the_average_rate():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = BandwidthLimiter(1000, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        limiter.consume(500)
+
+    assert now[0] == pytest.approx(2.5)
+    assert BandwidthLimiter(None).consume(10 ** 9) is None
+
+def write_timeseries(path, num_columns=50):
+    timeseries = pd.DataFrame({f"out.end_use_{column}.energy_consumption": np.random.rand(8760) for column in range(num_columns)})
+    timeseries.insert(0, "timestamp", pd.date_range("2018-01-01", periods=8760, freq="h"))
+    timeseries.to_parquet(path)
+
+    return timeseries
+
+def test_fetch_projected_object_reads_only_the_requested_column_chunks(tmp_path):
+    source_dir = tmp_path / "lake"
+    source_dir.mkdir()
+    timeseries = write_timeseries(source_dir / "1-0.parquet")
+    columns = ["timestamp", "out.end_use_7.energy_consumption", "out.not_in_file.energy_consumption"]
+
+    entry = fetch_projected_object(LocalObjectStore(str(source_dir)), "1-0.parquet", str(tmp_path / "1-0.parquet"), columns)
+
+    projected = pd.read_parquet(tmp_path / "1-0.parquet")
+    pd.testing.assert_frame_equal(projected, timeseries[columns[:2]])
+    assert entry["fetched_bytes"] < entry["source_size"] / 5
+    assert entry["columns"] == sorted(columns)
+
+def test_download_objects_refetches_when_more_columns_are_needed(tmp_path):
+    source_dir = tmp_path / "lake"
+    source_dir.mkdir()
+    write_timeseries(source_dir / "1-0.parquet", num_columns=3)
+    store = LocalObjectStore(str(source_dir))
+    output_dir = str(tmp_path / "buildings")
+
+    first = ["timestamp", "out.end_use_0.energy_consumption"]
+    assert download_objects(None, None, ["1-0.parquet"], output_dir, columns=first, store=store)["downloaded"] == ["1-0.parquet"]
+    assert download_objects(None, None, ["1-0.parquet"], output_dir, columns=first[:1], store=store)["skipped"] == ["1-0.parquet"]
+
+    second = first + ["out.end_use_2.energy_consumption"]
+    assert not verify_downloads(output_dir, ["1-0.parquet"], second)
+    assert download_objects(None, None, ["1-0.parquet"], output_dir, columns=second, store=store)["downloaded"] == ["1-0.parquet"]
+    assert list(pd.read_parquet(os.path.join(output_dir, "1-0.parquet")).columns) == second
+
+def test_projected_fetch_through_s3_range_requests(s3, tmp_path):
+    timeseries = write_timeseries(tmp_path / "source.parquet")
+    s3.put_object(Bucket=BUCKET_NAME, Key=f"{PREFIX}9-0.parquet", Body=(tmp_path / "source.parquet").read_bytes())
+
+    columns = ["timestamp", "out.end_use_3.energy_consumption"]
+    summary = download_objects(s3, BUCKET_NAME, [f"{PREFIX}9-0.parquet"], str(tmp_path / "buildings"), columns=columns)
+
+    assert summary["downloaded"] == ["9-0.parquet"]
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "buildings" / "9-0.parquet"), timeseries[columns])
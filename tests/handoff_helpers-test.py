@@ -0,0 +1,112 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from handoff_helpers import (
+    disable_in_memory_handoff,
+    enable_in_memory_handoff,
+    flush,
+    intermediate_exists,
+    read_intermediate_csv,
+    write_intermediate_csv,
+)
+
+@pytest.fixture
+def profile():
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2018-01-01", periods=48, freq="h"),
+        "default.electricity.kwh": np.linspace(0.1, 4.8, 48),
+        "default.gas.therms": np.linspace(0.01, 0.48, 48),
+    })
+
+@pytest.fixture
+def county_dir(tmp_path):
+    county_dir = tmp_path / "baseline" / "single-family-detached" / "alameda"
+    county_dir.mkdir(parents=True)
+    return county_dir
+
+@pytest.fixture
+def in_memory():
+    yield enable_in_memory_handoff
+    disable_in_memory_handoff()
+
+@pytest.mark.parametrize("index", [False, True])
+@pytest.mark.parametrize("read_options", [
+    {},
+    {"parse_dates": ["timestamp"]},
+    {"usecols": ["default.gas.therms", "timestamp"]},
+    {"usecols": lambda column: column.startswith("default."), "parse_dates": None},
+])
+def test_in_memory_reads_match_the_csv_round_trip(tmp_path, profile, in_memory, index, read_options):
+    on_disk = tmp_path / "on_disk.csv"
+    handed_off = tmp_path / "handed_off.csv"
+    write_intermediate_csv(profile, on_disk, index=index)
+
+    in_memory(persist=False)
+    write_intermediate_csv(profile, handed_off, index=index)
+
+    expected = pd.read_csv(on_disk, **{key: value for key, value in read_options.items() if value is not None})
+    pd.testing.assert_frame_equal(read_intermediate_csv(handed_off, **read_options), expected)
+
+def test_in_memory_handoff_without_persisting_writes_nothing(tmp_path, profile, in_memory):
+    in_memory(persist=False)
+    output_file = tmp_path / "loadprofiles_for_rates_alameda.csv"
+
+    write_intermediate_csv(profile, output_file, index=False)
+    flush()
+
+    assert intermediate_exists(output_file)
+    assert not os.path.exists(output_file)
+
+def test_in_memory_handoff_persists_in_the_background(tmp_path, profile, in_memory):
+    in_memory(persist=True)
+    output_file = tmp_path / "loadprofiles_for_rates_alameda.csv"
+
+    write_intermediate_csv(profile, output_file, index=False)
+    flush()
+
+    pd.testing.assert_frame_equal(pd.read_csv(output_file, parse_dates=["timestamp"]), profile, check_freq=False)
+
+def test_read_missing_columns_raises(tmp_path, profile, in_memory):
+    in_memory(persist=False)
+    write_intermediate_csv(profile, tmp_path / "profile.csv", index=False)
+
+    with pytest.raises(ValueError, match="Usecols do not match columns"):
+        read_intermediate_csv(tmp_path / "profile.csv", usecols=["solarstorage.electricity.kwh"])
+
+@pytest.mark.parametrize("read_options", [
+    {},
+    {"parse_dates": ["timestamp"]},
+    {"usecols": ["default.gas.therms", "timestamp"]},
+])
+def test_reads_from_the_artifact_match_the_csv_round_trip(county_dir, profile, mocker, read_options):
+    output_file = county_dir / "loadprofiles_alameda.csv"
+    write_intermediate_csv(profile, output_file, index=False)
+
+    read_csv = mocker.spy(pd, "read_csv")
+    df = read_intermediate_csv(output_file, **read_options)
+
+    read_csv.assert_not_called()
+    pd.testing.assert_frame_equal(df, pd.read_csv(output_file, **read_options))
+
+def test_a_csv_newer_than_its_artifact_is_read_instead(county_dir, profile):
+    output_file = county_dir / "loadprofiles_alameda.csv"
+    write_intermediate_csv(profile, output_file, index=False)
+
+    edited = profile.assign(**{"default.gas.therms": 0.0})
+    edited.to_csv(output_file, index=False)
+    os.utime(output_file, (os.path.getmtime(output_file) + 10,) * 2)
+
+    assert (read_intermediate_csv(output_file)["default.gas.therms"] == 0.0).all()
+
+def test_short_paths_are_written_without_an_artifact(tmp_path, profile, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    write_intermediate_csv(profile, "out_head.csv", index=False)
+
+    assert os.listdir(tmp_path) == ["out_head.csv"]
+    pd.testing.assert_frame_equal(read_intermediate_csv("out_head.csv"), pd.read_csv("out_head.csv"))
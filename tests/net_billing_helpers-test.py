@@ -0,0 +1,78 @@
+import pytest
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import net_billing_helpers
+from net_billing_helpers import (
+    load_export_rates,
+    read_export_rates,
+    net_cycle_charges,
+    bill_net_billing,
+    get_export_rates_file_path,
+    EXPORT_RATE_COLUMN,
+)
+from tariff_helpers import bill_load_matrix, bill_baseline_credits, RATE_PLANS
+
+@pytest.fixture
+def export_rates_dir(tmp_path, monkeypatch):
+    """
+    Writes a flat $0.05/kWh export rate for every utility and points net billing at it.
+    """
+    for utility in RATE_PLANS:
+        file = get_export_rates_file_path(utility, 2018, str(tmp_path))
+        pd.DataFrame({EXPORT_RATE_COLUMN: [0.05] * 8760}).to_csv(file, index=False)
+
+    monkeypatch.setattr(net_billing_helpers, "load_export_rates", lambda utility, year: load_export_rates(utility, year, str(tmp_path)))
+    yield tmp_path
+    read_export_rates.cache_clear()
+
+def test_missing_export_rates_earn_no_credit_by_default(tmp_path):
+    export_rates = load_export_rates("PG&E", 2018, str(tmp_path / "missing"))
+
+    assert len(export_rates) == 8760
+    assert not export_rates.any()
+
+def test_missing_export_rates_raise_when_not_allowed(tmp_path, monkeypatch):
+    load_export_rates("PG&E", 2018, str(tmp_path / "missing")) # cached as missing
+    monkeypatch.setitem(net_billing_helpers.NET_BILLING, "allow_missing_export_rates", False)
+
+    with pytest.raises(FileNotFoundError):
+        load_export_rates("PG&E", 2018, str(tmp_path / "missing"))
+
+def test_export_rates_must_cover_the_year(tmp_path):
+    pd.DataFrame({EXPORT_RATE_COLUMN: [0.05] * 24}).to_csv(get_export_rates_file_path("SCE", 2018, str(tmp_path)), index=False)
+
+    with pytest.raises(ValueError):
+        read_export_rates("SCE", 2018, str(tmp_path))
+
+def test_unused_credits_carry_forward_to_next_cycle():
+    energy_charges = np.array([[10.0, 10.0, 10.0]])
+    export_credits = np.array([[25.0, 0.0, 0.0]])
+
+    billed = net_cycle_charges(energy_charges, export_credits)
+
+    assert billed.tolist() == [[0.0, 0.0, 5.0]]
+
+def test_net_billing_without_exports_matches_retail_billing(export_rates_dir):
+    load_matrix = np.array([[1.0 + (hour % 24) / 10 for hour in range(8760)], [0.3] * 8760])
+    rate_plans = list(RATE_PLANS["PG&E"])
+
+    expected = bill_load_matrix(load_matrix, [("PG&E", plan) for plan in rate_plans])
+    expected -= bill_baseline_credits(load_matrix, "PG&E", rate_plans, "X")
+
+    assert bill_net_billing(load_matrix, np.zeros_like(load_matrix), "PG&E", rate_plans, "X") == pytest.approx(expected)
+
+def test_exports_reduce_energy_charges_but_not_fixed_charges(export_rates_dir):
+    load_matrix = np.array([[1.0] * 8760])
+    rate_plans = list(RATE_PLANS["SCE"])
+
+    retail = bill_net_billing(load_matrix, np.zeros_like(load_matrix), "SCE", rate_plans)
+    small_export = bill_net_billing(load_matrix, np.full_like(load_matrix, 0.5), "SCE", rate_plans)
+    huge_export = bill_net_billing(load_matrix, np.full_like(load_matrix, 1000.0), "SCE", rate_plans)
+    fixed_charges = bill_load_matrix(np.zeros_like(load_matrix), [("SCE", plan) for plan in rate_plans])
+
+    assert small_export == pytest.approx(retail - 0.5 * 0.05 * 8760)
+    assert huge_export == pytest.approx(fixed_charges)
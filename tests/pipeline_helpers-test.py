@@ -0,0 +1,108 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import step5_convert_gas_appliances_to_electrical_appliances as ConvertGasToElectric
+from pipeline_helpers import get_module_parameters, hash_parameters, run_pipeline
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """
+    A two step pipeline: "load" copies an input file, "cost" multiplies the loaded value by a rate parameter.
+    """
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("2")
+    calls = []
+    params = {"rate": 3}
+
+    def load():
+        calls.append("load")
+        (tmp_path / "load.txt").write_text(input_file.read_text())
+
+    def cost():
+        calls.append("cost")
+        value = int((tmp_path / "load.txt").read_text()) * params["rate"]
+        (tmp_path / "cost.txt").write_text(str(value))
+        return {"cost": value}
+
+    def get_steps():
+        return [
+            {"name": "cost", "run": cost, "depends_on": ["load"], "outputs": [str(tmp_path / "cost.txt")], "params": dict(params)},
+            {"name": "load", "run": load, "inputs": [str(input_file)], "outputs": [str(tmp_path / "load.txt")]},
+        ]
+
+    return {"get_steps": get_steps, "calls": calls, "params": params, "input_file": input_file, "stamps_dir": str(tmp_path / ".pipeline"), "dir": tmp_path}
+
+def test_run_pipeline_runs_steps_in_dependency_order(pipeline):
+    results = run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+
+    assert pipeline["calls"] == ["load", "cost"]
+    assert results["cost"] == {"cost": 6}
+
+def test_run_pipeline_skips_up_to_date_steps_and_returns_recorded_results(pipeline):
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    pipeline["calls"].clear()
+
+    results = run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+
+    assert pipeline["calls"] == []
+    assert results["cost"] == {"cost": 6}
+
+def test_run_pipeline_reruns_only_steps_whose_parameters_changed(pipeline):
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    pipeline["calls"].clear()
+    pipeline["params"]["rate"] = 4
+
+    results = run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+
+    assert pipeline["calls"] == ["cost"]
+    assert results["cost"] == {"cost": 8}
+
+def test_run_pipeline_reruns_downstream_only_when_upstream_content_changes(pipeline):
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+
+    # Touching the input without changing its content invalidates nothing
+    pipeline["calls"].clear()
+    os.utime(pipeline["input_file"], ns=(0, 0))
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    assert pipeline["calls"] == []
+
+    pipeline["input_file"].write_text("5")
+    results = run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    assert pipeline["calls"] == ["load", "cost"]
+    assert results["cost"] == {"cost": 15}
+
+def test_run_pipeline_reruns_steps_whose_outputs_were_deleted(pipeline):
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    pipeline["calls"].clear()
+    os.remove(pipeline["dir"] / "load.txt")
+
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+
+    # The recreated output is identical, so the downstream step is still up to date
+    assert pipeline["calls"] == ["load"]
+
+def test_run_pipeline_force_recompute(pipeline):
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"])
+    pipeline["calls"].clear()
+
+    run_pipeline(pipeline["get_steps"](), pipeline["stamps_dir"], force_recompute=True)
+
+    assert pipeline["calls"] == ["load", "cost"]
+
+def test_get_module_parameters_tracks_module_constants(mocker):
+    params = get_module_parameters(ConvertGasToElectric)
+    assert params[ConvertGasToElectric.__name__]["COP_HEAT_PUMP"] == ConvertGasToElectric.COP_HEAT_PUMP
+
+    mocker.patch.object(ConvertGasToElectric, "COP_HEAT_PUMP", ConvertGasToElectric.COP_HEAT_PUMP + 1)
+    assert hash_parameters(get_module_parameters(ConvertGasToElectric)) != hash_parameters(params)
+
+def test_run_pipeline_without_stamps_runs_every_step(pipeline):
+    run_pipeline(pipeline["get_steps"](), None)
+    results = run_pipeline(pipeline["get_steps"](), None)
+
+    assert pipeline["calls"] == ["load", "cost", "load", "cost"]
+    assert results["cost"] == {"cost": 6}
+    assert not os.path.exists(pipeline["stamps_dir"])
@@ -0,0 +1,57 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from pv_profile_helpers import get_normalized_pv_profile, get_pv_profile_path, get_pv_profile_key, scale_pv_profile
+
+@pytest.fixture
+def cache_dir(mocker, tmp_path):
+    cache_dir = tmp_path / "cache"
+    mocker.patch.dict("pv_profile_helpers.PV_PROFILE_CACHE", {"enabled": True, "dir": str(cache_dir)})
+    return cache_dir
+
+@pytest.fixture
+def weather_file(tmp_path):
+    weather_file = tmp_path / "weather_TMY_alameda.csv"
+    weather_file.write_text("gh\n100\n200\n")
+    return str(weather_file)
+
+def simulate_1kw():
+    return {"ac": [0.0, 800.0, 400.0], "dc": [0.0, 850.0, 420.0], "inverter_efficiency": 96.0}
+
+def test_profile_is_simulated_once_per_weather_file_and_configuration(cache_dir, weather_file, mocker):
+    simulate = mocker.Mock(side_effect=simulate_1kw)
+
+    first = get_normalized_pv_profile(weather_file, {"dc_ac_ratio": 1.2}, simulate)
+    second = get_normalized_pv_profile(weather_file, {"dc_ac_ratio": 1.2}, simulate)
+
+    assert simulate.call_count == 1
+    np.testing.assert_array_equal(first["ac"], second["ac"])
+    assert second["inverter_efficiency"] == 96.0
+
+    get_normalized_pv_profile(weather_file, {"dc_ac_ratio": 1.3}, simulate)
+    assert simulate.call_count == 2
+
+def test_unreadable_profile_is_simulated_again(cache_dir, weather_file, mocker):
+    simulate = mocker.Mock(side_effect=simulate_1kw)
+    get_normalized_pv_profile(weather_file, {}, simulate)
+
+    with open(get_pv_profile_path(get_pv_profile_key(weather_file, {})), "wb") as file:
+        file.write(b"not a profile")
+
+    profile = get_normalized_pv_profile(weather_file, {}, simulate)
+
+    assert simulate.call_count == 2
+    np.testing.assert_array_equal(profile["dc"], [0.0, 850.0, 420.0])
+
+def test_scale_pv_profile():
+    profile = {"ac": np.array([0.0, 800.0]), "dc": np.array([0.0, 850.0]), "inverter_efficiency": 96.0}
+
+    scaled = scale_pv_profile(profile, 4.5)
+
+    np.testing.assert_array_equal(scaled["ac"], [0.0, 3600.0])
+    np.testing.assert_array_equal(scaled["dc"], [0.0, 3825.0])
+    assert scaled["inverter_efficiency"] == 96.0
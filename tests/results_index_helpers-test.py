@@ -0,0 +1,103 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from results_index_helpers import (
+    RESULTS_INDEX_FILE_NAME,
+    get_latest_csv_file,
+    get_latest_result,
+    parse_results_path,
+    prune_results,
+    record_result,
+)
+
+def write_results(results_dir, name, county, run_id):
+    os.makedirs(results_dir, exist_ok=True)
+    file_path = os.path.join(results_dir, f"{name}_{county}_{run_id}.csv")
+    pd.DataFrame({"electricity.PG&E.E-TOU-C": [1500.0]}, index=pd.Index(["baseline"], name="scenario")).to_csv(file_path)
+
+    return file_path
+
+@pytest.fixture
+def results_dir(tmp_path):
+    return os.path.join(tmp_path, "baseline", "single-family-detached", "alameda", "results", "electricity")
+
+def test_parse_results_path(tmp_path, results_dir):
+    base_dir, entry = parse_results_path(os.path.join(results_dir, "RESULTS_electricity_annual_costs_alameda_20250102_13.csv"))
+
+    assert base_dir == str(tmp_path)
+    assert entry["scenario"] == "baseline"
+    assert entry["housing_type"] == "single-family-detached"
+    assert entry["county"] == "alameda"
+    assert entry["service"] == "electricity"
+    assert entry["name"] == "RESULTS_electricity_annual_costs"
+    assert entry["run_id"] == "20250102_13"
+
+    assert parse_results_path(os.path.join(tmp_path, "baseline", "RESULTS_electricity_annual_costs_alameda_20250102_13.csv")) is None
+    assert parse_results_path(os.path.join(results_dir, "notes.csv")) is None
+
+def test_recorded_results_are_looked_up_without_scanning(tmp_path, results_dir, mocker):
+    write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250101_09")
+    latest = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250102_13")
+    for file_name in os.listdir(results_dir):
+        record_result(os.path.join(results_dir, file_name), rate_plans=["electricity.PG&E.E-TOU-C"])
+
+    assert os.path.exists(os.path.join(tmp_path, RESULTS_INDEX_FILE_NAME))
+
+    listdir = mocker.patch("results_index_helpers.os.listdir")
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == latest
+    listdir.assert_not_called()
+
+def test_unrecorded_directories_are_scanned_and_indexed(tmp_path, results_dir):
+    write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250102_13")
+    latest = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250103_08")
+
+    assert get_latest_result(str(tmp_path), "baseline", "single-family-detached", "alameda", "electricity", "RESULTS_electricity_annual_costs") is None
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == latest
+    assert get_latest_result(str(tmp_path), "baseline", "single-family-detached", "alameda", "electricity", "RESULTS_electricity_annual_costs") == latest
+
+def test_unrecorded_directories_are_scanned_once(results_dir, mocker):
+    latest = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250103_08")
+    get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_")
+
+    listdir = mocker.patch("results_index_helpers.os.listdir")
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == latest
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_") == latest
+    listdir.assert_not_called()
+
+def test_newer_unrecorded_results_are_not_hidden(results_dir):
+    record_result(write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250102_13"))
+
+    latest = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250103_08")
+
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == latest
+
+def test_deleted_results_fall_back_to_the_directory(results_dir):
+    older = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250102_13")
+    latest = write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", "20250103_08")
+    record_result(older)
+    record_result(latest)
+
+    os.remove(latest)
+
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == older
+
+def test_missing_results_raise(results_dir):
+    os.makedirs(results_dir)
+
+    with pytest.raises(FileNotFoundError):
+        get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_")
+
+def test_prune_results_keeps_the_latest_runs(tmp_path, results_dir):
+    files = [write_results(results_dir, "RESULTS_electricity_annual_costs", "alameda", run_id) for run_id in ["20250101_09", "20250102_13", "20250103_08"]]
+    for file_path in files:
+        record_result(file_path)
+
+    deleted = prune_results(str(tmp_path), keep_runs=2)
+
+    assert deleted == [files[0]]
+    assert sorted(os.listdir(results_dir)) == sorted(os.path.basename(file_path) for file_path in files[1:])
+    assert get_latest_csv_file(results_dir, "RESULTS_electricity_annual_costs_alameda_") == files[2]
@@ -0,0 +1,79 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from sam_result_cache_helpers import evict_sam_results, get_cache_statistics, get_sam_result_key, get_sam_result_path, list_cached_results, load_sam_result, save_sam_result
+
+@pytest.fixture
+def cache_dir(mocker, tmp_path):
+    cache_dir = tmp_path / "cache"
+    mocker.patch.dict("sam_result_cache_helpers.SAM_RESULT_CACHE", {"enabled": True, "dir": str(cache_dir), "quota_bytes": 10 ** 9})
+    return cache_dir
+
+@pytest.fixture
+def weather_file(tmp_path):
+    weather_file = tmp_path / "weather_TMY_alameda.csv"
+    weather_file.write_text("gh\n100\n200\n")
+    return str(weather_file)
+
+def test_key_changes_with_every_input(weather_file, tmp_path):
+    key = get_sam_result_key(weather_file, [1.0, 2.0], {"battery": {"batt_simple_kwh": 13.5}})
+
+    assert get_sam_result_key(weather_file, [1.0, 2.0], {"battery": {"batt_simple_kwh": 13.5}}) == key
+    assert get_sam_result_key(weather_file, [1.0, 2.5], {"battery": {"batt_simple_kwh": 13.5}}) != key
+    assert get_sam_result_key(weather_file, [1.0, 2.0], {"battery": {"batt_simple_kwh": 27.0}}) != key
+
+    with open(weather_file, "a") as file:
+        file.write("300\n")
+    assert get_sam_result_key(weather_file, [1.0, 2.0], {"battery": {"batt_simple_kwh": 13.5}}) != key
+
+def test_results_round_trip_and_are_counted(cache_dir):
+    assert load_sam_result("abc") is None
+
+    save_sam_result("abc", {"grid_to_load": [0.5, 0.25], "battery_capacity": 13.5})
+    outputs = load_sam_result("abc")
+
+    np.testing.assert_array_equal(outputs["grid_to_load"], [0.5, 0.25])
+    assert outputs["battery_capacity"] == 13.5
+    statistics = get_cache_statistics()
+    assert (statistics["hits"], statistics["misses"], statistics["entries"]) == (1, 1, 1)
+    assert statistics["hit_rate"] == 0.5
+
+def test_unreadable_results_are_deleted(cache_dir):
+    save_sam_result("abc", {"grid_to_load": [0.5, 0.25]})
+    with open(get_sam_result_path("abc"), "wb") as file:
+        file.write(b"PK\x03\x04truncated")
+
+    assert load_sam_result("abc") is None
+    assert not os.path.exists(get_sam_result_path("abc"))
+    assert get_cache_statistics()["misses"] == 1
+
+def test_results_evicted_while_listing_are_skipped(cache_dir, mocker):
+    save_sam_result("abc", {"grid_to_load": [0.5, 0.25]})
+    save_sam_result("def", {"grid_to_load": [0.5, 0.25]})
+    stat = os.stat
+
+    # abc is evicted by another process between listing the directory and reading its size
+    def stat_evicted(path):
+        if path == get_sam_result_path("abc"):
+            raise FileNotFoundError(path)
+        return stat(path)
+
+    mocker.patch("sam_result_cache_helpers.os.stat", side_effect=stat_evicted)
+
+    assert [path for _, _, path in list_cached_results()] == [get_sam_result_path("def")]
+
+def test_least_recently_used_results_are_evicted(cache_dir):
+    for i, key in enumerate(["old", "recent", "new"]):
+        save_sam_result(key, {"grid_to_load": np.arange(1000.0) * i})
+        os.utime(get_sam_result_path(key), (1000 + i, 1000 + i))
+    size = os.path.getsize(get_sam_result_path("new"))
+
+    deleted = evict_sam_results(quota_bytes=2 * size + 100, keep=[get_sam_result_path("old")])
+
+    assert deleted == [get_sam_result_path("recent")]
+    assert load_sam_result("old") is not None
+    assert get_cache_statistics()["evictions"] == 1
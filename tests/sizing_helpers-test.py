@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from capital_costs_helper import CAPITAL_COSTS, INCENTIVES, calculate_net_system_costs, calculate_system_payback_costs
+from sizing_helpers import calculate_npvs, calculate_payback_periods, get_candidate_sizes, rank_candidates, select_optimal_size
+
+def test_candidate_grid_covers_every_combination():
+    solar_kw, battery_counts = get_candidate_sizes([2.0, 4.0, 6.0], [1, 2])
+
+    assert list(zip(solar_kw, battery_counts)) == [(2.0, 1), (2.0, 2), (4.0, 1), (4.0, 2), (6.0, 1), (6.0, 2)]
+
+def test_net_costs_match_the_payback_maps():
+    solar_kw, battery_counts = np.array([5.0, 5.0]), np.array([1, 2])
+
+    net_costs = calculate_net_system_costs(solar_kw, battery_counts, "PG&E")
+
+    powerwall = CAPITAL_COSTS["storage"]["powerwall_13.5kwh"]
+    solar = 5000 * CAPITAL_COSTS["solar"]["dollars_per_watt"] * (1 + CAPITAL_COSTS["solar"]["installation_labor"] + CAPITAL_COSTS["solar"]["design_eng_overhead_percent"])
+    expected = (solar + powerwall * battery_counts) * (1 - INCENTIVES["federal_tax_credit_2023_2032"]) - INCENTIVES["PGE_SCE_SDGE_General_SGIP_Rebate"]
+    np.testing.assert_allclose(net_costs, expected)
+    np.testing.assert_array_equal(solar_kw, [5.0, 5.0]) # inputs are not modified
+
+def test_system_payback_costs_keep_step12s_net_powerwall_price():
+    costs = calculate_system_payback_costs(np.array([5.0, 5.0]), np.array([1, 2]))
+
+    np.testing.assert_allclose(costs, 5000 * 2.83 * 1.35 + 10748 * np.array([1, 2]))
+
+def test_payback_is_infinite_without_savings():
+    np.testing.assert_array_equal(calculate_payback_periods([10000, 10000], [1000, -50]), [10, np.inf])
+
+def test_npv_charges_battery_replacements():
+    one, two = calculate_npvs([10000, 10000], [1000, 1000], [1, 2], discount_rate=0.0)
+
+    assert one == 25 * 1000 - 10000 - CAPITAL_COSTS["storage"]["powerwall_13.5kwh"] # one replacement in 25 years
+    assert one - two == CAPITAL_COSTS["storage"]["powerwall_13.5kwh"]
+
+def test_select_optimal_size_by_objective():
+    solar_kw, battery_counts = np.array([2.0, 6.0, 10.0]), np.array([1, 1, 1])
+    net_costs = np.array([10000.0, 20000.0, 44000.0])
+    annual_savings = np.array([800.0, 2000.0, 4000.0])
+
+    best, economics = select_optimal_size(solar_kw, battery_counts, net_costs, annual_savings, objective="payback")
+    assert best == 1 and economics["payback"] == 10
+
+    best, _ = select_optimal_size(solar_kw, battery_counts, net_costs, annual_savings, objective="npv")
+    assert best == 2
+
+    with pytest.raises(ValueError):
+        select_optimal_size(solar_kw, battery_counts, net_costs, annual_savings, objective="irr")
+
+def test_rank_candidates_orders_every_candidate():
+    battery_counts = np.array([1, 1, 1])
+    net_costs = np.array([10000.0, 20000.0, 44000.0])
+    annual_savings = np.array([800.0, 2000.0, 4000.0])
+
+    ranked, paybacks, _ = rank_candidates(battery_counts, net_costs, annual_savings, objective="payback")
+
+    assert list(ranked) == [1, 2, 0]
+    assert list(paybacks[ranked]) == sorted(paybacks)
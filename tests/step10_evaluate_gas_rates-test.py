@@ -17,8 +17,12 @@ from step10_evaluate_gas_rates import (
     OUTPUT_FILE_NAME,
     INPUT_FILE_NAME,
     BASELINE_ALLOWANCES,
-    RATE_PLANS
+    GAS_RATE_PLANS,
+    bill_gas_matrix,
+    calculate_annual_costs_gas,
+    process_batch,
 )
+import numpy as np
 
 @pytest.fixture
 def sample_load_profile():
@@ -99,3 +103,60 @@ def test_categorize_season_invalid_month(invalid_month):
     """
     with pytest.raises(ValueError, match=f"Unexpected month provided: {invalid_month}"):
         categorize_season(invalid_month)
+
+def test_bill_gas_matrix_splits_each_day_against_the_allowance():
+    # 2 therms on Jan 1st only: 1.68 therms within territory T's winter on-peak allowance, the rest excess
+    therms = np.zeros(8760)
+    therms[:24] = 2.0 / 24
+
+    annual_cost = bill_gas_matrix(therms, "PG&E", "G-1", "T")[0]
+
+    plan = GAS_RATE_PLANS["PG&E"]["G-1"]
+    expected = 1.68 * plan["baseline"]["total_charge"] + 0.32 * plan["excess"]["total_charge"]
+    assert annual_cost == pytest.approx(expected)
+
+def test_bill_gas_matrix_adds_daily_customer_charges():
+    therms = np.zeros((1, 8760))
+    plan = GAS_RATE_PLANS["SCE"]["GR"]
+
+    # 181 days from November to April at the space heating winter charge
+    assert bill_gas_matrix(therms, "SCE", "GR", "Zone1", space_heating=False)[0] == pytest.approx(365 * plan["customer_charge"])
+    assert bill_gas_matrix(therms, "SCE", "GR", "Zone1", space_heating=True)[0] == pytest.approx(
+        184 * plan["customer_charge"] + 181 * plan["customer_charge_space_heating_winter"]
+    )
+
+def test_bill_gas_matrix_applies_minimum_bill_per_cycle():
+    plan = GAS_RATE_PLANS["SDG&E"]["GR"]
+    idle = np.zeros((1, 8760))
+    busy = np.full((1, 8760), 1.0)
+
+    assert bill_gas_matrix(idle, "SDG&E", "GR", "all")[0] == pytest.approx(365 * plan["minimum_bill_per_day"]["non_care"])
+    assert bill_gas_matrix(busy, "SDG&E", "GR", "all")[0] > 365 * 24 * plan["baseline"]["total_charge"]
+
+def test_calculate_annual_costs_gas_matches_batch_billing():
+    therms = [0.05 + (hour % 24) / 100 for hour in range(8760)]
+    load_profile_df = pd.DataFrame({"default.gas.therms": therms})
+
+    annual_cost = calculate_annual_costs_gas(load_profile_df, "X", "default", "PG&E", "G-1")
+
+    assert annual_cost == pytest.approx(bill_gas_matrix(np.array([therms, therms]), "PG&E", "G-1", "X")[0])
+
+def test_process_batch_writes_gas_results_for_each_county(tmp_path):
+    for county in ["alameda", "los-angeles"]:
+        county_dir = tmp_path / "baseline" / "single-family-detached" / county
+        county_dir.mkdir(parents=True)
+        pd.DataFrame({
+            "default.gas.therms": [0.1] * 8760,
+            "solarstorage.gas.therms": [0.1] * 8760,
+        }).to_csv(county_dir / f"{INPUT_FILE_NAME}_{county}.csv", index=False)
+
+    process_batch(tmp_path, tmp_path, ["baseline"], ["single-family-detached"], ["Alameda County", "Los Angeles County"])
+
+    output_dir = tmp_path / "baseline" / "single-family-detached" / "los-angeles" / "results" / "gas"
+    output_files = list(output_dir.glob(f"{OUTPUT_FILE_NAME}_los-angeles_*.csv"))
+    assert len(output_files) == 1
+
+    results_df = pd.read_csv(output_files[0], index_col="scenario")
+    expected = bill_gas_matrix(np.full((1, 8760), 0.1), "SCE", "GR", "Zone1")[0]
+    assert list(results_df.columns) == ["gas.SCE.GR"]
+    assert results_df.loc["baseline.solarstorage", "gas.SCE.GR"] == pytest.approx(expected)
@@ -9,11 +9,18 @@ import sys
 from pathlib import Path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
+from datetime import datetime, timedelta
+import numpy as np
+import net_billing_helpers
+from tariff_helpers import compile_baseline_allowances, get_baseline_usage, get_baseline_territory
 from step11_evaluate_electricity_rates import (
     get_season,
     calculate_annual_costs_electricity,
     process_county_scenario,
     process,
+    process_batch,
+    calculate_cost_table,
+    find_best_rate_plans,
     RATE_PLANS,
 )
 
@@ -44,6 +51,28 @@ def test_get_season_winter():
     hour_index = (14 * 24) + 6  # 14 days * 24 + 6 hours
     assert get_season(hour_index) == "winter"
 
+def test_get_season_sdge_october_is_summer():
+    # October 15, 2018: winter for PG&E, summer for SDG&E
+    hour_index = 287 * 24
+    assert get_season(hour_index) == "winter"
+    assert get_season(hour_index, "SDG&E") == "summer"
+
+def test_holidays_billed_at_weekend_prices():
+    # Wednesday July 4th 2018 should cost the same as the following Saturday
+    july_4 = [0.0] * 8760
+    july_7 = [0.0] * 8760
+    july_4[184 * 24:185 * 24] = [1.0] * 24
+    july_7[187 * 24:188 * 24] = [1.0] * 24
+    july_5 = [0.0] * 8760
+    july_5[185 * 24:186 * 24] = [1.0] * 24
+
+    holiday_cost = calculate_annual_costs_electricity(july_4, "PG&E", "E-TOU-D")["E-TOU-D"]
+    weekend_cost = calculate_annual_costs_electricity(july_7, "PG&E", "E-TOU-D")["E-TOU-D"]
+    weekday_cost = calculate_annual_costs_electricity(july_5, "PG&E", "E-TOU-D")["E-TOU-D"]
+
+    assert round(holiday_cost, 6) == round(weekend_cost, 6)
+    assert round(holiday_cost, 6) != round(weekday_cost, 6)
+
 def test_calculate_annual_costs_electricity():
     # Using a load profile of 1 kWh every hour
     annual_costs = calculate_annual_costs_electricity(TEST_LOAD_PROFILE)
@@ -164,3 +193,206 @@ def test_invalid_load_type():
         process(base_input_dir, base_output_dir, counties, scenarios, housing_types, load_type)
 
     assert "Invalid load_type 'invalid_load_type'. Must be one of ['default', 'solarstorage']." in str(exc_info.value)
+
+HOLIDAYS_2018 = ["2018-01-01", "2018-05-28", "2018-07-04", "2018-09-03", "2018-11-22", "2018-12-25"]
+SUMMER_MONTHS = {"PG&E": [6, 7, 8, 9], "SCE": [6, 7, 8, 9], "SDG&E": [6, 7, 8, 9, 10]}
+
+def legacy_hourly_loop_costs(load_profile, utility, rate_plan_name):
+    """
+    Reference implementation: the hour-by-hour billing loop, walking the 2018 calendar.
+    """
+    from datetime import datetime, timedelta
+
+    total = 0.0
+    plan_details = RATE_PLANS[utility][rate_plan_name]
+
+    for hour_index, hourly_load in enumerate(load_profile):
+        current_datetime = datetime(year=2018, month=1, day=1) + timedelta(hours=hour_index)
+        season = "summer" if current_datetime.month in SUMMER_MONTHS[utility] else "winter"
+        hour = current_datetime.hour
+        is_offpeak_day = current_datetime.weekday() >= 5 or current_datetime.strftime("%Y-%m-%d") in HOLIDAYS_2018
+
+        season_rates = plan_details.get(season)
+        if not season_rates:
+            continue
+
+        dayotw_rates = season_rates.get("weekdays")
+        if is_offpeak_day:
+            dayotw_rates = season_rates.get("weekends") or season_rates.get("weekend") or dayotw_rates
+        if not dayotw_rates:
+            continue
+
+        if hour in dayotw_rates.get("peakHours", []):
+            rate = dayotw_rates.get("peak", 0.0)
+        elif "partPeakHours" in dayotw_rates and hour in dayotw_rates.get("partPeakHours", []):
+            rate = dayotw_rates["partPeak"]
+        elif "superOffPeakHours" in dayotw_rates and hour in dayotw_rates.get("superOffPeakHours", []):
+            rate = dayotw_rates["superOffPeak"]
+        else:
+            rate = dayotw_rates.get("offPeak", 0.0)
+
+        total += hourly_load * rate
+        total += dayotw_rates.get("fixedCharge", 0.0) / 12
+
+    return total
+
+ALL_RATE_PLANS = [(utility, plan) for utility, plans in RATE_PLANS.items() for plan in plans]
+
+@pytest.mark.parametrize("utility, rate_plan", ALL_RATE_PLANS)
+def test_compiled_tariff_matches_hourly_loop(utility, rate_plan):
+    load_profile = [1.0 + (hour % 24) / 10 + (hour % 7) / 3 for hour in range(8760)]
+
+    annual_costs = calculate_annual_costs_electricity(load_profile, utility, rate_plan)
+    expected = legacy_hourly_loop_costs(load_profile, utility, rate_plan)
+
+    assert round(annual_costs[rate_plan], 2) == round(expected, 2)
+
+def test_compiled_tariff_partial_year():
+    load_profile = [2.0] * 24
+
+    annual_costs = calculate_annual_costs_electricity(load_profile, "PG&E", "EV2-A")
+
+    assert round(annual_costs["EV2-A"], 2) == round(legacy_hourly_loop_costs(load_profile, "PG&E", "EV2-A"), 2)
+
+def test_compiled_tariff_rejects_more_than_a_year():
+    with pytest.raises(ValueError):
+        calculate_annual_costs_electricity([1.0] * 8761, "PG&E", "E-TOU-C")
+
+def test_calculate_cost_table_matches_single_profile_billing():
+    profiles = [
+        {"county": "alameda", "utility": "PG&E", "scenario": "baseline", "load_type": "default", "load_profile": [1.0 + (h % 24) / 10 for h in range(8760)]},
+        {"county": "alameda", "utility": "PG&E", "scenario": "baseline", "load_type": "solarstorage", "load_profile": [0.5] * 8760},
+        {"county": "los-angeles", "utility": "SCE", "scenario": "baseline", "load_type": "default", "load_profile": [2.0] * 24},
+    ]
+
+    cost_table = calculate_cost_table(profiles)
+
+    # Only plans offered by each profile's utility are kept
+    assert len(cost_table) == 2 * len(RATE_PLANS["PG&E"]) + len(RATE_PLANS["SCE"])
+    assert set(cost_table[cost_table["county"] == "los-angeles"]["rate_plan"]) == set(RATE_PLANS["SCE"])
+
+    for profile in profiles:
+        for rate_plan in RATE_PLANS[profile["utility"]]:
+            expected = calculate_annual_costs_electricity(profile["load_profile"], profile["utility"], rate_plan, profile["county"])[rate_plan]
+            row = cost_table[
+                (cost_table["county"] == profile["county"])
+                & (cost_table["load_type"] == profile["load_type"])
+                & (cost_table["rate_plan"] == rate_plan)
+            ]
+            assert row["annual_cost"].iloc[0] == pytest.approx(expected)
+
+def test_process_batch_writes_results_for_each_county(tmp_path):
+    for county in ["alameda", "los-angeles"]:
+        county_dir = tmp_path / "baseline" / "single-family-detached" / county
+        county_dir.mkdir(parents=True)
+        pd.DataFrame({
+            "default.electricity.kwh": [1.0] * 8760,
+            "solarstorage.electricity.kwh": [0.25] * 8760,
+        }).to_csv(county_dir / f"loadprofiles_for_rates_{county}.csv", index=False)
+
+    cost_table = process_batch(tmp_path, tmp_path, ["baseline"], "single-family-detached", ["Alameda County", "Los Angeles County"])
+
+    assert set(cost_table["county"]) == {"alameda", "los-angeles"}
+
+    output_dir = tmp_path / "baseline" / "single-family-detached" / "alameda" / "results" / "electricity"
+    output_files = list(output_dir.glob("RESULTS_electricity_annual_costs_alameda_*.csv"))
+    assert len(output_files) == 1
+
+    results_df = pd.read_csv(output_files[0], index_col="scenario")
+    assert list(results_df.index) == ["baseline", "baseline.solarstorage"]
+    assert list(results_df.columns) == [f"electricity.PG&E.{plan}" for plan in [*RATE_PLANS["PG&E"], "best"]]
+    expected = calculate_annual_costs_electricity([0.25] * 8760, "PG&E", "E-TOU-C", "alameda")["E-TOU-C"]
+    assert results_df.loc["baseline.solarstorage", "electricity.PG&E.E-TOU-C"] == pytest.approx(expected)
+
+def test_baseline_allowance_is_daily_allowance_times_days_in_cycle():
+    cycle_allowances = compile_baseline_allowances("PG&E", "T")
+
+    assert cycle_allowances[0] == pytest.approx(7.5 * 31) # January, winter
+    assert cycle_allowances[6] == pytest.approx(6.5 * 31) # July, summer
+    assert cycle_allowances[1] == pytest.approx(7.5 * 28)
+
+def test_baseline_usage_restarts_every_billing_cycle():
+    load_profile = [0.5 + (hour % 24) / 12 for hour in range(8760)]
+    cycle_allowances = compile_baseline_allowances("SCE", "8")
+
+    baseline_usage = get_baseline_usage(np.array([load_profile]), cycle_allowances)[0]
+
+    # Reference: walk the year hour by hour, resetting the running total every month
+    start = datetime(2018, 1, 1)
+    expected = []
+    used, current_month = 0.0, 1
+    for hour_index, hourly_load in enumerate(load_profile):
+        month = (start + timedelta(hours=hour_index)).month
+        if month != current_month:
+            used, current_month = 0.0, month
+        within = min(hourly_load, max(cycle_allowances[month - 1] - used, 0.0))
+        used += hourly_load
+        expected.append(within)
+
+    assert baseline_usage == pytest.approx(expected)
+
+def test_baseline_credit_applies_to_usage_under_the_allowance():
+    small_load = [0.1] * 8760 # 2.4 kWh/day, always within territory T's allowance
+    large_load = [5.0] * 8760
+
+    small_credit = (
+        calculate_annual_costs_electricity(small_load, "PG&E", "E-TOU-C")["E-TOU-C"]
+        - calculate_annual_costs_electricity(small_load, "PG&E", "E-TOU-C", "san-francisco")["E-TOU-C"]
+    )
+    large_credit = (
+        calculate_annual_costs_electricity(large_load, "PG&E", "E-TOU-C")["E-TOU-C"]
+        - calculate_annual_costs_electricity(large_load, "PG&E", "E-TOU-C", "san-francisco")["E-TOU-C"]
+    )
+
+    assert small_credit == pytest.approx(0.10135 * 876)
+    assert large_credit == pytest.approx(0.10135 * compile_baseline_allowances("PG&E", "T").sum())
+
+def test_no_baseline_credit_without_territory():
+    load_profile = [1.0] * 8760
+
+    assert get_baseline_territory("san-diego", "SDG&E") is None
+    assert calculate_annual_costs_electricity(load_profile, "SDG&E", "TOU-DR1", "san-diego")["TOU-DR1"] == pytest.approx(
+        calculate_annual_costs_electricity(load_profile, "SDG&E", "TOU-DR1")["TOU-DR1"]
+    )
+
+def test_calculate_cost_table_bills_exports_under_net_billing(monkeypatch):
+    load_export_rates = net_billing_helpers.load_export_rates
+    monkeypatch.setattr(net_billing_helpers, "load_export_rates", lambda utility, year: load_export_rates(utility, year, "missing"))
+    profile = {"county": "alameda", "utility": "PG&E", "scenario": "baseline", "load_type": "solarstorage", "load_profile": [1.0] * 8760}
+    cost_table = calculate_cost_table([profile, {**profile, "load_type": "default", "export_profile": [0.5] * 8760}])
+
+    # Without an avoided cost file exports earn nothing, and net billing matches retail billing
+    retail = cost_table[cost_table["load_type"] == "solarstorage"]["annual_cost"].to_numpy()
+    net_billed = cost_table[cost_table["load_type"] == "default"]["annual_cost"].to_numpy()
+    assert net_billed == pytest.approx(retail)
+
+def test_calculate_annual_costs_electricity_credits_exports(monkeypatch):
+    monkeypatch.setattr(net_billing_helpers, "load_export_rates", lambda utility, year: np.full(8760, 0.05))
+
+    retail = calculate_annual_costs_electricity(TEST_LOAD_PROFILE, "PG&E", "E-TOU-C", "alameda")
+    net_billed = calculate_annual_costs_electricity(TEST_LOAD_PROFILE, "PG&E", "E-TOU-C", "alameda", export_profile=[0.5] * 8760)
+
+    assert net_billed["E-TOU-C"] < retail["E-TOU-C"]
+
+def test_find_best_rate_plans_respects_eligibility():
+    cost_table = pd.DataFrame(
+        [
+            ["alameda", "PG&E", scenario, load_type, rate_plan, cost]
+            for scenario in ["baseline", "heat_pump"]
+            for load_type in ["default", "solarstorage"]
+            for rate_plan, cost in [("E-TOU-C", 120.0), ("E-TOU-D", 110.0), ("EV2-A", 90.0), ("E-ELEC", 100.0)]
+        ],
+        columns=["county", "utility", "scenario", "load_type", "rate_plan", "annual_cost"],
+    )
+
+    best = find_best_rate_plans(cost_table).set_index(["scenario", "load_type"])
+
+    # Baseline homes without storage can only use the unrestricted plans
+    assert best.loc[("baseline", "default"), "best_rate_plan"] == "E-TOU-D"
+    assert best.loc[("baseline", "default"), "runner_up_rate_plan"] == "E-TOU-C"
+    assert best.loc[("baseline", "default"), "savings_vs_default"] == 0
+    # Heat pumps unlock E-ELEC, batteries also unlock EV2-A
+    assert best.loc[("heat_pump", "default"), "best_rate_plan"] == "E-ELEC"
+    assert best.loc[("heat_pump", "default"), "savings_vs_default"] == pytest.approx(10.0)
+    assert best.loc[("baseline", "solarstorage"), "best_rate_plan"] == "EV2-A"
+    assert best.loc[("baseline", "solarstorage"), "runner_up_rate_plan"] == "E-ELEC"
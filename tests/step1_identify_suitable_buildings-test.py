@@ -10,10 +10,15 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../'
 from helpers import LOADPROFILES
 
 from step1_identify_suitable_buildings import (
+    BUILDING_COUNTS_FILE_NAME,
     get_metadata,
+    get_metadata_cache_path,
+    get_metadata_columns,
+    load_cached_metadata,
     filter_metadata,
     save_building_ids,
     process,
+    process_housing_types,
 )
 
 @pytest.fixture
@@ -265,4 +270,67 @@ def test_process_regenerates_when_force_recompute_true(mocker, sample_metadata,
 
     assert expected_file in result, f"Expected {expected_file} in process() return list, but got {result}"
     assert os.path.exists(expected_file), f"File {expected_file} should exist."
-    
\ No newline at end of file
+    
+def test_get_metadata_caches_pruned_categorical_parquet(mocker, sample_metadata, tmp_path):
+    metadata_path = str(tmp_path / "CA_metadata_and_annual_results.csv")
+    sample_metadata.assign(**{"in.county": ["G0600010", "G0600130", "G0600750"], "in.vacancy_status": "Occupied", "in.tenure": "Owner", "out.site_energy.total.energy_consumption": 1.0}).to_csv(metadata_path, index=False)
+    mocker.patch("step1_identify_suitable_buildings.get_metadata_path", return_value=metadata_path)
+
+    metadata = get_metadata("baseline")
+
+    assert os.path.exists(get_metadata_cache_path(metadata_path))
+    assert "out.site_energy.total.energy_consumption" not in metadata.columns
+    assert set(get_metadata_columns()) & set(sample_metadata.columns) <= set(metadata.columns)
+    assert metadata["in.county_name"].dtype == "category"
+
+    # Warm run reads the Parquet copy only
+    read_csv = mocker.patch("pandas.read_csv")
+    cached = get_metadata("baseline")
+    read_csv.assert_not_called()
+    pd.testing.assert_frame_equal(cached, metadata)
+
+    filtered = filter_metadata(cached, "single-family-detached", "G0600010", "Alameda County", "baseline")
+    assert filtered["bldg_id"].tolist() == [101]
+
+def test_metadata_cache_is_invalidated_when_the_source_changes(mocker, sample_metadata, tmp_path):
+    metadata_path = str(tmp_path / "CA_metadata_and_annual_results.csv")
+    sample_metadata.to_csv(metadata_path, index=False)
+    mocker.patch("step1_identify_suitable_buildings.get_metadata_path", return_value=metadata_path)
+    get_metadata("baseline")
+
+    # Touching the file keeps the cache, its content is unchanged
+    os.utime(metadata_path, ns=(0, 0))
+    assert load_cached_metadata(metadata_path) is not None
+
+    sample_metadata.iloc[:2].to_csv(metadata_path, index=False)
+    assert load_cached_metadata(metadata_path) is None
+    assert len(get_metadata("baseline")) == 2
+
+def test_process_housing_types_matches_filter_metadata_in_one_pass(mocker, tmp_path):
+    metadata = pd.DataFrame({
+        "bldg_id": [101, 102, 103, 104, 105, 106],
+        "upgrade": [0, 0, 0, 0, 1, 0],
+        "in.county": ["G0600010", "G0600010", "G0600010", "G0600130", "G0600130", "G0600130"],
+        "in.county_name": ["Alameda County", "Alameda County", "Alameda County", "Contra Costa County", "Contra Costa County", "Contra Costa County"],
+        "in.geometry_building_type_recs": ["Single-Family Detached", "Single-Family Attached", "Single-Family Detached", "Single-Family Detached", "Single-Family Detached", "Mobile Home"],
+        "in.vacancy_status": "Occupied",
+        "in.cooking_range": ["Gas", "Gas", "Electric Induction", "Gas", "Gas", "Gas"],
+        "in.heating_fuel": "Natural Gas",
+        "in.water_heater_fuel": "Natural Gas",
+        "in.tenure": "Owner",
+    })
+    mocker.patch("step1_identify_suitable_buildings.get_metadata", return_value=metadata)
+    housing_types = ["single-family-detached", "single-family-attached"]
+
+    output_csv_paths = process_housing_types("baseline", housing_types, output_base_dir=str(tmp_path))
+
+    for housing_type in housing_types:
+        assert len(output_csv_paths[housing_type]) == 2 # every county gets a file, even without matches
+        for output_csv in output_csv_paths[housing_type]:
+            county_slug = os.path.basename(os.path.dirname(output_csv))
+            county_code, county_name = {"alameda": ("G0600010", "Alameda County"), "contra-costa": ("G0600130", "Contra Costa County")}[county_slug]
+            expected = filter_metadata(metadata, housing_type, county_code, county_name, "baseline")["bldg_id"].tolist()
+            assert pd.read_csv(output_csv)["bldg_id"].tolist() == expected
+
+    building_counts = pd.read_csv(os.path.join(tmp_path, "baseline", "single-family-detached", BUILDING_COUNTS_FILE_NAME))
+    assert building_counts.set_index("county")["num_buildings"].to_dict() == {"alameda": 1, "contra-costa": 1}
@@ -7,11 +7,26 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 from step2_pull_buildings import (
+    check_for_downloads,
     download_parquet_file,
+    get_building_columns,
     process_county,
     process
 )
 
+@pytest.fixture(autouse=True)
+def building_cache(mocker, tmp_path):
+    """Keep the shared building cache inside the test's temporary directory."""
+    cache_dir = tmp_path / "building_cache"
+    mocker.patch.dict("building_cache_helpers.BUILDING_CACHE", {"dir": str(cache_dir)})
+    return cache_dir
+
+@pytest.fixture(autouse=True)
+def no_backoff(mocker):
+    """Retry failed downloads without waiting."""
+    mocker.patch("download_helpers.BACKOFF_SECONDS", 0)
+    mocker.patch("download_helpers.time.sleep")
+
 @pytest.fixture
 def mock_s3_client(mocker):
     """Mock the S3 client at step2_pull_buildings.s3."""
@@ -125,4 +140,100 @@ def test_process_all_scenarios_no_download(mocker, tmp_path):
     mock_process_county.assert_not_called()
 
     # Process returns a key-value pair with success and failure summaries as soon as it sees download_new_files=False
-    assert result == {'failure_summary': [], 'success_summary': ['No new building files needed to be downloaded.']}
\ No newline at end of file
+    assert result == {'failure_summary': [], 'success_summary': ['No new building files needed to be downloaded.']}
+
+
+def test_process_county_downloads_from_s3_and_resumes(mocker, tmp_path, monkeypatch):
+    """Downloads every building from a local S3 stand-in, then only replaces the truncated one."""
+    mocker.patch("step2_pull_buildings.PROJECT_COLUMNS", False)
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        for bldg_id in [101, 102, 103]:
+            client.put_object(Bucket="test-bucket", Key=f"test-prefix/{bldg_id}-0.parquet", Body=b"x" * bldg_id)
+        mocker.patch("step2_pull_buildings.s3", client)
+
+        county_path = tmp_path / "baseline" / "single-family-detached" / "alameda"
+        county_path.mkdir(parents=True)
+        pd.DataFrame({"bldg_id": [101, 102, 103]}).to_csv(county_path / "step1_filtered_building_ids.csv", index=False)
+
+        result = process_county("baseline", "single-family-detached", str(county_path), "test-bucket", "test-prefix/", str(tmp_path))
+        assert result["status"] == "success"
+        assert result["retrieved_buildings"] == 3
+
+        buildings_directory = county_path / "buildings"
+        with open(buildings_directory / "102-0.parquet", "r+b") as file:
+            file.truncate(1)
+
+        get_object = mocker.spy(client, "get_object")
+        result = process_county("baseline", "single-family-detached", str(county_path), "test-bucket", "test-prefix/", str(tmp_path))
+
+        assert result["retrieved_buildings"] == 3
+        assert get_object.call_count == 1
+        assert (buildings_directory / "102-0.parquet").stat().st_size == 102
+
+def test_process_county_fetches_only_the_pipeline_columns(mocker, tmp_path, monkeypatch):
+    """Projected fetches keep the timestamp and end use columns steps 3 and 4 read, and nothing else."""
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+
+    columns = get_building_columns()
+    timeseries = pd.DataFrame({column: [1.0, 2.0] for column in columns[1:]})
+    timeseries.insert(0, "timestamp", pd.date_range("2018-01-01", periods=2, freq="15min"))
+    for unused in range(100):
+        timeseries[f"out.unused_{unused}.energy_consumption"] = range(2)
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        client.put_object(Bucket="test-bucket", Key="test-prefix/101-0.parquet", Body=timeseries.to_parquet())
+        mocker.patch("step2_pull_buildings.s3", client)
+
+        county_path = tmp_path / "baseline" / "single-family-detached" / "alameda"
+        county_path.mkdir(parents=True)
+        pd.DataFrame({"bldg_id": [101]}).to_csv(county_path / "step1_filtered_building_ids.csv", index=False)
+
+        result = process_county("baseline", "single-family-detached", str(county_path), "test-bucket", "test-prefix/", str(tmp_path))
+
+    assert result["status"] == "success"
+    building = pd.read_parquet(county_path / "buildings" / "101-0.parquet")
+    assert list(building.columns) == columns
+    pd.testing.assert_frame_equal(building, timeseries[columns])
+    assert check_for_downloads(str(county_path / "buildings"), [101])
+
+def test_process_county_links_buildings_from_the_shared_cache(mocker, tmp_path, monkeypatch, building_cache):
+    """A second output root only links to the buildings the first one downloaded."""
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    mocker.patch("step2_pull_buildings.PROJECT_COLUMNS", False)
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        for bldg_id in [101, 102]:
+            client.put_object(Bucket="test-bucket", Key=f"release/upgrade=0/{bldg_id}-0.parquet", Body=b"x" * bldg_id)
+        mocker.patch("step2_pull_buildings.s3", client)
+        get_object = mocker.spy(client, "get_object")
+
+        for output_root in ["first", "second"]:
+            county_path = tmp_path / output_root / "baseline" / "single-family-detached" / "alameda"
+            county_path.mkdir(parents=True)
+            pd.DataFrame({"bldg_id": [101, 102]}).to_csv(county_path / "step1_filtered_building_ids.csv", index=False)
+
+            result = process_county("baseline", "single-family-detached", str(county_path), "test-bucket", "release/upgrade=0/", str(tmp_path / output_root))
+            assert result["retrieved_buildings"] == 2
+
+    assert get_object.call_count == 2
+    cached_file = building_cache / "test-bucket" / "release" / "upgrade=0" / "101-0.parquet"
+    for output_root in ["first", "second"]:
+        linked_file = tmp_path / output_root / "baseline" / "single-family-detached" / "alameda" / "buildings" / "101-0.parquet"
+        assert os.path.realpath(linked_file) == os.path.realpath(cached_file)
@@ -204,4 +204,59 @@ def test_process_county_data_all_invalid_files(
 
     assert status == "empty_data"
     assert num_files == 0
-    mock_to_csv.assert_not_called()
\ No newline at end of file
+    mock_to_csv.assert_not_called()
+def test_compute_typical_profile_matches_concatenated_mean(tmp_path):
+    """The streaming accumulator should reproduce the mean of all buildings side by side."""
+    import numpy as np
+    from step3_build_electricity_load_profiles import compute_typical_profile, iter_building_profiles
+
+    end_uses = END_USE_COLUMNS["appliances"][:3]
+    timestamps = pd.date_range("2018-01-01", periods=96, freq="15min")
+    rng = np.random.default_rng(0)
+    for building in range(5):
+        df = pd.DataFrame({column: rng.random(len(timestamps)) for column in end_uses})
+        df.iloc[building, 0] = np.nan # Missing values are skipped, as in mean()
+        df.insert(0, "timestamp", timestamps)
+        df.to_parquet(tmp_path / f"{building}-0.parquet")
+
+    profiles = list(iter_building_profiles(str(tmp_path), end_uses))
+    expected = pd.concat(profiles, axis=1, keys=range(len(profiles))).T.groupby(level=1).mean().T
+
+    typical, num_buildings = compute_typical_profile(iter_building_profiles(str(tmp_path), end_uses))
+
+    assert num_buildings == 5
+    pd.testing.assert_frame_equal(typical, expected, check_names=False, check_freq=False)
+
+def test_process_county_buildings_matches_separate_steps(tmp_path, mocker):
+    """One read per building should produce the same typical electricity profile and gas totals as steps 3 and 4 run separately."""
+    import numpy as np
+    import step4_build_gas_load_profiles as BuildGasLoadProfiles
+    from step3_build_electricity_load_profiles import compute_typical_profile, iter_building_profiles, process_county_buildings
+
+    electricity_end_uses = END_USE_COLUMNS["appliances"][:2]
+    gas_end_uses = [col for category in ["heating", "hot_water", "cooking"] for col in BuildGasLoadProfiles.END_USE_COLUMNS[category]]
+    input_dir = tmp_path / "buildings"
+    input_dir.mkdir()
+
+    timestamps = pd.date_range("2018-01-01", periods=96, freq="15min")
+    rng = np.random.default_rng(1)
+    for building in range(3):
+        df = pd.DataFrame({column: rng.random(len(timestamps)) for column in electricity_end_uses + gas_end_uses + ["unused"]})
+        df.insert(0, "timestamp", timestamps)
+        df.to_parquet(input_dir / f"{building}-0.parquet")
+
+    mock_save_typical_profile = mocker.patch("step3_build_electricity_load_profiles.save_typical_profile")
+    gas_output_path = tmp_path / "gas_loads_alameda-county.csv"
+
+    status, num_electricity_files, num_gas_files = process_county_buildings(
+        "alameda-county", str(input_dir), str(tmp_path / "electricity.csv"), str(gas_output_path), electricity_end_uses, gas_end_uses
+    )
+
+    assert (status, num_electricity_files, num_gas_files) == ("processed", 3, 3)
+
+    expected_typical, _ = compute_typical_profile(iter_building_profiles(str(input_dir), electricity_end_uses))
+    pd.testing.assert_frame_equal(mock_save_typical_profile.call_args[0][1], expected_typical, check_names=False, check_freq=False)
+
+    expected_gas, building_count = BuildGasLoadProfiles.sum_county_gas_profiles(str(input_dir), gas_end_uses)
+    expected_gas = BuildGasLoadProfiles.average_county_gas_profiles(expected_gas, building_count, gas_end_uses)
+    pd.testing.assert_frame_equal(pd.read_csv(gas_output_path, index_col=0), pd.read_csv(pd.io.common.StringIO(expected_gas.to_csv()), index_col=0))
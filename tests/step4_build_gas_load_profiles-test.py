@@ -41,7 +41,7 @@ def sample_dataframe():
     to test building-level gas usage calculations.
     """
     return pd.DataFrame({
-        "timestamp": pd.date_range("2022-01-01", periods=3, freq="H"),
+        "timestamp": pd.date_range("2022-01-01", periods=3, freq="h"),
         "out.natural_gas.heating.energy_consumption": [1.0, 2.0, 3.0],
         "out.natural_gas.hot_water.energy_consumption": [0.5, 0.6, 0.7],
         "out.natural_gas.range_oven.energy_consumption": [0.1, 0.2, 0.3],
@@ -62,11 +62,26 @@ def test_process_building_data_ok(sample_dataframe):
         "out.natural_gas.heating.energy_consumption",
         "out.natural_gas.hot_water.energy_consumption"
     ]
-    grouped = process_building_data(sample_dataframe, end_uses)
-    assert len(grouped) == 3
-    assert "load.gas.total.kwh" in grouped.columns
+    timestamps, values = process_building_data(sample_dataframe, end_uses)
+    assert len(timestamps) == 3
+    assert values.shape == (3, len(end_uses) + 1)
     # first row sum
-    assert grouped.loc[0, "load.gas.total.kwh"] == 1.0 + 0.5
+    assert values[0, -1] == 1.0 + 0.5
+
+
+def test_process_building_data_sums_duplicate_timestamps(sample_dataframe):
+    """
+    Rows sharing a timestamp are summed into one timestep, and missing values count as zero.
+    """
+    end_uses = ["out.natural_gas.heating.energy_consumption"]
+    data = sample_dataframe.copy()
+    data.loc[1, "timestamp"] = data.loc[0, "timestamp"]
+    data.loc[2, end_uses[0]] = float("nan")
+
+    timestamps, values = process_building_data(data, end_uses)
+
+    assert len(timestamps) == 2
+    assert values.tolist() == [[3.0, 3.0], [0.0, 0.0]]
 
 
 def test_process_building_data_missing_columns(sample_dataframe):
@@ -96,13 +111,13 @@ def test_update_county_totals_initialize(sample_dataframe):
         "out.natural_gas.heating.energy_consumption",
         "out.natural_gas.hot_water.energy_consumption"
     ]
-    building_df = process_building_data(sample_dataframe, end_uses)
-    county_totals = update_county_totals(None, building_df, 1, end_uses)
+    building_gas_totals = process_building_data(sample_dataframe, end_uses)
+    county_totals = update_county_totals(None, building_gas_totals)
 
-    for col in end_uses:
-        assert f"{col}.gas.total.kwh" in county_totals.columns
-    assert "load.gas.total.therms" in county_totals.columns
-    assert county_totals["building_count"].iloc[0] == 1
+    assert county_totals["timestamps"].equals(building_gas_totals[0])
+    assert county_totals["totals"].tolist() == building_gas_totals[1].tolist()
+    # The county owns its totals, adding buildings never changes the first building's values
+    assert county_totals["totals"] is not building_gas_totals[1]
 
 
 def test_update_county_totals_aggregate(sample_dataframe):
@@ -114,16 +129,15 @@ def test_update_county_totals_aggregate(sample_dataframe):
         "out.natural_gas.heating.energy_consumption",
         "out.natural_gas.hot_water.energy_consumption"
     ]
-    building1 = process_building_data(sample_dataframe.iloc[:2], end_uses)
-    county_totals = update_county_totals(None, building1, 1, end_uses)
+    building1 = process_building_data(sample_dataframe, end_uses)
+    county_totals = update_county_totals(None, building1)
 
-    building2 = process_building_data(sample_dataframe, end_uses)
-    county_totals = update_county_totals(county_totals, building2, 2, end_uses)
+    # The second building is missing the last timestep, which is aligned by timestamp and counted as zero
+    building2 = process_building_data(sample_dataframe.iloc[:2], end_uses)
+    county_totals = update_county_totals(county_totals, building2)
 
-    assert county_totals["building_count"].iloc[0] == 2
-    total_kwh_county = county_totals["load.gas.total.kwh"].sum()
-    total_kwh_b2 = building2["load.gas.total.kwh"].sum()
-    assert total_kwh_county > total_kwh_b2
+    assert len(county_totals["timestamps"]) == 3
+    assert county_totals["totals"][:, -1].tolist() == pytest.approx([3.0, 5.2, 3.7])
 
 
 # ------------------------------------------------------------------------------
@@ -153,7 +167,7 @@ def test_sum_county_gas_profiles_reads_files(mocker, sample_dataframe):
     assert mock_read.call_count == 2
     assert building_count == 2
     assert county_totals is not None
-    assert "load.gas.total.kwh" in county_totals.columns
+    assert county_totals["totals"][:, -1].tolist() == pytest.approx((2 * sample_dataframe[end_uses].sum(axis=1)).tolist())
 
 
 # ------------------------------------------------------------------------------
@@ -166,12 +180,21 @@ def test_average_county_gas_profiles(sample_dataframe):
     dividing by building_count.
     """
     end_uses = list(sample_dataframe.columns.drop("timestamp"))
-    building_df = process_building_data(sample_dataframe, end_uses)
-    # rename
-    county_df = building_df.rename(columns={col: f"{col}.gas.total.kwh" for col in end_uses})
+    county_totals = update_county_totals(None, process_building_data(sample_dataframe, end_uses))
+    county_totals = update_county_totals(county_totals, process_building_data(sample_dataframe, end_uses))
 
-    updated = average_county_gas_profiles(county_df, 2, end_uses)
-    assert "load.gas.avg.kwh" in updated.columns
+    updated = average_county_gas_profiles(county_totals, 2, end_uses)
+
+    # Same column order as the saved gas load profiles have always had
+    assert list(updated.columns) == (
+        ["timestamp"]
+        + [f"{col}.gas.total.kwh" for col in end_uses]
+        + ["load.gas.total.kwh", "load.gas.total.therms", "building_count", "load.gas.building_avg.kwh", "load.gas.building_avg.therms"]
+        + [f"{col}.gas.building_avg.{unit}" for col in end_uses for unit in ["kwh", "therms"]]
+    )
+    assert updated["building_count"].tolist() == [2, 2, 2]
+    assert updated["load.gas.building_avg.kwh"].tolist() == pytest.approx(sample_dataframe[end_uses].sum(axis=1).tolist())
+    assert updated["load.gas.total.therms"].tolist() == pytest.approx((updated["load.gas.total.kwh"] * KWH_TO_THERMS).tolist())
 
 
 # ------------------------------------------------------------------------------
@@ -1,5 +1,6 @@
 import os
 import pytest
+import numpy as np
 import pandas as pd
 from unittest.mock import patch, MagicMock
 
@@ -14,8 +15,17 @@ from step8_run_sam_model_for_solar_storage import (
     run_models_and_extract_outputs,
     # configure_rate_plan,
     validate_and_save_results,
+    load_sam_configuration,
+    run_counties,
     process
 )
+import step8_run_sam_model_for_solar_storage as step8
+from electricity_rate_helpers import RATE_PLAN_ELIGIBILITY
+
+@pytest.fixture(autouse=True)
+def cache_dirs(mocker, tmp_path):
+    mocker.patch.dict("pv_profile_helpers.PV_PROFILE_CACHE", {"dir": str(tmp_path / "cache" / "pv_profiles")})
+    mocker.patch.dict("sam_result_cache_helpers.SAM_RESULT_CACHE", {"dir": str(tmp_path / "cache" / "sam_results")})
 
 @pytest.fixture
 def mock_data_dir(tmp_path):
@@ -125,4 +135,175 @@ def test_process(
     (tmp_path / "in/scen/htype/cnty").mkdir(parents=True)
     process(base_input_dir, base_output_dir, ["scen"], ["htype"], ["cnty"], 1)
     assert s.execute.called
-    assert b.execute.called
\ No newline at end of file
+    assert b.execute.called
+
+def test_load_sam_configuration_reads_template_once(tmp_path, monkeypatch):
+    (tmp_path / "template.json").write_text('{"number_inputs": 2, "system_capacity": 5}')
+    monkeypatch.setattr(step8, "SAM_CONFIGURATION_DIR", str(tmp_path) + "/")
+    monkeypatch.setattr(step8, "sam_configurations", {})
+
+    assert load_sam_configuration("template") == {"system_capacity": 5}
+    (tmp_path / "template.json").unlink()
+    assert load_sam_configuration("template") == {"system_capacity": 5}
+
+def test_process_keeps_running_after_a_county_fails(tmp_path, monkeypatch):
+    for county in ["alameda", "kern", "marin"]:
+        (tmp_path / "scen" / "htype" / county).mkdir(parents=True)
+        (tmp_path / "scen" / "htype" / county / f"weather_TMY_{county}.csv").write_text("")
+        (tmp_path / "scen" / "htype" / county / f"combined_profiles_scen_{county}.csv").write_text("")
+
+    def prepare(weather_file, load_file, years_of_analysis, load_profile=None):
+        if "kern" in weather_file:
+            raise ValueError("bad weather file")
+        return {}, [1.0], 2.0
+
+    monkeypatch.setattr(step8, "prepare_data_and_compute_system_capacity", prepare)
+    monkeypatch.setattr(step8, "create_solar_model", MagicMock())
+    monkeypatch.setattr(step8, "create_battery_model", MagicMock())
+    monkeypatch.setattr(step8, "sam_configurations", {step8.BATTERY_CONFIGURATION_FILE_NAME: {"batt_simple_kwh": 13.5, "batt_simple_kw": 5.0}})
+    monkeypatch.setitem(step8.PV_PROFILE_CACHE, "enabled", False)
+    monkeypatch.setitem(step8.SAM_RESULT_CACHE, "enabled", False)
+    monkeypatch.setattr(step8, "SIZING_STRATEGY", "heuristic")
+    monkeypatch.setattr(step8, "run_models_and_extract_outputs", lambda solar, battery, load_profile, run_solar=True: [None] * 12 + [2.0, 13.5])
+    monkeypatch.setattr(step8, "validate_and_save_results", MagicMock())
+
+    capacities = process(str(tmp_path), str(tmp_path), "scen", "htype", ["Alameda", "Kern", "Marin"], workers=1)
+
+    assert list(capacities) == ["alameda", "marin"]
+    assert capacities["marin"] == {"Solar Capacity (kW)": "2.00", "Battery Capacity (kWh)": "13.50", "Battery Count": 1}
+    saved = pd.read_csv(tmp_path / "scen" / "htype" / "CAPITAL_COSTS" / "electrified_assets.csv")
+    assert list(saved["County"]) == ["alameda", "marin"]
+
+def test_run_counties_in_worker_processes(tmp_path):
+    (tmp_path / "scen" / "htype").mkdir(parents=True)
+
+    results = run_counties(str(tmp_path), str(tmp_path), "scen", "htype", ["alameda", "kern"], 1, workers=2)
+
+    # No weather files: both counties are skipped, in their own worker processes
+    assert sorted(results) == [("alameda", None, None), ("kern", None, None)]
+
+def test_run_dispatch_surrogate_for_one_and_many_sizes(monkeypatch):
+    monkeypatch.setattr(step8, "sam_configurations", {step8.BATTERY_CONFIGURATION_FILE_NAME: {"batt_simple_kwh": 10.0, "batt_simple_kw": 5.0}})
+    hours = pd.Series(range(8760)) % 24
+    pv_profile = {"ac": (800 * (hours.between(9, 15))).to_numpy(dtype=float)}
+    load_profile = [1.0] * 8760
+
+    outputs = step8.run_dispatch_surrogate(pv_profile, 4.0, load_profile)
+    swept = step8.run_dispatch_surrogate(pv_profile, [2.0, 4.0], load_profile)
+
+    system_to_load, batt_to_load, grid_to_load = outputs[:3]
+    assert max(abs(d) for d in outputs[5]) < 1e-9 # supply always meets the load
+    assert system_to_load[12] == 1.0 and batt_to_load[20] > 0 and grid_to_load[20] < 1.0
+    assert outputs[-2:] == (4.0, 10.0)
+    assert swept[1][2] == grid_to_load
+
+def test_sweep_system_capacities_with_several_batteries(monkeypatch):
+    monkeypatch.setattr(step8, "sam_configurations", {step8.BATTERY_CONFIGURATION_FILE_NAME: {"batt_simple_kwh": 10.0, "batt_simple_kw": 5.0}})
+    monkeypatch.setattr(step8, "DISPATCH_ENGINE", "numpy")
+    hours = pd.Series(range(8760)) % 24
+    pv_profile = {"ac": (800 * (hours.between(9, 15))).to_numpy(dtype=float)}
+    monkeypatch.setattr(step8, "prepare_data_and_compute_system_capacity", lambda *args: (None, [1.0] * 8760, None))
+    monkeypatch.setattr(step8, "get_pv_profile", lambda *args: pv_profile)
+
+    swept = step8.sweep_system_capacities("weather.csv", "load.csv", [2.0, 4.0], battery_count=2)
+
+    assert swept[4.0][-2:] == (4.0, 20.0)
+
+def test_get_battery_count_in_template_batteries(monkeypatch):
+    monkeypatch.setattr(step8, "sam_configurations", {step8.BATTERY_CONFIGURATION_FILE_NAME: {"batt_simple_kwh": 10.0, "batt_simple_kw": 5.0}})
+
+    assert [step8.get_battery_count(capacity) for capacity in (0.0, 10.0, 30.2)] == [1, 1, 3]
+
+def test_get_sam_outputs_skips_sam_for_unchanged_inputs(tmp_path, monkeypatch):
+    weather_file = tmp_path / "weather_TMY_alameda.csv"
+    weather_file.write_text("gh\n100\n")
+    load_file = tmp_path / "combined_profiles_scen_alameda.csv"
+    pd.DataFrame({step8.TOTAL_LOAD_COLUMN_NAME: [1.0, 2.0]}).to_csv(load_file, index=False)
+    monkeypatch.setattr(step8, "sam_configurations", {step8.SOLAR_CONFIGURATION_FILE_NAME: {"dc_ac_ratio": 1.1}, step8.BATTERY_CONFIGURATION_FILE_NAME: {}})
+
+    outputs = tuple([[0.5, 1.0]] * 12) + (3.0, 13.5)
+    run_sam = MagicMock(return_value=([1.0, 2.0], outputs))
+    monkeypatch.setattr(step8, "run_sam", run_sam)
+
+    assert step8.get_sam_outputs(str(weather_file), str(load_file), 1, "alameda") == ([1.0, 2.0], outputs)
+    assert step8.get_sam_outputs(str(weather_file), str(load_file), 1, "alameda") == ([1.0, 2.0], outputs)
+    assert run_sam.call_count == 1
+
+    # A changed load is simulated again
+    pd.DataFrame({step8.TOTAL_LOAD_COLUMN_NAME: [1.0, 3.0]}).to_csv(load_file, index=False)
+    step8.get_sam_outputs(str(weather_file), str(load_file), 1, "alameda")
+    assert run_sam.call_count == 2
+    assert run_sam.call_args.args[4] == [1.0, 3.0] # the load profile already read, not read again
+    assert step8.get_cache_statistics()["hits"] == 1
+    assert step8.get_cache_statistics()["misses"] == 2
+
+    # So is the same system with scaled PV profiles turned off
+    monkeypatch.setitem(step8.PV_PROFILE_CACHE, "enabled", not step8.PV_PROFILE_CACHE["enabled"])
+    step8.get_sam_outputs(str(weather_file), str(load_file), 1, "alameda")
+    assert run_sam.call_count == 3
+
+    # And the same system sized against other export rates
+    monkeypatch.setattr(step8, "load_export_rates", lambda utility: np.full(8760, 0.05))
+    step8.get_sam_outputs(str(weather_file), str(load_file), 1, "alameda")
+    assert run_sam.call_count == 4
+
+@pytest.fixture
+def sizing_inputs(mocker, monkeypatch):
+    monkeypatch.setattr(step8, "sam_configurations", {step8.BATTERY_CONFIGURATION_FILE_NAME: {"batt_simple_kwh": 13.5, "batt_simple_kw": 5.0}})
+    hours = np.arange(8760) % 24
+    pv_profile = {"ac": 800 * np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None)}
+    mocker.patch.object(step8, "get_pv_profile", return_value=pv_profile)
+    mocker.patch("net_billing_helpers.load_export_rates", return_value=np.full(8760, 0.05))
+    mocker.patch.dict("sizing_helpers.SIZING", {"solar_kw": [0.5, 4.0, 8.0, 30.0], "battery_counts": [1, 3]})
+
+    return pv_profile, (1 + 0.5 * np.sin((hours - 12) / 24 * 2 * np.pi)).tolist()
+
+def test_optimize_system_size_searches_solar_and_batteries(mocker, monkeypatch, sizing_inputs):
+    _, load_profile = sizing_inputs
+    monkeypatch.setattr(step8, "DISPATCH_ENGINE", "numpy")
+
+    spy = mocker.spy(step8, "dispatch_self_consumption")
+    solar_kw, battery_count = step8.optimize_system_size("alameda", "weather_TMY_alameda.csv", {}, load_profile, 1)
+
+    assert spy.call_count == 1 # every candidate in one dispatch
+    assert spy.call_args.args[0].shape == (8, 8760)
+    assert (solar_kw, battery_count) in [(4.0, 1), (8.0, 1)] # neither a token system nor one exporting most of its output
+
+def test_optimize_system_size_screens_every_candidate_with_battwatts(mocker, monkeypatch, sizing_inputs):
+    pv_profile, load_profile = sizing_inputs
+    monkeypatch.setattr(step8, "DISPATCH_ENGINE", "numpy")
+    surrogate_best = step8.optimize_system_size("alameda", "weather_TMY_alameda.csv", {}, load_profile, 1)
+    monkeypatch.setattr(step8, "DISPATCH_ENGINE", "battwatts")
+
+    # Battwatts stand-in under which only the surrogate's oversized 30 kW, 3 battery system saves anything
+    def simulate(weather_file, solar_resource_data, system_capacity, load_profile, years_of_analysis, battery_count):
+        outputs = list(step8.run_dispatch_surrogate(pv_profile, system_capacity, load_profile, battery_count))
+        if (system_capacity, battery_count) != (30.0, 3):
+            outputs[2] = list(load_profile) # grid_to_load
+            outputs[9] = [0.0] * len(load_profile) # system_to_grid
+        return tuple(outputs)
+
+    simulate_solar_storage = mocker.patch.object(step8, "simulate_solar_storage", side_effect=simulate)
+    solar_kw, battery_count = step8.optimize_system_size("alameda", "weather_TMY_alameda.csv", {}, load_profile, 1)
+
+    assert surrogate_best != (30.0, 3)
+    assert simulate_solar_storage.call_count == 8
+    assert (solar_kw, battery_count) == (30.0, 3)
+
+def test_annual_savings_compare_the_best_eligible_rate_plans(sizing_inputs):
+    _, load_profile = sizing_inputs
+    flows = {name: np.zeros((1, 8760)) for name in ["grid_to_load", "system_to_grid"]}
+    flows["grid_to_load"][0] = load_profile
+
+    # The same load, billed on every plan: only the plans storage qualifies for can save anything
+    rate_plans = list(step8.RATE_PLANS["PG&E"])
+    bills = step8.bill_net_billing([load_profile], [np.zeros(8760)], "PG&E", rate_plans, step8.get_baseline_territory("alameda", "PG&E"))[0]
+    open_to_all = [bill for rate_plan, bill in zip(rate_plans, bills) if rate_plan not in RATE_PLAN_ELIGIBILITY]
+
+    savings = step8.get_annual_savings("alameda", "baseline", load_profile, flows)
+
+    assert savings[0] == pytest.approx(min(open_to_all) - min(bills))
+
+    # Like step 11, only grid to load is billed as imports
+    flows["grid_to_batt"] = np.ones((1, 8760))
+    assert step8.get_annual_savings("alameda", "baseline", load_profile, flows) == pytest.approx(savings)